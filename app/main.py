@@ -1,9 +1,14 @@
 # main.py (or keep as api.py if you prefer)
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.routes.chat_routes import router as chat_router
-import nest_asyncio
-import asyncio
-import aiomonitor
+from app.utils.qdrant_utils import init_document_indexer, close_document_indexer, get_sparse_embedding
+from app.utils.db_utils import init_session_store, close_session_store, init_chunk_manifest, close_chunk_manifest
+from app.services.ingestion_jobs import init_ingestion_jobs, close_ingestion_jobs
+from app.utils.langchain_utils import start_answer_cache_sync, stop_answer_cache_sync
+from app.utils.utils import shutdown_pdf_pool
+from app.utils.context_utils import count_tokens
+from app.services.logger import logger, RequestIdMiddleware
 import uvicorn
 from dotenv import load_dotenv
 
@@ -11,12 +16,43 @@ from dotenv import load_dotenv
 load_dotenv()  # This loads variables from .env into environment
 
 
-nest_asyncio.apply()
+def preload_models():
+    """
+    Load the models that are safe to share across forked workers: the BM25
+    sparse model and the tiktoken encoding hold no sockets, threads or event
+    loop state. Clients, connections and pools are opened per worker in the
+    lifespan below.
+    """
+    get_sparse_embedding()
+    count_tokens("warm up")
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the shared indexer once (embedding models, Qdrant client, vector stores)
+    logger.info("Warming up document indexer")
+    try:
+        await init_chunk_manifest()
+        await init_document_indexer()
+        await init_session_store()
+        await init_ingestion_jobs()
+        await start_answer_cache_sync()
+        yield
+    finally:
+        # Also runs when startup fails, so a worker that cannot boot does not hang on open connections
+        await stop_answer_cache_sync()
+        await close_ingestion_jobs()
+        shutdown_pdf_pool()
+        await close_session_store()
+        await close_document_indexer()
+        await close_chunk_manifest()
+
+
+app = FastAPI(lifespan=lifespan)
+# Tags every log record written while serving a request with its X-Request-ID
+app.add_middleware(RequestIdMiddleware)
 app.include_router(chat_router)
 
 if __name__ == "__main__":
-    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    with aiomonitor.start_monitor(loop=asyncio.get_event_loop()):
-        uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Single development worker; run.py is the production launcher
+    uvicorn.run(app, host="0.0.0.0", port=8000)
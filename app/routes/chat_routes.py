@@ -1,47 +1,117 @@
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from typing import Optional
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request
+from typing import List, Optional
 from datetime import datetime
 from uuid import uuid4
 
-from app.services.pydantic_models import ChatRequest, ChatResponse
+from app.services.pydantic_models import (
+    ChatBatchRequest, ChatBatchResponse, ChatBatchResult, ChatRequest, ChatResponse, IngestionJobStatus,
+)
+from app.services.ingestion_jobs import get_ingestion_jobs
 from app.services.logger import logger
+from app.services import metrics
+from app.utils.admission import AdmissionRejected, admission_user, admit_as
 from app.utils.db_utils import get_past_conversation_async, add_conversation_async
-from app.utils.langchain_utils import generate_chatbot_response, index_documents, generate_chatbot_response_stream
-from app.utils.utils import extract_text_from_file
-from fastapi.responses import StreamingResponse
+from app.utils.langchain_utils import (
+    CHAT_BATCH_MAX_SIZE,
+    generate_chatbot_response,
+    generate_chatbot_response_stream,
+    generate_chatbot_responses_batch,
+    index_document_stream,
+    index_uploads_bulk,
+    source_summaries,
+)
+from app.utils.streaming import NDJSON_MEDIA_TYPE, SSE_MEDIA_TYPE, coalesce_chunks, encode_event, wants_sse
+from app.utils.utils import SUPPORTED_FILE_TYPES
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from starlette.background import BackgroundTask
+import asyncio
 import json 
+import time
 
 router = APIRouter()
 
 @router.post("/upload-knowledge")
 async def upload_knwoledge(
     username: str = Form(...),
-    file: Optional[UploadFile] = File(None)
+    file: Optional[UploadFile] = File(None),
+    background: bool = Form(False)
 ):
     try:
-        extracted_text = ""
+        preview = ""
+        stats = None
         if file:
             logger.info(f"File uploaded: {file.filename}")
-            file_content = await file.read()
             file_extension = file.filename.split('.')[-1].lower()
-            extracted_text = await extract_text_from_file(file_content, file_extension)
-            logger.info(f"File content size: {len(file_content)} bytes")
-            logger.info(f"Extracted text from file: {extracted_text}")
+            logger.info(f"File content size: {file.size} bytes")
+            if file_extension not in SUPPORTED_FILE_TYPES:
+                raise HTTPException(status_code=400, detail="Unsupported file type")
+
+            if background:
+                # Hand the upload to the ingestion workers and return right away
+                job = await get_ingestion_jobs().submit(username, file.file, file.filename, file_extension)
+                return {'response': 'Indexing job queued', 'job_id': job.job_id, 'status': job.status}
 
             logger.info(f"Indexing documents in QdrantDB")
-            await index_documents(username, extracted_text, file.filename, file_extension)
+            # Stream from the spooled upload instead of reading it into memory
+            stats = await index_document_stream(username, file.file, file.filename, file_extension)
+            preview = stats.pop("preview", "")
 
-        return {'response': 'Indexed Documents Successfully', 'extracted_text': extracted_text}
+        return {'response': 'Indexed Documents Successfully', 'extracted_text': preview, 'stats': stats}
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error processing indexing request: {str(e)}")
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred while indexing documents: {e}")
 
+@router.post("/upload-knowledge/bulk")
+async def upload_knowledge_bulk(
+    username: str = Form(...),
+    files: List[UploadFile] = File(...),
+):
+    """
+    Index many documents in one request: any number of supported files and
+    zip/tar archives of them. Files are extracted in parallel and share the
+    embedding and upsert batches. The response lists every file with its
+    status (indexed, failed or skipped, e.g. for unsupported types) and the
+    overall throughput.
+    """
+    try:
+        logger.info(f"Bulk upload of {len(files)} files for {username}")
+        results, stats = await index_uploads_bulk(username, [(file.file, file.filename) for file in files])
+        stats["megabytes"] = round(sum(file.size or 0 for file in files) / (1024 * 1024), 3)
+        stats["megabytes_per_second"] = round(stats["megabytes"] / stats["seconds"], 3) if stats["seconds"] else 0.0
+        return {'response': 'Indexed Documents Successfully', 'files': results, 'stats': stats}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error processing bulk indexing request: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred while indexing documents: {e}")
+
+@router.get("/ingestion-jobs/{job_id}", response_model=IngestionJobStatus)
+async def get_ingestion_job(job_id: str):
+    job = await get_ingestion_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job: {job_id}")
+    return job
+
+@router.get("/ingestion-jobs", response_model=List[IngestionJobStatus])
+async def list_ingestion_jobs(username: Optional[str] = None):
+    return await get_ingestion_jobs().list(username)
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    # Counters and histograms of this worker process
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
+    # Stage calls of this request queue fairly under its user and fail with 429 past the deadline
+    admit_as(request.username)
     try:
         start_time = datetime.now()
         logger.info(f"Request started at {start_time}")
@@ -50,24 +120,28 @@ async def chat(request: ChatRequest):
         if request.session_id:
             logger.info(f"Fetching past messages")
             past_messages = await get_past_conversation_async(request.session_id)
-            logger.info(f"Fetched past messages: {past_messages}")
+            logger.info(f"Fetched {len(past_messages)} past messages")
         else:
             request.session_id = str(uuid4())
             past_messages = []
 
         logger.info(f"Generating chatbot response")
+        pipeline_stats = {}
         response, _, _, _, _, _, refined_query, extracted_documents = await generate_chatbot_response(
-            request.query, past_messages, request.no_of_chunks, request.username, request.mode, request.score_threshold)
+            request.query, past_messages, request.no_of_chunks, request.username, request.mode, request.score_threshold,
+            stats=pipeline_stats, search_options=request.search_options())
 
         logger.info(f"Adding conversation to chat history")
         await add_conversation_async(request.session_id, request.query, response)
 
         debug_info = {
-            "sources": [{"file_name": doc.metadata["file_name"], "context": doc.page_content} for doc in extracted_documents]
+            "sources": source_summaries(extracted_documents),
+            "pipeline": pipeline_stats,
         }
 
         end_time = datetime.now()
         logger.info(f"Request ended at {end_time}")
+        metrics.observe("chat_request_seconds", (end_time - start_time).total_seconds(), endpoint="chat")
 
         return {
             "username": request.username,
@@ -78,6 +152,8 @@ async def chat(request: ChatRequest):
             "debug_info": debug_info
         }
 
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -86,64 +162,160 @@ async def chat(request: ChatRequest):
 
 
 
-@router.post("/chat_stream")
-async def chat_stream(request: ChatRequest):
-    try:
-        # 1. Load or initialize session/history
+@router.post("/chat/batch", response_model=ChatBatchResponse)
+async def chat_batch(batch: ChatBatchRequest):
+    """
+    Answer many chat requests in one call, sharing the embedding call and the
+    Qdrant query between them. Results come back in request order, or with
+    "stream": true as NDJSON lines ({"event": "result", "index", ...}) in the
+    order they finish, followed by a "done" line. A failed request gets an
+    `error` instead of a `response`; the others are unaffected.
+    """
+    if not batch.requests:
+        raise HTTPException(status_code=400, detail="Empty batch")
+    if len(batch.requests) > CHAT_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch of {len(batch.requests)} requests exceeds {CHAT_BATCH_MAX_SIZE}")
+    start_time = time.perf_counter()
+    logger.info(f"Received batch of {len(batch.requests)} chat requests")
+
+    # Shared calls of the batch (the embedding call) queue under no user
+    admit_as(None)
+
+    async def history(request: ChatRequest):
+        admission_user.set(request.username)
         if request.session_id:
-            past_messages = await get_past_conversation_async(request.session_id)
-        else:
-            request.session_id = str(uuid4())
-            past_messages = []
+            return await get_past_conversation_async(request.session_id)
+        request.session_id = str(uuid4())
+        return []
+
+    try:
+        histories = await asyncio.gather(*(history(request) for request in batch.requests))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error loading chat histories for batch: {e}")
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
 
-        # 2. Start the LLM stream
-        response_stream, refined_query, extracted_documents = await generate_chatbot_response_stream(
-            request.query, past_messages, request.no_of_chunks, request.username, request.mode, request.score_threshold
-        )
+    async def results():
+        # The streamed response runs this in another task
+        admit_as(None)
+        answers = generate_chatbot_responses_batch([
+            {"query": request.query, "past_messages": past_messages, "no_of_chunks": request.no_of_chunks,
+             "username": request.username, "mode": request.mode, "score_threshold": request.score_threshold,
+             "search_options": request.search_options()}
+            for request, past_messages in zip(batch.requests, histories)
+        ])
+        try:
+            async for index, result, pipeline_stats in answers:
+                request = batch.requests[index]
+                if isinstance(result, Exception):
+                    logger.error(f"Error processing batch request {index}: {result}")
+                    if isinstance(result, HTTPException):
+                        detail = result.detail
+                    else:
+                        detail = str(result) if isinstance(result, ValueError) else "Internal server error"
+                    yield ChatBatchResult(index=index, error=detail)
+                    continue
+                response, _, _, _, _, _, refined_query, extracted_documents = result
+                try:
+                    await add_conversation_async(request.session_id, request.query, response)
+                except Exception as save_err:
+                    logger.error(f"Failed to save conversation: {save_err}")
+                yield ChatBatchResult(index=index, response=ChatResponse(
+                    username=request.username,
+                    query=request.query,
+                    refine_query=refined_query,
+                    response=response,
+                    session_id=request.session_id,
+                    debug_info={"sources": source_summaries(extracted_documents), "pipeline": pipeline_stats},
+                ))
+        finally:
+            await answers.aclose()
+            metrics.observe("chat_request_seconds", time.perf_counter() - start_time, endpoint="chat_batch")
 
+    if not batch.stream:
+        ordered = [result async for result in results()]
+        ordered.sort(key=lambda result: result.index)
+        return ChatBatchResponse(results=ordered)
+
+    async def event_generator():
+        async for result in results():
+            yield encode_event("result", {"event": "result", **result.model_dump(mode="json")})
+        yield encode_event("done", {"event": "done", "count": len(batch.requests)})
+
+    return StreamingResponse(event_generator(), media_type=NDJSON_MEDIA_TYPE, headers={"Cache-Control": "no-cache"})
+
+
+@router.post("/chat_stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    start_time = time.perf_counter()
+    # Events are NDJSON lines by default, or server-sent events for "Accept: text/event-stream"
+    sse = wants_sse(http_request.headers.get("accept"))
+    resumed = bool(request.session_id)
+    if not resumed:
+        request.session_id = str(uuid4())
+
+    # The response starts right away; refinement and retrieval run inside the stream
+    async def event_generator():
+        pipeline = None
+        response_stream = None
         collected_chunks: list[str] = []
+        admit_as(request.username)
+        try:
+            yield encode_event("session", {"session_id": request.session_id}, sse)
+            past_messages = await get_past_conversation_async(request.session_id) if resumed else []
+
+            # Progress events from the pipeline, relayed as they happen; None marks its end
+            events = asyncio.Queue()
+            pipeline_stats = {}
+
+            async def run_pipeline():
+                try:
+                    return await generate_chatbot_response_stream(
+                        request.query, past_messages, request.no_of_chunks, request.username, request.mode,
+                        request.score_threshold, stats=pipeline_stats, search_options=request.search_options(),
+                        on_event=lambda event, payload: events.put_nowait((event, payload)))
+                finally:
+                    events.put_nowait(None)
+
+            pipeline = asyncio.create_task(run_pipeline())
+            while (item := await events.get()) is not None:
+                yield encode_event(*item, sse)
+            response_stream, refined_query, extracted_documents = await pipeline
 
-        # 3. The NDJSON streaming generator with finally
-        async def ndjson_generator():
-            try:
-                # Send session_id first
-                yield json.dumps({"session_id": request.session_id}) + "\n"
-
-                # Stream chunks, collecting as we go
-                async for chunk in response_stream:
-                    collected_chunks.append(chunk)
-                    yield json.dumps({"chunk": chunk}) + "\n"
-
-                # Send final debug info
-                debug = [
-                    {"file_name": doc.metadata["file_name"], "context": doc.page_content}
-                    for doc in extracted_documents
-                ]
-                yield json.dumps({
-                    "refined_query": refined_query,
-                    "debug_info": {"sources": debug}
-                }) + "\n"
-
-            finally:
-                # This always runs—whether stream completed, error happened, or client disconnected
-                full_response = "".join(collected_chunks)
+            async for chunk in coalesce_chunks(response_stream):
+                collected_chunks.append(chunk)
+                yield encode_event("chunk", {"chunk": chunk}, sse)
+
+            yield encode_event("done", {
+                "event": "done",
+                "refined_query": refined_query,
+                "debug_info": {"sources": source_summaries(extracted_documents), "pipeline": pipeline_stats}
+            }, sse)
+        except Exception as e:
+            # Headers are already sent, so failures are reported in the stream
+            logger.error(f"Error processing chat_stream request: {e}")
+            if isinstance(e, AdmissionRejected):
+                # Too late for a 429 response; the client gets the status and Retry-After here instead
+                yield encode_event("error", {"event": "error", "detail": e.detail, "status": e.status_code,
+                                             "retry_after": e.retry_after}, sse)
+            else:
+                detail = str(e) if isinstance(e, ValueError) else "Internal server error"
+                yield encode_event("error", {"event": "error", "detail": detail}, sse)
+        finally:
+            # This always runs—whether stream completed, error happened, or client disconnected
+            if pipeline is not None and not pipeline.done():
+                pipeline.cancel()
+            metrics.observe("chat_request_seconds", time.perf_counter() - start_time, endpoint="chat_stream")
+            if response_stream is not None:
                 try:
-                    await add_conversation_async(
-                        request.session_id,
-                        request.query,
-                        full_response
-                    )
+                    await add_conversation_async(request.session_id, request.query, "".join(collected_chunks))
                 except Exception as save_err:
                     logger.error(f"Failed to save conversation: {save_err}")
 
-        # 4. Return the streaming response
-        return StreamingResponse(
-            ndjson_generator(),
-            media_type="application/x-ndjson"
-        )
-
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        logger.error(f"Error processing chat_stream request: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+    return StreamingResponse(
+        event_generator(),
+        media_type=SSE_MEDIA_TYPE if sse else NDJSON_MEDIA_TYPE,
+        # Keep proxies such as nginx from buffering the events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,191 @@
+import os
+import asyncio
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import BinaryIO, List, Optional
+from uuid import uuid4
+
+from app.services.logger import logger
+from app.services.pydantic_models import IngestionJobStatus
+from app.utils.db_utils import get_chunk_manifest
+
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 2))
+# Finished jobs kept for status queries before the oldest are forgotten
+INGESTION_JOB_RETENTION = int(os.getenv("INGESTION_JOB_RETENTION", 1000))
+INGESTION_SPOOL_DIR = os.getenv("INGESTION_SPOOL_DIR") or None
+# Seconds a shutdown waits for running jobs to finish before cancelling them (queued jobs are not started)
+INGESTION_DRAIN_TIMEOUT = float(os.getenv("INGESTION_DRAIN_TIMEOUT", 15))
+# Seconds between saves of a running job's progress for status queries served by other workers
+JOB_PROGRESS_SAVE_INTERVAL = 1.0
+
+
+class IngestionJobQueue:
+    """
+    Background ingestion: uploads are spooled to disk, queued, and indexed by
+    a pool of worker tasks that record progress, timings and failures.
+
+    Jobs run in the worker process that accepted the upload, but their status
+    is saved in the manifest database (db_utils.ChunkManifest), so any worker
+    can answer status queries.
+    """
+
+    def __init__(self, workers: int = INGESTION_WORKERS, retention: int = INGESTION_JOB_RETENTION):
+        self.workers = max(1, workers)
+        self.retention = retention
+        self.jobs: "OrderedDict[str, IngestionJobStatus]" = OrderedDict()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._busy: set = set()
+        self._draining = False
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Ingestion job queue started with {self.workers} workers")
+
+    async def stop(self, drain_timeout: float = INGESTION_DRAIN_TIMEOUT):
+        # Idle workers stop right away; busy ones finish their job first, within the drain timeout
+        self._draining = True
+        busy = [task for task in self._tasks if task in self._busy]
+        for task in self._tasks:
+            if task not in self._busy:
+                task.cancel()
+        if busy and drain_timeout > 0:
+            logger.info(f"Waiting up to {drain_timeout:.0f}s for {len(busy)} running ingestion jobs")
+            await asyncio.wait(busy, timeout=drain_timeout)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            job, path, _, _ = self._queue.get_nowait()
+            job.status = "failed"
+            job.error = "Server shut down before the job started"
+            os.unlink(path)
+            await self._save(job)
+        logger.info("Ingestion job queue stopped")
+
+    async def submit(self, username: str, file: BinaryIO, file_name: str, file_extension: str) -> IngestionJobStatus:
+        """Spool the upload to a temporary file and queue it; returns immediately."""
+        spool = tempfile.NamedTemporaryFile(
+            prefix="ingest_", suffix=f".{file_extension}", dir=INGESTION_SPOOL_DIR, delete=False)
+        try:
+            await asyncio.to_thread(self._spool, file, spool)
+        except Exception:
+            os.unlink(spool.name)
+            raise
+        job = IngestionJobStatus(
+            job_id=str(uuid4()),
+            username=username,
+            file_name=file_name,
+            created_at=datetime.now(),
+        )
+        self.jobs[job.job_id] = job
+        self._forget_old_jobs()
+        await self._save(job)
+        await self._queue.put((job, spool.name, file_extension, time.perf_counter()))
+        logger.info(f"Queued ingestion job {job.job_id} for {file_name}")
+        return job
+
+    @staticmethod
+    def _spool(file: BinaryIO, spool):
+        with spool:
+            file.seek(0)
+            shutil.copyfileobj(file, spool)
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in ("completed", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.retention)]:
+            del self.jobs[job_id]
+
+    async def _save(self, job: IngestionJobStatus):
+        try:
+            manifest = await get_chunk_manifest()
+            await manifest.save_job(job.job_id, job.username, job.status, job.created_at.isoformat(),
+                                    job.model_dump_json(), retention=self.retention)
+        except Exception as e:
+            # Status queries from other workers fall behind; the job itself goes on
+            logger.error(f"Failed to save ingestion job {job.job_id}: {e}")
+
+    async def _save_progress(self, job: IngestionJobStatus):
+        while True:
+            await asyncio.sleep(JOB_PROGRESS_SAVE_INTERVAL)
+            await self._save(job)
+
+    async def get(self, job_id: str) -> Optional[IngestionJobStatus]:
+        # Jobs of this worker are current; the others are as of their last save
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        saved = await (await get_chunk_manifest()).get_job(job_id)
+        return IngestionJobStatus.model_validate_json(saved) if saved else None
+
+    async def list(self, username: str = None) -> List[IngestionJobStatus]:
+        saved = await (await get_chunk_manifest()).list_jobs(username)
+        jobs = [IngestionJobStatus.model_validate_json(job) for job in saved]
+        return [self.jobs.get(job.job_id, job) for job in jobs]
+
+    async def _worker(self, worker_id: int):
+        # Imported here to keep the services layer free of import cycles with the utils layer
+        from app.utils.langchain_utils import index_document_stream
+
+        while not self._draining:
+            job, path, file_extension, queued_at = await self._queue.get()
+            self._busy.add(asyncio.current_task())
+            started = time.perf_counter()
+            job.status = "running"
+            job.started_at = datetime.now()
+            job.timings["queued_ms"] = (started - queued_at) * 1000
+            logger.info(f"Worker {worker_id} running ingestion job {job.job_id}")
+            await self._save(job)
+            progress = asyncio.create_task(self._save_progress(job))
+            try:
+                with open(path, "rb") as f:
+                    stats = await index_document_stream(
+                        job.username, f, job.file_name, file_extension, progress=job.progress)
+                stats.pop("preview", None)
+                job.stats = stats
+                job.status = "completed"
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "Cancelled during shutdown"
+                raise
+            except Exception as e:
+                logger.error(f"Ingestion job {job.job_id} failed: {e}")
+                job.status = "failed"
+                job.error = getattr(e, "detail", None) or str(e)
+            finally:
+                progress.cancel()
+                job.finished_at = datetime.now()
+                job.timings["run_ms"] = (time.perf_counter() - started) * 1000
+                os.unlink(path)
+                self._queue.task_done()
+                self._busy.discard(asyncio.current_task())
+                # Shielded so a shutdown cancelling this worker still records the outcome
+                await asyncio.shield(self._save(job))
+
+
+_job_queue: Optional[IngestionJobQueue] = None
+
+
+async def init_ingestion_jobs() -> IngestionJobQueue:
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = IngestionJobQueue()
+        await _job_queue.start()
+    return _job_queue
+
+
+def get_ingestion_jobs() -> IngestionJobQueue:
+    if _job_queue is None:
+        raise RuntimeError("Ingestion job queue is not running")
+    return _job_queue
+
+
+async def close_ingestion_jobs():
+    global _job_queue
+    if _job_queue is not None:
+        await _job_queue.stop()
+        _job_queue = None
@@ -1,6 +1,25 @@
-import os 
+import os
 from datetime import *
+import atexit
+import json
+import queue
+import random
 import logging
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from uuid import uuid4
+
+from app.services import metrics
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json": one JSON object per line; "text": the classic "time - name - level - message" lines
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Messages and string fields longer than this are cut before they are queued
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", 2000))
+# Share of DEBUG records kept (a record can pass extra={"sample_rate": ...} to override)
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 0.01))
+# Records waiting for the writer thread; further records are dropped and counted
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
 
 today_date = datetime.now().strftime('%Y-%m-%d')
 log_base_directory = 'logs'
@@ -10,13 +29,130 @@ os.makedirs(log_subdirectory, exist_ok=True)
 # Define the path to the log file inside the day-wise subdirectory
 log_file_path = os.path.join(log_subdirectory, 'app.log')
 
+# Id of the HTTP request being served, set by RequestIdMiddleware
+request_id_var: ContextVar[str] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def truncate(value: str, limit: int = None) -> str:
+    limit = LOG_MAX_FIELD_CHARS if limit is None else limit
+    if limit <= 0 or len(value) <= limit:
+        return value
+    return f"{value[:limit]}... [{len(value) - limit} more chars]"
+
+
+class ContextFilter(logging.Filter):
+    """Stamps the request id and samples DEBUG records, in the thread that logs."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        rate = getattr(record, "sample_rate", LOG_DEBUG_SAMPLE_RATE if record.levelno <= logging.DEBUG else 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class CappedQueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread. Only the cheap part happens in the
+    caller: the message is rendered and truncated, and tracebacks are turned
+    into text (they pin frames otherwise). A full queue drops the record
+    instead of blocking the event loop.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = truncate(record.getMessage())
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        for key, value in list(vars(record).items()):
+            if key not in _RECORD_ATTRIBUTES and isinstance(value, str):
+                setattr(record, key, truncate(value))
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.increment("log_records_dropped_total", level=record.levelname)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in entry and key != "sample_rate":
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _formatter() -> logging.Formatter:
+    if LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s')
+
+
+class RequestIdMiddleware:
+    """ASGI middleware giving each request an id (X-Request-ID, or a new one) for its log records."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        incoming = dict(scope["headers"]).get(b"x-request-id")
+        request_id = truncate(incoming.decode("latin-1"), 128) if incoming else uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
+
+
+# Files and the console are written by one background thread fed through a bounded queue
+_handlers = [logging.FileHandler(log_file_path), logging.StreamHandler()]
+for _handler in _handlers:
+    _handler.setFormatter(_formatter())
+_queue_handler = CappedQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+_queue_handler.addFilter(ContextFilter())
+_listener = QueueListener(_queue_handler.queue, *_handlers)
+_listener.start()
+
+
+def _restart_listener():
+    # Threads do not survive fork: a worker forked from a preloading master gets its own queue and writer
+    global _listener
+    _queue_handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+    _listener = QueueListener(_queue_handler.queue, *_handlers)
+    _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listener)
+# Flushes what is still queued when the process exits
+atexit.register(lambda: _listener.stop())
+
 logging.basicConfig(
-    level=logging.INFO,  # Set the default logging level (e.g., DEBUG, INFO, WARNING, ERROR, CRITICAL)
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',  # Log message format
-    handlers=[
-        logging.FileHandler(log_file_path),  # Output logs to the log file
-        logging.StreamHandler()  # Output logs to the console (optional)
-    ]
+    level=LOG_LEVEL,  # Set the default logging level (e.g., DEBUG, INFO, WARNING, ERROR, CRITICAL)
+    handlers=[_queue_handler],
 )
 
-logger= logging.getLogger('api_logger')
\ No newline at end of file
+logger= logging.getLogger('api_logger')
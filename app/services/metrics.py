@@ -0,0 +1,161 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+# Process-wide counters keyed by (name, sorted label pairs)
+_counters = defaultdict(float)
+_gauges = {}
+_histograms = {}
+_lock = threading.Lock()
+
+# Upper bounds of the default histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Upper bounds for throughput histograms such as LLM tokens per second
+RATE_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400, 1000)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # One slot per bucket plus +Inf; cumulated only when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted(labels.items()))
+
+
+def increment(name: str, value: float = 1, **labels):
+    """Add `value` to the counter `name` with the given labels."""
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def set_gauge(name: str, value: float, **labels):
+    """Set the gauge `name` with the given labels to its current `value`."""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels):
+    """Record `value` in the histogram `name`; `buckets` only applies when the series is first seen."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram(buckets)
+        histogram.counts[bisect_left(histogram.buckets, value)] += 1
+        histogram.sum += value
+        histogram.count += 1
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """Observe the seconds spent in the block (including when it raises) in the histogram `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def get_counter(name: str, **labels) -> float:
+    return _counters.get(_key(name, labels), 0)
+
+
+def get_gauge(name: str, **labels) -> Optional[float]:
+    return _gauges.get(_key(name, labels))
+
+
+def get_counters() -> dict:
+    """Snapshot of all counters as {name: {label string: value}}."""
+    snapshot = defaultdict(dict)
+    with _lock:
+        for (name, labels), value in _counters.items():
+            label_str = ",".join(f"{k}={v}" for k, v in labels)
+            snapshot[name][label_str] = value
+    return dict(snapshot)
+
+
+def get_histogram(name: str, **labels) -> Optional[dict]:
+    """{"count", "sum", "buckets": {upper bound: cumulative count}} of one series, or None."""
+    with _lock:
+        histogram = _histograms.get(_key(name, labels))
+        if histogram is None:
+            return None
+        counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+    cumulative, buckets = 0, {}
+    for bound, bucket_count in zip(histogram.buckets + (float("inf"),), counts):
+        cumulative += bucket_count
+        buckets[bound] = cumulative
+    return {"count": count, "sum": total, "buckets": buckets}
+
+
+def _sanitize(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+def _labels(labels, extra: str = "") -> str:
+    parts = [
+        f'{_sanitize(k)}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in labels
+    ]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _series_order(item):
+    (name, labels), _ = item
+    # Group series of one metric together; label values may be None
+    return name, [(k, str(v)) for k, v in labels]
+
+
+def render_prometheus() -> str:
+    """All counters, gauges and histograms in the Prometheus text exposition format (per process)."""
+    with _lock:
+        counters = sorted(_counters.items(), key=_series_order)
+        gauges = sorted(_gauges.items(), key=_series_order)
+        histograms = sorted(
+            ((key, (h.buckets, list(h.counts), h.sum, h.count)) for key, h in _histograms.items()), key=_series_order
+        )
+    lines, typed = [], set()
+    for (name, labels), value in counters:
+        name = _sanitize(name)
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    for (name, labels), value in gauges:
+        name = _sanitize(name)
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    for (name, labels), (buckets, counts, total, count) in histograms:
+        name = _sanitize(name)
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = 'le="' + _number(bound) + '"'
+            lines.append(f"{name}_bucket{_labels(labels, le)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+        lines.append(f"{name}_count{_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
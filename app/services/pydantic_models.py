@@ -17,7 +17,41 @@ class ChatRequest(BaseModel):
     no_of_chunks: Optional[int] = 3
     mode : Optional[str]="dense"
     score_threshold: Optional[float]=0.5
+    # "mmr" over-fetches fetch_k candidates and keeps a diverse no_of_chunks
+    search_type: Optional[str]="similarity"
+    fetch_k: Optional[int]=None
+    mmr_lambda: Optional[float]=None
 
+    @field_validator("username")
+    @classmethod
+    def validate_username(cls, value):
+        # Retrieval is filtered by username; an empty one must never reach it
+        if not value.strip():
+            raise ValueError("username must not be empty")
+        return value
+
+    @field_validator("search_type")
+    @classmethod
+    def validate_search_type(cls, value):
+        if value not in (None, "similarity", "mmr"):
+            raise ValueError("search_type must be 'similarity' or 'mmr'")
+        return value
+
+    @field_validator("mmr_lambda")
+    @classmethod
+    def validate_mmr_lambda(cls, value):
+        if value is not None and not 0.0 <= value <= 1.0:
+            raise ValueError("mmr_lambda must be between 0 and 1")
+        return value
+
+    def search_options(self) -> dict:
+        """Retrieval reranking options, omitting the ones left at their defaults."""
+        if self.search_type != "mmr":
+            return {}
+        options = {"search_type": "mmr", "fetch_k": self.fetch_k}
+        if self.mmr_lambda is not None:
+            options["mmr_lambda"] = self.mmr_lambda
+        return options
 
 
 class ChatResponse(BaseModel):
@@ -26,4 +60,34 @@ class ChatResponse(BaseModel):
     refine_query: str
     response: str
     session_id: str
-    debug_info: Optional[dict] = None
\ No newline at end of file
+    debug_info: Optional[dict] = None
+
+
+class ChatBatchRequest(BaseModel):
+    requests: List[ChatRequest]
+    # Stream one NDJSON result per request as it finishes instead of one ordered response
+    stream: bool = False
+
+
+class ChatBatchResult(BaseModel):
+    index: int
+    response: Optional[ChatResponse] = None
+    error: Optional[str] = None
+
+
+class ChatBatchResponse(BaseModel):
+    results: List[ChatBatchResult]
+
+
+class IngestionJobStatus(BaseModel):
+    job_id: str
+    username: str
+    file_name: str
+    status: str = "queued"  # queued | running | completed | failed
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    progress: dict = {}
+    timings: dict = {}
+    stats: Optional[dict] = None
+    error: Optional[str] = None
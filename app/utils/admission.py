@@ -0,0 +1,189 @@
+import os
+import math
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+from app.services import metrics
+from app.services.logger import logger
+
+# Calls allowed inside each stage at once per worker process (0 removes the limit);
+# the Qdrant stage is capped by QDRANT_MAX_INFLIGHT (app/utils/qdrant_utils.py)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 64))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 32))
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", 64))
+# Seconds a chat request may wait for a stage before it is rejected with 429
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 10))
+# Callers waiting per stage beyond which new ones are rejected at once (0: unbounded)
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 1000))
+
+STAGE_LIMITS = {
+    "llm": LLM_MAX_CONCURRENCY,
+    "embedding": EMBEDDING_MAX_CONCURRENCY,
+    "sqlite": DB_MAX_CONCURRENCY,
+}
+
+# Who is waiting (the fair-queueing key) and how long they may wait; set per request by the routes.
+# Without a timeout (background ingestion, history writes) callers wait as long as it takes.
+admission_user: ContextVar[Optional[str]] = ContextVar("admission_user", default=None)
+admission_timeout: ContextVar[Optional[float]] = ContextVar("admission_timeout", default=None)
+
+
+def admit_as(username: Optional[str], timeout: Optional[float] = ADMISSION_QUEUE_TIMEOUT):
+    """Queue the current request's stage calls under `username`, failing those that wait over `timeout` seconds."""
+    admission_user.set(username)
+    admission_timeout.set(timeout)
+
+
+class AdmissionRejected(HTTPException):
+    """A stage is saturated; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, stage: str, reason: str, retry_after: int):
+        super().__init__(
+            status_code=429,
+            detail=f"Server busy ({stage}); retry in {retry_after}s",
+            headers={"Retry-After": str(retry_after)},
+        )
+        self.stage = stage
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class StageLimiter:
+    """
+    Concurrency limit of one pipeline stage with fair queueing. Callers past
+    the limit wait in per-user FIFO queues, and freed slots go to the users
+    in turn (round robin), so one user with many requests in flight delays
+    the others by at most one call per turn. A caller that waits longer than
+    its timeout is rejected with AdmissionRejected (HTTP 429), as is every
+    caller once ADMISSION_MAX_QUEUE are waiting.
+
+    `async with limiter:` takes a slot for the current request (admission_user,
+    admission_timeout). Exposed as admission_active / admission_queue_depth
+    gauges, the admission_wait_seconds histogram and admission_rejected_total.
+    """
+
+    def __init__(self, stage: str, limit: int, max_queue: int = None):
+        self.stage = stage
+        self.limit = limit
+        self.max_queue = ADMISSION_MAX_QUEUE if max_queue is None else max_queue
+        self.active = 0
+        self.queued = 0
+        self._queues: "OrderedDict[Optional[str], Deque[asyncio.Future]]" = OrderedDict()
+        # Moving average of the seconds between two freed slots, for Retry-After
+        self._release_interval = 0.1
+        self._released_at = None
+
+    def _publish(self):
+        metrics.set_gauge("admission_active", self.active, stage=self.stage)
+        metrics.set_gauge("admission_queue_depth", self.queued, stage=self.stage)
+
+    def retry_after(self) -> int:
+        """Seconds until a new caller would likely get a slot."""
+        return max(1, math.ceil(self._release_interval * (self.queued + 1)))
+
+    def _reject(self, reason: str):
+        metrics.increment("admission_rejected_total", stage=self.stage, reason=reason)
+        retry_after = self.retry_after()
+        logger.warning(f"Admission rejected at {self.stage} ({reason}); {self.queued} queued, retry in {retry_after}s")
+        raise AdmissionRejected(self.stage, reason, retry_after)
+
+    async def acquire(self, user: Optional[str] = None, timeout: Optional[float] = None):
+        if self.limit <= 0:
+            return
+        if self.active < self.limit and not self.queued:
+            self.active += 1
+            self._publish()
+            metrics.observe("admission_wait_seconds", 0.0, stage=self.stage)
+            return
+        # Only callers with a deadline are turned away; background work just waits
+        if timeout is not None and self.max_queue and self.queued >= self.max_queue:
+            self._reject("queue_full")
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user, deque()).append(future)
+        self.queued += 1
+        self._publish()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the wait ended: pass it on
+                self.release()
+            else:
+                self._dequeue(user, future)
+            if isinstance(e, asyncio.TimeoutError):
+                metrics.observe("admission_wait_seconds", time.perf_counter() - started, stage=self.stage)
+                self._reject("timeout")
+            raise
+        metrics.observe("admission_wait_seconds", time.perf_counter() - started, stage=self.stage)
+
+    def _dequeue(self, user, future):
+        queue = self._queues.get(user)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self.queued -= 1
+            if not queue:
+                del self._queues[user]
+        self._publish()
+
+    def release(self):
+        if self.limit <= 0:
+            return
+        now = time.monotonic()
+        # Only intervals under load say how fast the queue moves
+        if self.queued and self._released_at is not None:
+            self._release_interval = 0.9 * self._release_interval + 0.1 * (now - self._released_at)
+        self._released_at = now
+        self.active -= 1
+        while self._queues:
+            # The user at the front gets this slot and moves to the back of the rotation
+            user, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            if not future.done():
+                future.set_result(None)
+                self.active += 1
+                break
+        self._publish()
+
+    async def __aenter__(self):
+        await self.acquire(admission_user.get(), admission_timeout.get())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    def unbounded(self) -> "_UnboundedSlot":
+        """`async with limiter.unbounded():` waits without a timeout, e.g. to save an answer already produced."""
+        return _UnboundedSlot(self)
+
+
+class _UnboundedSlot:
+    def __init__(self, limiter: StageLimiter):
+        self.limiter = limiter
+
+    async def __aenter__(self):
+        await self.limiter.acquire(admission_user.get(), None)
+
+    async def __aexit__(self, *exc_info):
+        self.limiter.release()
+
+
+_limiters: Dict[str, StageLimiter] = {}
+
+
+def get_limiter(stage: str) -> StageLimiter:
+    """Process-wide limiter of an application stage ("llm", "embedding" or "sqlite")."""
+    limiter = _limiters.get(stage)
+    if limiter is None:
+        limiter = _limiters[stage] = StageLimiter(stage, STAGE_LIMITS[stage])
+    return limiter
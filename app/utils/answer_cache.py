@@ -0,0 +1,183 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from itertools import count
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.services.logger import logger
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+# Minimum cosine similarity between refined-query embeddings for a cached answer to be reused
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 10000))
+# Seconds between checks for invalidations made by other worker processes (0 disables the check)
+ANSWER_CACHE_SYNC_INTERVAL = float(os.getenv("ANSWER_CACHE_SYNC_INTERVAL", 1))
+
+
+@dataclass
+class CachedAnswer:
+    username: str
+    refined_query: str
+    answer: str
+    context: str
+    documents: List[Any]
+    # Retrieval settings the answer was produced with; only identical settings match
+    settings: tuple
+    expires_at: float
+    entry_id: int = field(default=0, repr=False)
+    row: int = field(default=0, repr=False)
+
+
+@dataclass
+class AnswerLookup:
+    """Result of a lookup; on a miss, `store()` caches the answer produced for the same key."""
+    cache: "SemanticAnswerCache"
+    username: str
+    vector: np.ndarray
+    settings: tuple
+    generation: int
+    hit: Optional[CachedAnswer] = None
+    similarity: float = 0.0
+
+    def store(self, refined_query: str, answer: str, context: str, documents: List[Any]):
+        self.cache.store(self.username, self.vector, self.settings, refined_query, answer, context, documents,
+                         generation=self.generation)
+
+
+class _UserAnswers:
+    """One user's entries with their unit query vectors packed in a matrix for a single matmul lookup."""
+
+    def __init__(self, dim: int):
+        self.vectors = np.empty((16, dim), dtype=np.float32)
+        self.entries: List[CachedAnswer] = []
+
+    def add(self, entry: CachedAnswer, vector: np.ndarray):
+        if len(self.entries) == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.empty_like(self.vectors)])
+        entry.row = len(self.entries)
+        self.vectors[entry.row] = vector
+        self.entries.append(entry)
+
+    def remove(self, entry: CachedAnswer):
+        last = self.entries.pop()
+        if last is not entry:
+            # Move the last row into the freed slot
+            self.vectors[entry.row] = self.vectors[last.row]
+            last.row = entry.row
+            self.entries[entry.row] = last
+
+
+class SemanticAnswerCache:
+    """
+    Per-user cache of final answers keyed by the embedding of the refined
+    query: a new question reuses an answer when its embedding is within
+    `threshold` cosine similarity of a cached one asked with the same
+    retrieval settings. Entries expire after `ttl` seconds, the least
+    recently used are evicted beyond `max_items`, and `invalidate(username)`
+    drops a user's answers (e.g. after they index a new document).
+    """
+
+    def __init__(self, max_items: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL, threshold: float = ANSWER_CACHE_THRESHOLD):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.threshold = threshold
+        self._users: Dict[str, _UserAnswers] = {}
+        self._lru: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        # Bumped on invalidation so answers computed before it are not stored after it
+        self._generations: Dict[str, int] = {}
+        self._ids = count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._lru)
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, entry: CachedAnswer):
+        self._lru.pop(entry.entry_id, None)
+        user = self._users.get(entry.username)
+        if user is not None:
+            user.remove(entry)
+            if not user.entries:
+                del self._users[entry.username]
+
+    def generation(self, username: str) -> int:
+        return self._generations.get(username, 0)
+
+    def lookup(self, username: str, vector, settings: tuple) -> AnswerLookup:
+        vector = self._unit(vector)
+        with self._lock:
+            result = AnswerLookup(self, username, vector, settings, self.generation(username))
+            user = self._users.get(username)
+            if user is None or user.vectors.shape[1] != len(vector):
+                return result
+            scores = user.vectors[:len(user.entries)] @ vector
+            now = time.monotonic()
+            for row in np.argsort(-scores):
+                if scores[row] < self.threshold:
+                    break
+                entry = user.entries[row]
+                if entry.expires_at < now or entry.settings != settings:
+                    continue
+                self._lru.move_to_end(entry.entry_id)
+                result.hit, result.similarity = entry, float(scores[row])
+                return result
+            # Drop this user's expired entries while we are here
+            for entry in [e for e in user.entries if e.expires_at < now]:
+                self._remove(entry)
+        return result
+
+    def store(self, username: str, vector, settings: tuple, refined_query: str, answer: str,
+              context: str, documents: List[Any], generation: Optional[int] = None):
+        vector = self._unit(vector)
+        with self._lock:
+            if generation is not None and generation != self.generation(username):
+                return
+            user = self._users.get(username)
+            if user is not None and user.vectors.shape[1] != len(vector):
+                # The embedding model changed: the old vectors are not comparable
+                for old in user.entries:
+                    self._lru.pop(old.entry_id, None)
+                user = None
+            if user is None:
+                user = self._users[username] = _UserAnswers(len(vector))
+            entry = CachedAnswer(
+                username=username,
+                refined_query=refined_query,
+                answer=answer,
+                context=context,
+                documents=documents,
+                settings=settings,
+                expires_at=time.monotonic() + self.ttl,
+                entry_id=next(self._ids),
+            )
+            user.add(entry, vector)
+            self._lru[entry.entry_id] = entry
+            while len(self._lru) > self.max_items:
+                self._remove(next(iter(self._lru.values())))
+
+    def invalidate(self, username: str) -> int:
+        """Drop all of a user's cached answers; returns how many were removed."""
+        with self._lock:
+            self._generations[username] = self.generation(username) + 1
+            user = self._users.pop(username, None)
+            if user is None:
+                return 0
+            for entry in user.entries:
+                self._lru.pop(entry.entry_id, None)
+        logger.info(f"Invalidated {len(user.entries)} cached answers for {username}")
+        return len(user.entries)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._lru.clear()
@@ -0,0 +1,165 @@
+import os
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from app.services.logger import logger
+
+# Upper bound on retrieved-context tokens sent to the LLM (0 disables the cap)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+# Shortest suffix/prefix match treated as chunk overlap when offsets are unknown
+MIN_TEXT_OVERLAP = 20
+MAX_TEXT_OVERLAP = 1000
+# Chunks whose spans are at most this many characters apart count as adjacent
+ADJACENT_GAP = 2
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            # tiktoken downloads its BPE files on first use; fall back to an estimate offline
+            logger.warning(f"tiktoken unavailable, estimating tokens from characters: {e}")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+class _Segment:
+    """A run of one or more chunks from the same file, with overlaps removed."""
+
+    def __init__(self, doc: Document, rank: int):
+        self.file_name = doc.metadata.get("file_name")
+        self.start = doc.metadata.get("start_index")
+        self.end = self.start + len(doc.page_content) if self.start is not None else None
+        self.text = doc.page_content
+        self.score = doc.metadata.get("_score")
+        self.rank = rank
+        self.chunks = 1
+
+    def sort_key(self):
+        return (self.score if self.score is not None else float("-inf"), -self.rank)
+
+
+def _text_overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right`."""
+    limit = min(len(left), len(right), MAX_TEXT_OVERLAP)
+    for size in range(limit, MIN_TEXT_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _merge(left: _Segment, right: _Segment) -> bool:
+    """Append `right` to `left` when they overlap or touch; returns True if merged."""
+    if right.text in left.text:
+        pass
+    elif left.end is not None and right.start is not None:
+        if right.start > left.end + ADJACENT_GAP:
+            return False
+        overlap = left.end - right.start
+        if overlap >= 0:
+            left.text += right.text[overlap:]
+        else:
+            left.text += "\n" + right.text
+        left.end = max(left.end, right.end)
+    else:
+        overlap = _text_overlap(left.text, right.text)
+        if not overlap:
+            return False
+        left.text += right.text[overlap:]
+    if right.score is not None and (left.score is None or right.score > left.score):
+        left.score = right.score
+    left.rank = min(left.rank, right.rank)
+    left.chunks += right.chunks
+    return True
+
+
+def _merge_file_segments(segments: List[_Segment]) -> List[_Segment]:
+    if all(segment.start is not None for segment in segments):
+        segments = sorted(segments, key=lambda segment: segment.start)
+    # Repeat until stable: a grown segment may now reach one it did not touch before
+    changed = True
+    while changed:
+        changed = False
+        merged = []
+        for segment in segments:
+            for i, existing in enumerate(merged):
+                if _merge(existing, segment):
+                    break
+                # Without offsets the overlapping neighbour may come later in retrieval order
+                if segment.start is None and _merge(segment, existing):
+                    merged[i] = segment
+                    break
+            else:
+                merged.append(segment)
+                continue
+            changed = True
+        segments = merged
+    return segments
+
+
+def assemble_context(docs: List[Document], token_budget: Optional[int] = None):
+    """
+    Build the LLM context from retrieved chunks: remove the overlapping spans the
+    splitter introduced, merge adjacent chunks of the same file, and pack the
+    resulting segments by score into `token_budget` tokens.
+
+    Returns the context string and a report of the tokens saved.
+    """
+    if token_budget is None:
+        token_budget = CONTEXT_TOKEN_BUDGET
+
+    by_file = {}
+    for rank, doc in enumerate(docs):
+        segment = _Segment(doc, rank)
+        by_file.setdefault(segment.file_name, []).append(segment)
+    segments = [merged for group in by_file.values() for merged in _merge_file_segments(group)]
+    segments.sort(key=_Segment.sort_key, reverse=True)
+
+    selected, used_tokens, dropped = [], 0, 0
+    for segment in segments:
+        tokens = count_tokens(segment.text)
+        if token_budget and used_tokens + tokens > token_budget:
+            remaining = token_budget - used_tokens
+            if selected or remaining <= 0:
+                dropped += 1
+                continue
+            # The best segment alone exceeds the budget: keep its head
+            segment.text = truncate_to_tokens(segment.text, remaining)
+            tokens = count_tokens(segment.text)
+        selected.append(segment)
+        used_tokens += tokens
+
+    context = "\n\n".join(segment.text for segment in selected)
+    naive_tokens = count_tokens("\n\n".join(doc.page_content for doc in docs)) if docs else 0
+    context_tokens = count_tokens(context) if context else 0
+    report = {
+        "chunks": len(docs),
+        "segments": len(selected),
+        "dropped_segments": dropped,
+        "naive_tokens": naive_tokens,
+        "context_tokens": context_tokens,
+        "tokens_saved": naive_tokens - context_tokens,
+        "token_budget": token_budget,
+    }
+    return context, report
@@ -1,36 +1,479 @@
+import os
 import aiosqlite
 import asyncio
-from typing import List
+import itertools
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from app.services import metrics
 from app.services.logger import logger
+from app.utils.admission import get_limiter
 
-DB_FILE = "chat_log.db"
+DB_FILE = os.getenv("CHAT_DB_FILE", "chat_log.db")
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", 4))
+# Group commit: writes arriving within DB_WRITE_BATCH_DELAY seconds share one transaction
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", 64))
+DB_WRITE_BATCH_DELAY = float(os.getenv("DB_WRITE_BATCH_DELAY", 0.005))
 
+INSERT_TURN_SQL = '''
+    INSERT INTO chat_logs (session_id, user_query, gpt_response, turn, created_at)
+    VALUES (?, ?, ?, COALESCE((SELECT MAX(turn) FROM chat_logs WHERE session_id = ?), 0) + 1, ?)
+'''
 
-async def ensure_schema():
-    """Ensure the chat_logs table exists."""
-    async with aiosqlite.connect(DB_FILE) as connection:
-        await connection.execute('''
+
+class SessionStore:
+    """
+    Chat history store on persistent aiosqlite connections: one writer that
+    group-commits queued inserts and a small pool of readers (WAL mode lets
+    them read while the writer commits).
+    """
+
+    def __init__(
+        self,
+        db_file: str = DB_FILE,
+        read_pool_size: int = DB_READ_POOL_SIZE,
+        batch_size: int = DB_WRITE_BATCH_SIZE,
+        batch_delay: float = DB_WRITE_BATCH_DELAY,
+    ):
+        self.db_file = db_file
+        self.read_pool_size = max(1, read_pool_size)
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._readers: List[aiosqlite.Connection] = []
+        self._next_reader = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+
+    async def _connect(self) -> aiosqlite.Connection:
+        connection = await aiosqlite.connect(self.db_file)
+        await connection.execute("PRAGMA journal_mode=WAL")
+        await connection.execute("PRAGMA synchronous=NORMAL")
+        await connection.execute("PRAGMA busy_timeout=5000")
+        return connection
+
+    async def _ensure_schema(self):
+        """Create the chat_logs table and its index, migrating the old three-column layout."""
+        await self._writer.execute('''
             CREATE TABLE IF NOT EXISTS chat_logs (
                 session_id TEXT,
                 user_query TEXT,
-                gpt_response TEXT
+                gpt_response TEXT,
+                turn INTEGER,
+                created_at TEXT
             )
         ''')
-        await connection.commit()
+        async with self._writer.execute("PRAGMA table_info(chat_logs)") as cursor:
+            columns = {row[1] async for row in cursor}
+        if "turn" not in columns:
+            logger.info("Migrating chat_logs: adding turn column")
+            await self._writer.execute("ALTER TABLE chat_logs ADD COLUMN turn INTEGER")
+            # rowid preserves insertion order, which is all the old schema had
+            await self._writer.execute("UPDATE chat_logs SET turn = rowid")
+        if "created_at" not in columns:
+            logger.info("Migrating chat_logs: adding created_at column")
+            await self._writer.execute("ALTER TABLE chat_logs ADD COLUMN created_at TEXT")
+        await self._writer.execute(
+            "CREATE INDEX IF NOT EXISTS idx_chat_logs_session_turn ON chat_logs (session_id, turn)"
+        )
+        await self._writer.commit()
         logger.info("Database schema ensured.")
 
+    async def open(self):
+        self._writer = await self._connect()
+        await self._ensure_schema()
+        self._readers = [await self._connect() for _ in range(self.read_pool_size)]
+        self._next_reader = itertools.cycle(self._readers)
+        self._queue = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._write_loop())
+        logger.info(f"Session store opened on {self.db_file} with {self.read_pool_size} readers")
+
+    async def close(self):
+        if self._writer_task is not None:
+            # Drain pending writes before closing
+            await self._queue.put(None)
+            await self._writer_task
+            self._writer_task = None
+        for connection in self._readers:
+            await connection.close()
+        self._readers = []
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+        logger.info("Session store closed")
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.batch_delay
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch):
+        try:
+            await self._writer.executemany(INSERT_TURN_SQL, [params for params, _ in batch])
+            await self._writer.commit()
+        except Exception as e:
+            try:
+                await self._writer.rollback()
+            except Exception as rollback_error:
+                # The writer loop must survive, or every later add_conversation would wait forever
+                logger.error(f"Rollback of a chat history batch failed: {rollback_error}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    async def add_conversation(self, session_id: str, user_query: str, gpt_response: str):
+        """Queue one turn for the next group commit and wait until it is durable."""
+        future = asyncio.get_running_loop().create_future()
+        created_at = datetime.now(timezone.utc).isoformat()
+        # The answer already exists: saving it waits for a slot however long it takes
+        async with get_limiter("sqlite").unbounded():
+            with metrics.timer("db_operation_seconds", operation="write"):
+                await self._queue.put(((session_id, user_query, gpt_response, session_id, created_at), future))
+                await future
+
+    async def get_history(self, session_id: str) -> List[dict]:
+        messages = []
+        reader = next(self._next_reader)
+        async with get_limiter("sqlite"):
+            with metrics.timer("db_operation_seconds", operation="read"):
+                async with reader.execute(
+                    "SELECT user_query, gpt_response FROM chat_logs WHERE session_id=? ORDER BY turn",
+                    (session_id,)
+                ) as cursor:
+                    async for row in cursor:
+                        messages.append({"role": "user", "content": row[0]})
+                        messages.append({"role": "assistant", "content": row[1]})
+        return messages
+
+
+class ChunkManifest:
+    """
+    Per-document record of the chunk ids indexed in Qdrant and the metadata
+    each was stored with, kept next to the chat history. Re-uploads compare
+    against it to embed only new chunks and delete the ones that went away.
+
+    It also holds the indexing state every worker process must agree on:
+    tenant placements and the leases guarding their migrations, background
+    ingestion jobs and the per-user document versions that invalidate cached
+    answers.
+    """
+
+    def __init__(self, db_file: str = DB_FILE):
+        self.db_file = db_file
+        self._connection: Optional[aiosqlite.Connection] = None
+        # One connection; the lock keeps each document's replace in its own transaction
+        self._lock = asyncio.Lock()
+
+    async def open(self):
+        self._connection = await aiosqlite.connect(self.db_file)
+        await self._connection.execute("PRAGMA journal_mode=WAL")
+        await self._connection.execute("PRAGMA busy_timeout=5000")
+        await self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS indexed_documents (
+                username TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                chunks INTEGER,
+                indexed_at TEXT,
+                PRIMARY KEY (username, file_name)
+            )
+        ''')
+        await self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS indexed_chunks (
+                username TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                metadata TEXT,
+                PRIMARY KEY (username, file_name, chunk_id)
+            ) WITHOUT ROWID
+        ''')
+        await self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS tenant_placements (
+                username TEXT PRIMARY KEY,
+                collection TEXT NOT NULL,
+                placed_at TEXT
+            )
+        ''')
+        await self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS tenant_leases (
+                username TEXT NOT NULL,
+                holder TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (username, holder)
+            )
+        ''')
+        await self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                job_id TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                job TEXT NOT NULL
+            )
+        ''')
+        await self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_username ON ingestion_jobs (username, created_at)"
+        )
+        # version grows across all users, so a worker can ask what changed since the version it last saw
+        await self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS document_versions (
+                username TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+        ''')
+        await self._connection.commit()
+        logger.info(f"Chunk manifest opened on {self.db_file}")
+
+    async def close(self):
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    async def get(self, username: str, file_name: str) -> Optional[Dict[str, str]]:
+        """{chunk_id: metadata JSON} of the document, or None if it was never indexed with a manifest."""
+        async with self._lock:
+            async with self._connection.execute(
+                "SELECT 1 FROM indexed_documents WHERE username=? AND file_name=?", (username, file_name)
+            ) as cursor:
+                if await cursor.fetchone() is None:
+                    return None
+            async with self._connection.execute(
+                "SELECT chunk_id, metadata FROM indexed_chunks WHERE username=? AND file_name=?",
+                (username, file_name)
+            ) as cursor:
+                return {row[0]: row[1] async for row in cursor}
+
+    async def clear(self):
+        """Forget every document, e.g. when the Qdrant collection was (re)created empty."""
+        async with self._lock:
+            await self._connection.execute("DELETE FROM indexed_chunks")
+            await self._connection.execute("DELETE FROM indexed_documents")
+            await self._connection.commit()
+
+    async def placements(self) -> Dict[str, str]:
+        """{username: collection} of tenants moved out of the shared collection."""
+        async with self._lock:
+            async with self._connection.execute("SELECT username, collection FROM tenant_placements") as cursor:
+                return {row[0]: row[1] async for row in cursor}
+
+    async def set_placement(self, username: str, collection: Optional[str]):
+        """Record the tenant's dedicated collection, or None to route it back to the shared one."""
+        async with self._lock:
+            if collection is None:
+                await self._connection.execute("DELETE FROM tenant_placements WHERE username=?", (username,))
+            else:
+                await self._connection.execute(
+                    "INSERT OR REPLACE INTO tenant_placements (username, collection, placed_at) VALUES (?, ?, ?)",
+                    (username, collection, datetime.now(timezone.utc).isoformat())
+                )
+            await self._connection.commit()
+
+    async def acquire_tenant_lease(self, username: str, holder: str, kind: str, ttl: float) -> bool:
+        """
+        Claim a tenant for a writer ("write") or a migration ("migrate") across
+        worker processes; True when granted. Writers share the tenant but are
+        refused while a migration holds or awaits it. A migration is recorded
+        at its first attempt, which keeps new writers out, and is granted once
+        the other leases are gone. Leases lapse `ttl` seconds after their last
+        renewal, so a crashed worker does not block the tenant for good.
+        """
+        now = time.time()
+        async with self._lock:
+            try:
+                # Immediate: the check and the insert must not interleave with another process
+                await self._connection.execute("BEGIN IMMEDIATE")
+                await self._connection.execute(
+                    "DELETE FROM tenant_leases WHERE username=? AND expires_at < ?", (username, now))
+                async with self._connection.execute(
+                    "SELECT kind FROM tenant_leases WHERE username=? AND holder != ?", (username, holder)
+                ) as cursor:
+                    others = [row[0] async for row in cursor]
+                recorded = "migrate" not in others
+                if recorded:
+                    await self._connection.execute(
+                        "INSERT OR REPLACE INTO tenant_leases (username, holder, kind, expires_at) VALUES (?, ?, ?, ?)",
+                        (username, holder, kind, now + ttl)
+                    )
+                await self._connection.commit()
+            except Exception:
+                await self._connection.rollback()
+                raise
+        return recorded and (kind == "write" or not others)
+
+    async def renew_tenant_lease(self, username: str, holder: str, ttl: float):
+        async with self._lock:
+            await self._connection.execute(
+                "UPDATE tenant_leases SET expires_at=? WHERE username=? AND holder=?",
+                (time.time() + ttl, username, holder)
+            )
+            await self._connection.commit()
+
+    async def release_tenant_lease(self, username: str, holder: str):
+        async with self._lock:
+            await self._connection.execute(
+                "DELETE FROM tenant_leases WHERE username=? AND holder=?", (username, holder))
+            await self._connection.commit()
+
+    async def save_job(self, job_id: str, username: str, status: str, created_at: str, job: str, retention: int = None):
+        """Store an ingestion job (`job` is its JSON); finishing one forgets the oldest beyond `retention` finished jobs."""
+        async with self._lock:
+            await self._connection.execute(
+                "INSERT OR REPLACE INTO ingestion_jobs (job_id, username, status, created_at, job) VALUES (?, ?, ?, ?, ?)",
+                (job_id, username, status, created_at, job)
+            )
+            if retention is not None and status in ("completed", "failed"):
+                await self._connection.execute('''
+                    DELETE FROM ingestion_jobs WHERE job_id IN (
+                        SELECT job_id FROM ingestion_jobs WHERE status IN ('completed', 'failed')
+                        ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (retention,))
+            await self._connection.commit()
+
+    async def get_job(self, job_id: str) -> Optional[str]:
+        """JSON of the ingestion job, whichever worker runs it."""
+        async with self._lock:
+            async with self._connection.execute("SELECT job FROM ingestion_jobs WHERE job_id=?", (job_id,)) as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def list_jobs(self, username: str = None) -> List[str]:
+        """JSON of the ingestion jobs, oldest first."""
+        async with self._lock:
+            if username is None:
+                query, params = "SELECT job FROM ingestion_jobs ORDER BY created_at", ()
+            else:
+                query, params = "SELECT job FROM ingestion_jobs WHERE username=? ORDER BY created_at", (username,)
+            async with self._connection.execute(query, params) as cursor:
+                return [row[0] async for row in cursor]
+
+    async def bump_document_version(self, username: str) -> int:
+        """Record that the user's documents changed; returns the new version."""
+        async with self._lock:
+            await self._connection.execute(
+                "INSERT OR REPLACE INTO document_versions (username, version) "
+                "VALUES (?, (SELECT COALESCE(MAX(version), 0) + 1 FROM document_versions))",
+                (username,)
+            )
+            async with self._connection.execute(
+                "SELECT version FROM document_versions WHERE username=?", (username,)
+            ) as cursor:
+                version = (await cursor.fetchone())[0]
+            await self._connection.commit()
+        return version
+
+    async def document_versions_since(self, version: int) -> List[tuple]:
+        """(username, version) of the users whose documents changed after `version`."""
+        async with self._lock:
+            async with self._connection.execute(
+                "SELECT username, version FROM document_versions WHERE version > ? ORDER BY version", (version,)
+            ) as cursor:
+                return [tuple(row) async for row in cursor]
+
+    async def replace(self, username: str, file_name: str, chunks: Dict[str, str]):
+        """Make `chunks` the document's manifest in one transaction."""
+        async with self._lock:
+            try:
+                await self._connection.execute(
+                    "DELETE FROM indexed_chunks WHERE username=? AND file_name=?", (username, file_name)
+                )
+                await self._connection.executemany(
+                    "INSERT INTO indexed_chunks (username, file_name, chunk_id, metadata) VALUES (?, ?, ?, ?)",
+                    [(username, file_name, chunk_id, metadata) for chunk_id, metadata in chunks.items()]
+                )
+                await self._connection.execute(
+                    "INSERT OR REPLACE INTO indexed_documents (username, file_name, chunks, indexed_at) VALUES (?, ?, ?, ?)",
+                    (username, file_name, len(chunks), datetime.now(timezone.utc).isoformat())
+                )
+                await self._connection.commit()
+            except Exception:
+                await self._connection.rollback()
+                raise
+
+
+# Process-wide stores, opened in the FastAPI lifespan (or lazily on first use)
+_session_store: Optional[SessionStore] = None
+_session_store_lock = asyncio.Lock()
+_chunk_manifest: Optional[ChunkManifest] = None
+_chunk_manifest_lock = asyncio.Lock()
+
+
+async def init_session_store() -> SessionStore:
+    global _session_store
+    async with _session_store_lock:
+        if _session_store is None:
+            store = SessionStore()
+            await store.open()
+            _session_store = store
+    return _session_store
+
+
+async def get_session_store() -> SessionStore:
+    if _session_store is None:
+        return await init_session_store()
+    return _session_store
+
+
+async def close_session_store():
+    global _session_store
+    async with _session_store_lock:
+        if _session_store is not None:
+            await _session_store.close()
+            _session_store = None
+
+
+async def init_chunk_manifest() -> ChunkManifest:
+    global _chunk_manifest
+    async with _chunk_manifest_lock:
+        if _chunk_manifest is None:
+            manifest = ChunkManifest()
+            await manifest.open()
+            _chunk_manifest = manifest
+    return _chunk_manifest
+
+
+async def get_chunk_manifest() -> ChunkManifest:
+    if _chunk_manifest is None:
+        return await init_chunk_manifest()
+    return _chunk_manifest
+
+
+async def close_chunk_manifest():
+    global _chunk_manifest
+    async with _chunk_manifest_lock:
+        if _chunk_manifest is not None:
+            await _chunk_manifest.close()
+            _chunk_manifest = None
+
 
 async def add_conversation_async(session_id: str, user_query: str, gpt_response: str):
     """Add a conversation entry to the database."""
     try:
-        await ensure_schema()
-        async with aiosqlite.connect(DB_FILE) as connection:
-            await connection.execute(
-                "INSERT INTO chat_logs (session_id, user_query, gpt_response) VALUES (?, ?, ?)",
-                (session_id, user_query, gpt_response)
-            )
-            await connection.commit()
-            logger.info(f"Conversation added for session {session_id}")
+        store = await get_session_store()
+        await store.add_conversation(session_id, user_query, gpt_response)
+        logger.info(f"Conversation added for session {session_id}")
     except Exception as e:
         logger.exception(f"Error occurred while adding conversation: {str(e)}")
         raise
@@ -39,21 +482,14 @@ async def add_conversation_async(session_id: str, user_query: str, gpt_response:
 async def get_past_conversation_async(session_id: str) -> List[dict]:
     """Retrieve all past conversations for a given session_id."""
     start_time = asyncio.get_event_loop().time()
-    messages = []
 
     try:
-        await ensure_schema()
-        async with aiosqlite.connect(DB_FILE) as connection:
-            async with connection.execute(
-                "SELECT user_query, gpt_response FROM chat_logs WHERE session_id=?",
-                (session_id,)
-            ) as cursor:
-                async for row in cursor:
-                    messages.append({"role": "user", "content": row[0]})
-                    messages.append({"role": "assistant", "content": row[1]})
+        store = await get_session_store()
+        messages = await store.get_history(session_id)
 
         elapsed_time = asyncio.get_event_loop().time() - start_time
-        logger.info(f"History fetched for session {session_id} in {elapsed_time:.2f}s: {messages}")
+        logger.info(f"History fetched for session {session_id} in {elapsed_time:.2f}s: {len(messages)} messages")
+        logger.debug("History of session %s: %s", session_id, messages)
         return messages
     except Exception as e:
         logger.exception(f"Error retrieving conversation: {str(e)}")
@@ -0,0 +1,318 @@
+import os
+import re
+import asyncio
+import fcntl
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.services import metrics
+from app.services.logger import logger
+from app.utils.single_flight import SingleFlight
+
+# Directory of the persistent tier; set to an empty string to keep only the in-memory tier
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", 10000))
+
+KEY_SIZE = hashlib.sha256().digest_size
+
+
+def embedding_cache_key(model_name: str, text: str) -> bytes:
+    """Content address of one embedding: sha256 over (model, text)."""
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).digest()
+
+
+class MemoryEmbeddingStore:
+    """
+    Bounded LRU of embeddings keyed by content hash.
+    """
+
+    def __init__(self, max_items: int = EMBEDDING_CACHE_MEMORY_ITEMS):
+        self.max_items = max_items
+        self._items: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key: bytes) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._items.get(key)
+            if vector is not None:
+                self._items.move_to_end(key)
+            return vector
+
+    def put(self, key: bytes, vector: List[float]):
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._items[key] = vector
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+class DiskEmbeddingStore:
+    """
+    Append-only persistent tier: a memory-mapped float32 matrix (`<name>.f32`)
+    plus a parallel file of 32-byte keys (`<name>.keys`) whose position is the
+    row index. Rows are flushed before their keys are appended, so a crash can
+    leave an unused row but never a key pointing at a missing vector.
+
+    Several worker processes may share the files. Appends hold an exclusive
+    lock on `<name>.lock` and take their first row from the keys file's
+    length, after loading the keys other processes appended since.
+    """
+
+    def __init__(self, directory: str, name: str, dim: int, initial_capacity: int = 1024):
+        os.makedirs(directory, exist_ok=True)
+        self.dim = dim
+        self.matrix_path = os.path.join(directory, f"{name}.f32")
+        self.keys_path = os.path.join(directory, f"{name}.keys")
+        self._lock = threading.Lock()
+        self._lock_file = open(os.path.join(directory, f"{name}.lock"), "a+b")
+        self._row_bytes = dim * np.dtype(np.float32).itemsize
+
+        self._rows: Dict[bytes, int] = {}
+        self._count = 0
+        self._matrix = None
+        with self._lock, self._file_lock():
+            self._capacity = max(self._file_rows(), initial_capacity)
+            self._resize_file(self._capacity)
+            self._map()
+            self._load_new_keys()
+
+    def __len__(self):
+        return self._count
+
+    @contextmanager
+    def _file_lock(self):
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _file_rows(self) -> int:
+        return os.path.getsize(self.matrix_path) // self._row_bytes if os.path.exists(self.matrix_path) else 0
+
+    def _map(self):
+        if self._matrix is not None:
+            self._matrix.flush()
+        # One assignment: get() runs without the lock and must always find a mapping
+        self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(self._capacity, self.dim))
+
+    def _load_new_keys(self):
+        """Index the keys appended since the last call, by this or another process; holds the file lock."""
+        if not os.path.exists(self.keys_path):
+            return
+        with open(self.keys_path, "r+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size % KEY_SIZE:
+                # A key cut short by a crash; drop it so the next append stays aligned
+                size -= size % KEY_SIZE
+                f.truncate(size)
+            f.seek(self._count * KEY_SIZE)
+            raw = f.read(size - self._count * KEY_SIZE)
+        count = self._count + len(raw) // KEY_SIZE
+        if count > self._capacity:
+            # Another process grew the matrix past our mapping; remap before get() can see the new rows
+            self._capacity = self._file_rows()
+            self._map()
+        for offset in range(0, len(raw), KEY_SIZE):
+            self._rows.setdefault(raw[offset:offset + KEY_SIZE], self._count)
+            self._count += 1
+
+    def _resize_file(self, rows: int):
+        size = rows * self._row_bytes
+        with open(self.matrix_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+
+    def _grow(self, needed: int):
+        capacity = max(self._capacity, self._file_rows())
+        while capacity < needed:
+            capacity *= 2
+        self._resize_file(capacity)
+        self._capacity = capacity
+        self._map()
+
+    def get(self, key: bytes) -> Optional[List[float]]:
+        # Lock-free: rows are indexed only once the mapping covers them
+        row = self._rows.get(key)
+        if row is None:
+            return None
+        return self._matrix[row].tolist()
+
+    def put_many(self, items: Dict[bytes, List[float]]):
+        with self._lock, self._file_lock():
+            self._load_new_keys()
+            new_items = [(key, vector) for key, vector in items.items() if key not in self._rows]
+            if not new_items:
+                return
+            if self._count + len(new_items) > self._capacity:
+                self._grow(self._count + len(new_items))
+            first_row = self._count
+            self._matrix[first_row:first_row + len(new_items)] = np.asarray(
+                [vector for _, vector in new_items], dtype=np.float32
+            )
+            self._matrix.flush()
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(key for key, _ in new_items))
+            for offset, (key, _) in enumerate(new_items):
+                self._rows[key] = first_row + offset
+            self._count += len(new_items)
+
+    def close(self):
+        with self._lock:
+            self._matrix.flush()
+            self._lock_file.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed cache in front of a dense embedder. Lookups go to an
+    in-memory LRU first, then to the memory-mapped on-disk tier; only misses
+    (deduplicated within a call) reach the wrapped embedder.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        dimensions: Optional[int] = None,
+        directory: str = EMBEDDING_CACHE_DIR,
+        memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.directory = directory
+        self.memory = MemoryEmbeddingStore(memory_items)
+        self.disk: Optional[DiskEmbeddingStore] = None
+        self._disk_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.deduplicated = 0
+        # Concurrent misses for the same query text share one embedding call
+        self._query_flight = SingleFlight("query_embedding")
+        if dimensions:
+            # Open the persistent tier up front so earlier runs' vectors are found
+            self._disk_store(dimensions)
+
+    def _disk_store(self, dim: int) -> Optional[DiskEmbeddingStore]:
+        if not self.directory:
+            return None
+        if self.disk is None:
+            with self._disk_lock:
+                if self.disk is None:
+                    name = re.sub(r"[^A-Za-z0-9_.-]", "_", self.model_name) + f"-{dim}"
+                    self.disk = DiskEmbeddingStore(self.directory, name, dim)
+        return self.disk
+
+    def _lookup(self, keys: List[bytes]) -> List[Optional[List[float]]]:
+        found = []
+        hits_memory = hits_disk = 0
+        for key in keys:
+            vector = self.memory.get(key)
+            if vector is not None:
+                hits_memory += 1
+            elif self.disk is not None:
+                vector = self.disk.get(key)
+                if vector is not None:
+                    hits_disk += 1
+                    self.memory.put(key, vector)
+            found.append(vector)
+        with self._stats_lock:
+            self.hits_memory += hits_memory
+            self.hits_disk += hits_disk
+        if hits_memory:
+            metrics.increment("embedding_cache_total", hits_memory, outcome="memory_hit")
+        if hits_disk:
+            metrics.increment("embedding_cache_total", hits_disk, outcome="disk_hit")
+        return found
+
+    def _store(self, computed: Dict[bytes, List[float]]):
+        for key, vector in computed.items():
+            self.memory.put(key, vector)
+        if computed:
+            disk = self._disk_store(len(next(iter(computed.values()))))
+            if disk is not None:
+                disk.put_many(computed)
+
+    def _plan(self, texts: List[str]):
+        keys = [embedding_cache_key(self.model_name, text) for text in texts]
+        vectors = self._lookup(keys)
+        missing: Dict[bytes, str] = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        with self._stats_lock:
+            # Repeats of the same text within one call are embedded once
+            self.misses += len(missing)
+            self.deduplicated += sum(1 for vector in vectors if vector is None) - len(missing)
+        if missing:
+            metrics.increment("embedding_cache_total", len(missing), outcome="miss")
+        return keys, vectors, missing
+
+    @staticmethod
+    def _merge(keys, vectors, computed):
+        return [vector if vector is not None else computed[key] for key, vector in zip(keys, vectors)]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._plan(texts)
+        computed = {}
+        if missing:
+            computed = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            self._store(computed)
+        return self._merge(keys, vectors, computed)
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, vectors, missing = self._plan([text])
+        computed = {}
+        if missing:
+            computed = {keys[0]: self.embeddings.embed_query(text)}
+            self._store(computed)
+        return self._merge(keys, vectors, computed)[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = await asyncio.to_thread(self._plan, texts)
+        computed = {}
+        if missing:
+            computed = dict(zip(missing, await self.embeddings.aembed_documents(list(missing.values()))))
+            await asyncio.to_thread(self._store, computed)
+        return self._merge(keys, vectors, computed)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, vectors, missing = self._plan([text])
+        computed = {}
+        if missing:
+            vector, shared = await self._query_flight.do(keys[0], lambda: self.embeddings.aembed_query(text))
+            computed = {keys[0]: vector}
+            if not shared:
+                await asyncio.to_thread(self._store, computed)
+        return self._merge(keys, vectors, computed)[0]
+
+    def stats(self) -> dict:
+        lookups = self.hits_memory + self.hits_disk + self.misses + self.deduplicated
+        return {
+            "model": self.model_name,
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "deduplicated": self.deduplicated,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+            "memory_items": len(self.memory),
+            "disk_items": len(self.disk) if self.disk is not None else 0,
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+        logger.info(f"Embedding cache stats: {self.stats()}")
@@ -0,0 +1,349 @@
+import os
+import asyncio
+import bisect
+import time
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from app.services.logger import logger
+from app.utils.context_utils import count_tokens
+
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1500))
+CHUNK_OVERLAP = 200
+# Bounded hand-off queues between the extraction, chunking and upsert stages
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 8))
+# Embedding batches close at INGEST_BATCH_TOKENS tokens or INGEST_BATCH_SIZE chunks,
+# and up to INGEST_CONCURRENCY of them are embedded/upserted at once
+INGEST_BATCH_TOKENS = int(os.getenv("INGEST_BATCH_TOKENS", 8000))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 64))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", 4))
+# Documents of a bulk upload extracted and chunked at the same time
+INGEST_EXTRACT_CONCURRENCY = int(os.getenv("INGEST_EXTRACT_CONCURRENCY", 4))
+PREVIEW_CHARS = 200
+
+Segment = Tuple[str, dict]
+_DONE = object()
+
+
+async def aiter_segments(segments: Iterator[Segment], max_buffer: int = INGEST_QUEUE_SIZE) -> AsyncIterator[Segment]:
+    """
+    Run a blocking segment generator (PDF pages, DOCX paragraphs, ...) in a
+    worker thread and hand its items to the event loop through a bounded
+    queue, so extraction pauses while downstream stages catch up.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+    cancelled = False
+
+    def produce():
+        try:
+            for item in segments:
+                if cancelled:
+                    return
+                asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+            asyncio.run_coroutine_threadsafe(queue.put(_DONE), loop).result()
+        except BaseException as e:
+            asyncio.run_coroutine_threadsafe(queue.put(e), loop).result()
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        cancelled = True
+        # Keep draining so a producer blocked on a full queue can observe the cancellation
+        while not producer.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.sleep(0.01)
+
+
+def segment_separator(doc_type: str) -> str:
+    """
+    Text that joins two segments of a document: txt blocks are cut at arbitrary
+    byte offsets and simply continue each other, while PDF pages and DOCX
+    paragraphs are separate lines.
+    """
+    return "" if doc_type == "txt" else "\n"
+
+
+class StreamingChunker:
+    """
+    Incremental RecursiveCharacterTextSplitter: segments are fed in order and
+    chunks are emitted once they are far enough from the end of the buffer
+    that more text cannot change them. Only the unsplit tail stays in memory.
+    Each chunk carries the metadata (e.g. page) of the segment it starts in
+    and its character offset in the whole document as start_index.
+    """
+
+    def __init__(
+        self,
+        metadata: dict,
+        chunk_size: int = CHUNK_SIZE,
+        chunk_overlap: int = CHUNK_OVERLAP,
+        segment_separator: str = "\n",
+    ):
+        self.metadata = metadata
+        self.chunk_size = chunk_size
+        self.segment_separator = segment_separator
+        self.splitter = RecursiveCharacterTextSplitter(
+            separators=["\n\n", "\n", ".", ","],
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            add_start_index=True,
+        )
+        self._buffer = ""
+        self._offset = 0  # document offset of self._buffer[0]
+        self._marks: List[int] = []  # document offsets where segments start
+        self._mark_metadata: List[dict] = []
+        self.chars = 0
+        self.segments = 0
+        self.preview = ""
+
+    def _metadata_at(self, position: int) -> dict:
+        i = bisect.bisect_right(self._marks, position) - 1
+        return self._mark_metadata[i] if i >= 0 else {}
+
+    def _split(self, final: bool) -> List[Document]:
+        if not self._buffer.strip():
+            return []
+        chunks = self.splitter.split_text(self._buffer)
+        keep_from = len(self._buffer) if final else len(self._buffer) - 2 * self.chunk_size
+        docs, cut, search_from = [], None, 0
+        for i, text in enumerate(chunks):
+            start = self._buffer.find(text, search_from)
+            if start < 0:
+                start = search_from
+            search_from = start + 1
+            # Chunks near the end of the buffer may still grow: keep them for the next split
+            if not final and (start + len(text) > keep_from or i == len(chunks) - 1):
+                cut = start
+                break
+            position = self._offset + start
+            docs.append(Document(
+                page_content=text,
+                metadata={**self.metadata, **self._metadata_at(position), "start_index": position},
+            ))
+        if final:
+            cut = len(self._buffer)
+        self._buffer = self._buffer[cut:]
+        self._offset += cut
+        # Drop segment marks that no longer cover the buffer (keep the one in effect)
+        first = max(0, bisect.bisect_right(self._marks, self._offset) - 1)
+        del self._marks[:first], self._mark_metadata[:first]
+        return docs
+
+    def feed(self, text: str, metadata: Optional[dict] = None) -> List[Document]:
+        if self.segments:
+            text = self.segment_separator + text
+        self._marks.append(self._offset + len(self._buffer) + (len(self.segment_separator) if self.segments else 0))
+        self._mark_metadata.append(metadata or {})
+        self._buffer += text
+        if len(self.preview) < PREVIEW_CHARS:
+            self.preview = (self.preview + text)[:PREVIEW_CHARS]
+        self.chars += len(text)
+        self.segments += 1
+        if len(self._buffer) >= 4 * self.chunk_size:
+            return self._split(final=False)
+        return []
+
+    def flush(self) -> List[Document]:
+        return self._split(final=True)
+
+
+async def run_ingestion(
+    segments: AsyncIterator[Segment],
+    chunker: StreamingChunker,
+    upsert: Callable,
+    batch_size: int = INGEST_BATCH_SIZE,
+    max_buffer: int = INGEST_QUEUE_SIZE,
+    progress: Optional[dict] = None,
+    batch_tokens: int = INGEST_BATCH_TOKENS,
+    concurrency: int = INGEST_CONCURRENCY,
+) -> dict:
+    """
+    Drive segments -> chunks -> batches -> `upsert(batch)` with a bounded
+    queue between chunking and embedding/upserting, so peak memory depends on
+    the queue sizes rather than on the document size. Batches are sized by
+    token count (`batch_tokens`, at most `batch_size` chunks) and up to
+    `concurrency` of them are upserted at once. `progress`, if given, is
+    updated in place as work completes (segments_extracted, i.e. pages for
+    PDFs, chunks_produced and chunks_upserted).
+    """
+    progress = progress if progress is not None else {}
+    progress.update(segments_extracted=0, chunks_produced=0, chunks_upserted=0)
+    start = time.perf_counter()
+    batches: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+    concurrency = max(1, concurrency)
+    batch_count = 0
+
+    async def produce():
+        nonlocal batch_count
+        batch, tokens = [], 0
+
+        async def emit():
+            nonlocal batch, tokens, batch_count
+            progress["chunks_produced"] += len(batch)
+            batch_count += 1
+            await batches.put(batch)
+            batch, tokens = [], 0
+
+        async def add(docs):
+            nonlocal tokens
+            for doc in docs:
+                doc_tokens = count_tokens(doc.page_content)
+                if batch and (tokens + doc_tokens > batch_tokens or len(batch) >= batch_size):
+                    await emit()
+                batch.append(doc)
+                tokens += doc_tokens
+
+        async for text, metadata in segments:
+            progress["segments_extracted"] += 1
+            await add(chunker.feed(text, metadata))
+        await add(chunker.flush())
+        if batch:
+            await emit()
+        for _ in range(concurrency):
+            await batches.put(_DONE)
+
+    async def consume():
+        while True:
+            batch = await batches.get()
+            if batch is _DONE:
+                return
+            await upsert(batch)
+            progress["chunks_upserted"] += len(batch)
+
+    tasks = [asyncio.create_task(produce())] + [asyncio.create_task(consume()) for _ in range(concurrency)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "segments": progress["segments_extracted"],
+        "characters": chunker.chars,
+        "chunks": progress["chunks_upserted"],
+        "batches": batch_count,
+        "seconds": round(elapsed, 3),
+        "chunks_per_second": round(progress["chunks_upserted"] / elapsed, 2) if elapsed else 0.0,
+        "preview": chunker.preview,
+    }
+    logger.info(f"Ingestion finished: { {k: v for k, v in stats.items() if k != 'preview'} }")
+    return stats
+
+
+async def run_bulk_ingestion(
+    sources: List[Tuple[str, Callable[[], AsyncIterator[Segment]], StreamingChunker]],
+    upsert: Callable,
+    extract_concurrency: int = INGEST_EXTRACT_CONCURRENCY,
+    batch_size: int = INGEST_BATCH_SIZE,
+    max_buffer: int = INGEST_QUEUE_SIZE,
+    batch_tokens: int = INGEST_BATCH_TOKENS,
+    concurrency: int = INGEST_CONCURRENCY,
+) -> Tuple[List[dict], dict]:
+    """
+    run_ingestion for many documents at once. `sources` are (name, open
+    segments, chunker) triples; up to `extract_concurrency` documents are
+    extracted and chunked at the same time, and their chunks go into one
+    shared stream of token-sized batches, so small files share embedding
+    calls and upserts instead of each sending its own.
+
+    A document that fails to extract is marked "failed" and the others carry
+    on; the chunks it produced before failing are still upserted (counted in
+    its "chunks"). A failing `upsert` stops the whole run. Returns one stats dict per
+    source (in order, with "status" and "error") and the overall stats.
+    """
+    start = time.perf_counter()
+    batches: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+    concurrency = max(1, concurrency)
+    extract_slots = asyncio.Semaphore(max(1, extract_concurrency))
+    results = [{"file_name": name, "status": "queued", "segments": 0, "chunks": 0, "error": None}
+               for name, _, _ in sources]
+    batch, tokens, batch_count = [], 0, 0
+
+    async def emit():
+        nonlocal batch, tokens, batch_count
+        # Swap first: other documents may add chunks while this batch waits for room in the queue
+        ready, batch, tokens = batch, [], 0
+        batch_count += 1
+        await batches.put(ready)
+
+    async def add(index, docs):
+        nonlocal tokens
+        for doc in docs:
+            doc_tokens = count_tokens(doc.page_content)
+            if batch and (tokens + doc_tokens > batch_tokens or len(batch) >= batch_size):
+                await emit()
+            batch.append((index, doc))
+            tokens += doc_tokens
+
+    async def extract(index, open_segments, chunker):
+        result = results[index]
+        async with extract_slots:
+            result["status"] = "extracting"
+            started = time.perf_counter()
+            try:
+                async for text, metadata in open_segments():
+                    result["segments"] += 1
+                    await add(index, chunker.feed(text, metadata))
+                await add(index, chunker.flush())
+                result["status"] = "extracted"
+            except Exception as e:
+                logger.error(f"Extraction of {result['file_name']} failed: {e}")
+                result.update(status="failed", error=str(e))
+            result["characters"] = chunker.chars
+            result["extract_seconds"] = round(time.perf_counter() - started, 3)
+
+    async def produce():
+        await asyncio.gather(*(extract(i, open_segments, chunker)
+                               for i, (_, open_segments, chunker) in enumerate(sources)))
+        if batch:
+            await emit()
+        for _ in range(concurrency):
+            await batches.put(_DONE)
+
+    async def consume():
+        while True:
+            items = await batches.get()
+            if items is _DONE:
+                return
+            await upsert([doc for _, doc in items])
+            for index, _ in items:
+                results[index]["chunks"] += 1
+
+    tasks = [asyncio.create_task(produce())] + [asyncio.create_task(consume()) for _ in range(concurrency)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    elapsed = time.perf_counter() - start
+    chunks = sum(result["chunks"] for result in results)
+    stats = {
+        "files": len(sources),
+        "failed": sum(result["status"] == "failed" for result in results),
+        "segments": sum(result["segments"] for result in results),
+        "characters": sum(result.get("characters", 0) for result in results),
+        "chunks": chunks,
+        "batches": batch_count,
+        "seconds": round(elapsed, 3),
+        "files_per_second": round(len(sources) / elapsed, 2) if elapsed else 0.0,
+        "chunks_per_second": round(chunks / elapsed, 2) if elapsed else 0.0,
+    }
+    logger.info(f"Bulk ingestion finished: {stats}")
+    return results, stats
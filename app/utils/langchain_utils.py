@@ -6,26 +6,106 @@ from langchain_openai.chat_models import ChatOpenAI
 from langchain.callbacks import get_openai_callback
 import time
 import os
+import re
+import json
+import hashlib
+import difflib
+import tarfile
+import zipfile
 from app.utils.prompts import get_query_refiner_prompt, get_main_prompt
 from qdrant_client import QdrantClient,AsyncQdrantClient
-from app.utils.qdrant_utils import DocumentIndexer
+from app.utils.qdrant_utils import RETRIEVAL_MODES, BatchSearch, get_document_indexer
+from app.utils.context_utils import assemble_context
+from app.utils.ingestion import aiter_segments
+from app.utils.utils import BULK_MAX_FILES, file_type_of, iter_text_segments, iter_upload_files
+from fastapi import HTTPException
 import asyncio
 from app.services.logger import logger
+from app.services import metrics
+from app.utils.cache_utils import TTLCache
+from app.utils.answer_cache import ANSWER_CACHE_ENABLED, ANSWER_CACHE_SYNC_INTERVAL, AnswerLookup, SemanticAnswerCache
+from app.utils.db_utils import get_chunk_manifest
+from app.utils.mmr import MMR_LAMBDA
+from app.utils.single_flight import SingleFlight
+from app.utils.admission import admission_user, admit_as, get_limiter
 from dotenv import load_dotenv
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Tuple
 
 
 load_dotenv(override=True)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 qdrant_db_path=os.getenv("qdrant_db_path")
 ls.api_key=os.getenv("LANGSMITH_API_KEY")
-
-async def format_docs(docs):
-    return "\n\n".join(doc.page_content for doc in docs)
+REFINER_MODEL = os.getenv("REFINER_MODEL", "gpt-4o")
+REFINE_CACHE_SIZE = int(os.getenv("REFINE_CACHE_SIZE", 4096))
+REFINE_CACHE_TTL = float(os.getenv("REFINE_CACHE_TTL", 600))
+
+# Start retrieval on the raw query while refinement runs; keep it if the refined query is close enough
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() == "true"
+SPECULATIVE_MIN_SIMILARITY = float(os.getenv("SPECULATIVE_MIN_SIMILARITY", 0.9))
+# /chat/batch: completions in flight per batch, and the largest batch accepted
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", 8))
+CHAT_BATCH_MAX_SIZE = int(os.getenv("CHAT_BATCH_MAX_SIZE", 256))
+
+_refine_cache = TTLCache(max_items=REFINE_CACHE_SIZE, ttl=REFINE_CACHE_TTL)
+_refiner_llm = None
+_answer_cache = SemanticAnswerCache()
+# Identical concurrent work per stage runs once (e.g. many users asking the same first question)
+_refine_flight = SingleFlight("refinement")
+_retrieval_flight = SingleFlight("retrieval")
+_completion_flight = SingleFlight("completion")
+_completion_stream_flight = SingleFlight("completion_stream")
+# Document versions this worker recorded itself, so the sync loop does not invalidate twice
+_own_document_versions = {}
+_answer_sync_task = None
+
+
+async def invalidate_user_answers(username):
+    """Forget a user's cached answers, in every worker process; called whenever their documents change."""
+    removed = _answer_cache.invalidate(username)
+    metrics.increment("answer_cache_invalidated_total", removed)
+    try:
+        manifest = await get_chunk_manifest()
+        _own_document_versions[username] = await manifest.bump_document_version(username)
+    except Exception as e:
+        logger.error(f"Failed to record the document change of {username} for other workers: {e}")
+
+
+async def sync_answer_invalidations(interval: float = ANSWER_CACHE_SYNC_INTERVAL):
+    """Apply the answer invalidations of other worker processes, checking every `interval` seconds."""
+    manifest = await get_chunk_manifest()
+    # Answers cached from now on are newer than every change already recorded
+    changes = await manifest.document_versions_since(0)
+    last_version = changes[-1][1] if changes else 0
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            changes = await manifest.document_versions_since(last_version)
+        except Exception as e:
+            logger.error(f"Failed to check for answer invalidations: {e}")
+            continue
+        for username, version in changes:
+            if _own_document_versions.pop(username, None) != version:
+                metrics.increment("answer_cache_invalidated_total", _answer_cache.invalidate(username))
+            last_version = version
+
+
+async def start_answer_cache_sync():
+    global _answer_sync_task
+    if ANSWER_CACHE_ENABLED and ANSWER_CACHE_SYNC_INTERVAL > 0 and _answer_sync_task is None:
+        _answer_sync_task = asyncio.create_task(sync_answer_invalidations())
+
+
+async def stop_answer_cache_sync():
+    global _answer_sync_task
+    if _answer_sync_task is not None:
+        _answer_sync_task.cancel()
+        await asyncio.gather(_answer_sync_task, return_exceptions=True)
+        _answer_sync_task = None
 
 async def index_documents(username,extracted_text,filename,file_extension):
     try:
-        indexer = DocumentIndexer(qdrant_db_path)
+        indexer = get_document_indexer()
         start_time = time.time()
         logger.info("Searching for similar documents in ChromaDB...")
 
@@ -41,12 +121,96 @@ async def index_documents(username,extracted_text,filename,file_extension):
     except Exception as e:
         logger.error(f"Error processing documents: {str(e)}")
         raise RuntimeError(f"Failed to process documents: {str(e)}")
+    finally:
+        # Even a partial upload changes what retrieval can return
+        await invalidate_user_answers(username)
+
+
+
+async def index_document_stream(username, file, filename, file_extension, progress=None):
+    """
+    Stream an uploaded file (bytes or file object) through extraction,
+    chunking, embedding and upserts without materialising the whole text.
+    """
+    # Ingestion queues fairly with the user's other work but is never rejected
+    admit_as(username, timeout=None)
+    try:
+        indexer = get_document_indexer()
+        start_time = time.time()
+        segments = aiter_segments(iter_text_segments(file, file_extension))
+        stats = await indexer.index_segments(
+            segments,
+            file_name=filename,
+            doc_type=file_extension,
+            chunk_size=1500,
+            username=username,
+            progress=progress,
+        )
+        logger.info(f"Document indexing completed in {time.time() - start_time:.2f} seconds")
+        return stats
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing documents: {str(e)}")
+        raise RuntimeError(f"Failed to process documents: {str(e)}")
+    finally:
+        await invalidate_user_answers(username)
+
+
+async def index_uploads_bulk(username, uploads):
+    """
+    Index several uploads (file objects or bytes, with their names) in one
+    run; zip and tar archives contribute each supported member. Returns the
+    per-file results, skipped entries included, and the overall stats.
+    """
+    admit_as(username, timeout=None)
+    try:
+        indexer = get_document_indexer()
+        sources, skipped, names = [], [], set()
+        for file, upload_name in uploads:
+            try:
+                files = list(iter_upload_files(file, upload_name))
+            except (zipfile.BadZipFile, tarfile.TarError) as e:
+                skipped.append({"file_name": upload_name, "status": "failed", "error": f"Invalid archive: {e}"})
+                continue
+            for file_name, open_file, reason in files:
+                if reason is None and file_name in names:
+                    reason = "duplicate file name"
+                if reason is not None:
+                    skipped.append({"file_name": file_name, "status": "skipped", "error": reason})
+                    continue
+                if len(names) >= BULK_MAX_FILES:
+                    raise ValueError(f"More than {BULK_MAX_FILES} files in one bulk upload")
+                names.add(file_name)
+                file_type = file_type_of(file_name)
+                sources.append((file_name, file_type,
+                                lambda open_file=open_file, file_type=file_type: aiter_segments(
+                                    _open_segments(open_file, file_type))))
+        if not sources:
+            return skipped, {"files": 0, "failed": 0, "chunks": 0, "seconds": 0.0}
+        results, stats = await indexer.index_documents_bulk(sources, chunk_size=1500, username=username)
+        stats["skipped"] = len(skipped)
+        return results + skipped, stats
+
+    except (ValueError, HTTPException):
+        raise
+    except Exception as e:
+        logger.error(f"Error processing documents: {str(e)}")
+        raise RuntimeError(f"Failed to process documents: {str(e)}")
+    finally:
+        await invalidate_user_answers(username)
 
 
+def _open_segments(open_file, file_type):
+    # Runs in the extraction thread, so archive members are decompressed there too
+    yield from iter_text_segments(open_file(), file_type)
 
-async def retrieve_similar_documents(refined_query: str, num_of_chunks: int,username: str, mode: str, score_threshold: float) -> str:
+
+async def retrieve_similar_documents(refined_query: str, num_of_chunks: int,username: str, mode: str, score_threshold: float, stats: dict = None,
+                                     search_type: str = "similarity", fetch_k: int = None, mmr_lambda: float = MMR_LAMBDA) -> str:
     try:
-        indexer = DocumentIndexer(qdrant_db_path)
+        indexer = get_document_indexer()
         start_time = time.time()
         logger.info("Searching for similar documents in ChromaDB...")
 
@@ -54,17 +218,19 @@ async def retrieve_similar_documents(refined_query: str, num_of_chunks: int,user
             num_of_chunks = os.getenv('no_of_chunks')
         if not isinstance(num_of_chunks, int) or num_of_chunks <= 0:
             raise ValueError(f"Invalid number of chunks: {num_of_chunks}")
-        retriever = await indexer.get_retriever_for_user(username=username, top_k=num_of_chunks,mode=mode, score_threshold=score_threshold )
+        retriever = await indexer.get_retriever_for_user(username=username, top_k=num_of_chunks,mode=mode, score_threshold=score_threshold,
+                                                         search_type=search_type, fetch_k=fetch_k, lambda_mult=mmr_lambda)
         if not retriever:
             raise ValueError("Failed to initialize document retriever")
-        extracted_documents = await retriever.aget_relevant_documents(refined_query)
-        if not extracted_documents:
-            extracted_text_data=""
-        else:
-            extracted_text_data = await format_docs(extracted_documents)
+        extracted_documents = await retriever.ainvoke(refined_query)
+        extracted_text_data, context_report = assemble_context(extracted_documents)
+        if stats is not None:
+            stats["context"] = context_report
         logger.info(f"Document retrieval and formatting completed in {time.time() - start_time:.2f} seconds and length - {len(extracted_text_data)}")
         return extracted_text_data, extracted_documents
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing documents: {str(e)}")
         raise RuntimeError(f"Failed to process documents: {str(e)}")
@@ -77,18 +243,30 @@ async def invoke_chain(query, context, history, llm):
     logger.info("Chain initialized.")
     input_data = {"user_query": query, "context": context, "messages": history.messages}
 
-    with get_openai_callback() as cb:
-        final_response = await final_chain.ainvoke(input_data)  # Asynchronous method
+    async with get_limiter("llm"):
+        with get_openai_callback() as cb:
+            final_response = await final_chain.ainvoke(input_data)  # Asynchronous method
 
     return final_response, cb
 
-async def invoke_chain_stream(query, context, history, llm) -> AsyncGenerator[str, None]:
+async def invoke_chain_stream(query, context, history, llm, usage: dict = None) -> AsyncGenerator[str, None]:
+    """Stream the answer; once it completes, `usage` receives the prompt/completion/total token counts."""
     logger.info("Initializing Chain for streaming...")
     final_chain = get_main_prompt() | llm | StrOutputParser()
     input_data = {"user_query": query, "context": context, "messages": history.messages}
 
-    async for chunk in final_chain.astream(input_data):
-        yield chunk
+    # The slot is held until the whole answer has streamed
+    async with get_limiter("llm"):
+        with get_openai_callback() as cb:
+            async for chunk in final_chain.astream(input_data):
+                yield chunk
+    if usage is not None:
+        usage.update(prompt_tokens=cb.prompt_tokens, completion_tokens=cb.completion_tokens, total_tokens=cb.total_tokens)
+
+def record_llm_usage(username, model, prompt_tokens, completion_tokens):
+    """Count LLM tokens per user and model."""
+    metrics.increment("llm_tokens_total", prompt_tokens, username=username, model=model, kind="prompt")
+    metrics.increment("llm_tokens_total", completion_tokens, username=username, model=model, kind="completion")
 
 def create_history(messages):
     history = InMemoryChatMessageHistory()
@@ -113,36 +291,200 @@ def initialize_llm(model=None, temperature=None, llm_provider=None):
         llm=ChatOpenAI(api_key=OPENAI_API_KEY,temperature=temperature, model_name=model,streaming=True,stream_usage=True)
     return llm
 
+def get_refiner_llm():
+    """Shared model for query refinement (REFINER_MODEL)."""
+    global _refiner_llm
+    if _refiner_llm is None:
+        _refiner_llm = ChatOpenAI(temperature=0, model_name=REFINER_MODEL)
+    return _refiner_llm
+
+def history_digest(messages):
+    """Stable digest of a chat history, used as part of the refinement cache key."""
+    serialized = json.dumps([[m["role"], m["content"]] for m in messages], ensure_ascii=False)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+async def refine_user_query_with_source(query, messages, username=None) -> Tuple[str, str]:
+    """
+    Refines the user query asynchronously. Returns the refined query and how it
+    was produced: "skipped" (no history to resolve), "cache", "llm" or
+    "coalesced" (shared with a concurrent identical refinement).
+    """
+    start = time.perf_counter()
+    if not messages:
+        source, refined_query = "skipped", query
+    else:
+        key = (history_digest(messages), query)
+        refined_query = _refine_cache.get(key)
+        if refined_query is not None:
+            source = "cache"
+        else:
+            async def refine():
+                history = create_history(messages)
+                prompt = get_query_refiner_prompt()
+                refined_query_chain = prompt | get_refiner_llm() | StrOutputParser()
+                async with get_limiter("llm"):
+                    with get_openai_callback() as cb:
+                        refined = await refined_query_chain.ainvoke({"query": query, "messages": history.messages})  # Async method
+                record_llm_usage(username, REFINER_MODEL, cb.prompt_tokens, cb.completion_tokens)
+                _refine_cache.set(key, refined)
+                return refined
+
+            # "coalesced": another request was already refining the same query and history
+            refined_query, shared = await _refine_flight.do(key, refine)
+            source = "coalesced" if shared else "llm"
+
+    metrics.increment("query_refinement_total", source=source)
+    metrics.observe("query_refinement_seconds", time.perf_counter() - start, source=source)
+    return refined_query, source
+
+def completion_key(llm, query, context, past_messages):
+    """Inputs that determine an answer; equal keys may share one LLM call."""
+    return llm.model_name, llm.temperature, query, context, history_digest(past_messages)
+
 async def refine_user_query(query, messages):
     """Refines the user query asynchronously."""
-    llm = ChatOpenAI(temperature=0, model_name="gpt-4o")
-    history = create_history(messages)
-    prompt = get_query_refiner_prompt()
-    refined_query_chain = prompt | llm | StrOutputParser()
-    refined_query = await refined_query_chain.ainvoke({"query": query, "messages": history.messages})  # Async method
+    refined_query, _ = await refine_user_query_with_source(query, messages)
     return refined_query
 
 
-@ls.traceable(run_type="chain", name="Chat Pipeline")
-async def generate_chatbot_response(query, past_messages, no_of_chunks,username, mode, score_threshold):
-    """Main function to generate chatbot responses asynchronously."""
+def _normalize_query(query):
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", "", query.lower())).strip()
+
+def queries_match(query, refined_query, min_similarity=SPECULATIVE_MIN_SIMILARITY):
+    """True when the refined query is the same as, or close enough to, the raw query."""
+    a, b = _normalize_query(query), _normalize_query(refined_query)
+    if a == b:
+        return True
+    return difflib.SequenceMatcher(None, a, b).ratio() >= min_similarity
+
+async def _timed_retrieval(query, no_of_chunks, username, mode, score_threshold, search_options):
+    async def retrieve():
+        start = time.perf_counter()
+        retrieval_stats = {}
+        result = await retrieve_similar_documents(query, no_of_chunks, username, mode, score_threshold, stats=retrieval_stats,
+                                                  **search_options)
+        elapsed = time.perf_counter() - start
+        metrics.observe("retrieval_seconds", elapsed, mode=mode, search_type=search_options.get("search_type", "similarity"))
+        return result, elapsed * 1000, retrieval_stats
+
+    key = (query, no_of_chunks, username, mode, score_threshold, tuple(sorted(search_options.items())))
+    (result, elapsed_ms, retrieval_stats), shared = await _retrieval_flight.do(key, retrieve)
+    if shared:
+        retrieval_stats = {**retrieval_stats, "coalesced": ["retrieval"]}
+    return result, elapsed_ms, retrieval_stats
+
+async def lookup_answer(refined_query, username, settings) -> AnswerLookup:
+    """Look the refined query up in the user's semantic answer cache."""
+    vector = await get_document_indexer().dense_embedding.aembed_query(refined_query)
+    lookup = _answer_cache.lookup(username, vector, settings)
+    metrics.increment("answer_cache_total", outcome="hit" if lookup.hit else "miss")
+    return lookup
+
+def source_summaries(documents):
+    """The `sources` entries of debug_info: file name and text of each retrieved chunk."""
+    return [{"file_name": doc.metadata["file_name"], "context": doc.page_content} for doc in documents]
+
+
+async def refine_and_retrieve(query, past_messages, no_of_chunks, username, mode, score_threshold, stats, search_options=None,
+                              on_event=None):
+    """
+    Refine the query and retrieve documents for it. With SPECULATIVE_RETRIEVAL,
+    retrieval on the raw query starts alongside refinement and its result is
+    used when the refined query matches; otherwise it is discarded and retrieval
+    runs again on the refined query. Stage timings are recorded in stats["timings"].
+
+    With ANSWER_CACHE_ENABLED the refined query is first looked up in the
+    answer cache; on a hit retrieval is skipped and the returned AnswerLookup
+    carries the cached answer. On a miss its store() caches the new answer.
+
+    `search_options` (search_type, fetch_k, mmr_lambda) select MMR reranking.
+
+    `on_event(event, payload)` is called with a "refined" event once the
+    refined query is known and a "sources" event once the documents are.
+    """
+    timings = stats.setdefault("timings", {})
+    start = time.perf_counter()
+    no_of_chunks, score_threshold = int(no_of_chunks), float(score_threshold)
+    search_options = search_options or {}
+
+    speculative = None
+    if SPECULATIVE_RETRIEVAL and past_messages:
+        speculative = asyncio.create_task(_timed_retrieval(query, no_of_chunks, username, mode, score_threshold, search_options))
+
     logger.info("Refining user query")
-    refined_query = await refine_user_query(query, past_messages)  # Async call
-    logger.info(f"Generated refined query: {refined_query}")
+    answer_lookup = None
+    try:
+        refined_query, stats["refinement"] = await refine_user_query_with_source(query, past_messages, username)
+        timings["refine_ms"] = (time.perf_counter() - start) * 1000
+        logger.info(f"Generated refined query: {refined_query}")
+        if on_event is not None:
+            on_event("refined", {"event": "refined", "refined_query": refined_query,
+                                 "refinement": stats["refinement"], "elapsed_ms": round(timings["refine_ms"], 1)})
+        if ANSWER_CACHE_ENABLED:
+            settings = (mode, no_of_chunks, score_threshold, tuple(sorted(search_options.items())))
+            answer_lookup = await lookup_answer(refined_query, username, settings)
+            stats["answer_cache"] = {"outcome": "hit" if answer_lookup.hit else "miss"}
+            timings["answer_lookup_ms"] = (time.perf_counter() - start) * 1000 - timings["refine_ms"]
+    except BaseException:
+        if speculative is not None:
+            speculative.cancel()
+        raise
+    refined_at = time.perf_counter()
+
+    if answer_lookup is not None and answer_lookup.hit is not None:
+        if speculative is not None:
+            speculative.cancel()
+        hit = answer_lookup.hit
+        stats["answer_cache"].update(similarity=round(answer_lookup.similarity, 4), cached_query=hit.refined_query)
+        logger.info(f"Answer cache hit (similarity {answer_lookup.similarity:.3f})")
+        if on_event is not None:
+            on_event("sources", {"event": "sources", "sources": source_summaries(hit.documents), "cached": True,
+                                 "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)})
+        return refined_query, hit.context, hit.documents, answer_lookup
+
+    logger.info("Retrieving documents")
+    if speculative is not None and queries_match(query, refined_query):
+        stats["speculation"] = "hit"
+        (extracted_text_data, extracted_documents), retrieve_ms, retrieval_stats = await speculative
+    else:
+        if speculative is not None:
+            stats["speculation"] = "miss"
+            speculative.cancel()
+        (extracted_text_data, extracted_documents), retrieve_ms, retrieval_stats = await _timed_retrieval(
+            refined_query, no_of_chunks, username, mode, score_threshold, search_options)
+    if speculative is not None:
+        metrics.increment("speculative_retrieval_total", outcome=stats["speculation"])
+
+    stats.update(retrieval_stats)
+    metrics.increment("context_tokens_saved_total", retrieval_stats["context"]["tokens_saved"])
+
+    # retrieve_wait_ms is the part of retrieval left on the critical path after refinement
+    timings["retrieve_ms"] = retrieve_ms
+    timings["retrieve_wait_ms"] = (time.perf_counter() - refined_at) * 1000
+    timings["speculation_saved_ms"] = max(0.0, retrieve_ms - timings["retrieve_wait_ms"])
+    if on_event is not None:
+        on_event("sources", {"event": "sources", "sources": source_summaries(extracted_documents), "cached": False,
+                             "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)})
+    return refined_query, extracted_text_data, extracted_documents, answer_lookup
+
 
-    extracted_text_data, extracted_documents = await retrieve_similar_documents(refined_query, int(no_of_chunks),username)  # Async call
+@ls.traceable(run_type="chain", name="Chat Pipeline")
+async def generate_chatbot_response(query, past_messages, no_of_chunks,username, mode, score_threshold, stats=None, search_options=None):
+    """Main function to generate chatbot responses asynchronously."""
+    stats = {} if stats is None else stats
+    pipeline_start = time.perf_counter()
+    refined_query, extracted_text_data, extracted_documents, answer_lookup = await refine_and_retrieve(
+        query, past_messages, no_of_chunks, username, mode, score_threshold, stats, search_options)  # Async call
+    if answer_lookup is not None and answer_lookup.hit is not None:
+        stats["timings"]["total_ms"] = (time.perf_counter() - pipeline_start) * 1000
+        return answer_lookup.hit.answer, 0.0, 0, 0, 0, extracted_text_data, refined_query, extracted_documents
     # logger.info(f"Extracted text data: {extracted_text_data}")
     logger.info(f"Extracted text data")
 
     
-    llm = initialize_llm()  # Synchronous initialization
-    history = create_history(past_messages)
-    logger.info(f"Created history for session: {history}")
-
-    logger.info("Fetching response")
-    start_time = time.time()
-    final_response, cb = await invoke_chain(query, extracted_text_data, history, llm)  # Async call
-    response_time = time.time() - start_time
+    final_response, response_time, cb = await complete_answer(
+        query, past_messages, username, refined_query, extracted_text_data, extracted_documents, answer_lookup, stats)
+    stats["timings"]["total_ms"] = (time.perf_counter() - pipeline_start) * 1000
 
     # logger.info(f"Got response from chain: {final_response}")
     logger.info(f"Got response from chain:")
@@ -150,18 +492,221 @@ async def generate_chatbot_response(query, past_messages, no_of_chunks,username,
     return final_response, response_time, cb.prompt_tokens, cb.completion_tokens, cb.total_tokens, extracted_text_data, refined_query, extracted_documents
 
 
+async def complete_answer(query, past_messages, username, refined_query, extracted_text_data, extracted_documents,
+                          answer_lookup, stats):
+    """Answer from the retrieved context (non-streaming); returns the answer, LLM seconds and token usage."""
+    llm = initialize_llm()  # Synchronous initialization
+    history = create_history(past_messages)
+    logger.debug("Created history for session: %s", history)
+
+    logger.info("Fetching response")
+    start_time = time.perf_counter()
+    key = completion_key(llm, query, extracted_text_data, past_messages)
+    (final_response, cb), shared = await _completion_flight.do(
+        key, lambda: invoke_chain(query, extracted_text_data, history, llm))  # Async call
+    response_time = time.perf_counter() - start_time
+    metrics.observe("llm_request_seconds", response_time, model=llm.model_name, streaming="false")
+    if shared:
+        # Tokens were spent (and the answer cached) by the request that made the call
+        stats.setdefault("coalesced", []).append("completion")
+    else:
+        if cb.completion_tokens and response_time > 0:
+            metrics.observe("llm_tokens_per_second", cb.completion_tokens / response_time, metrics.RATE_BUCKETS,
+                            model=llm.model_name)
+        record_llm_usage(username, llm.model_name, cb.prompt_tokens, cb.completion_tokens)
+    stats["timings"]["llm_ms"] = response_time * 1000
+    if answer_lookup is not None and not shared:
+        answer_lookup.store(refined_query, final_response, extracted_text_data, extracted_documents)
+    return final_response, response_time, cb
+
+
+async def generate_chatbot_responses_batch(requests, concurrency=None) -> AsyncGenerator[tuple, None]:
+    """
+    Answer many chat requests together. Each request is a dict of
+    generate_chatbot_response arguments (query, past_messages, no_of_chunks,
+    username, mode, score_threshold, search_options).
+
+    The queries are refined concurrently, the refined queries are embedded in
+    one call (the vectors serve the answer cache lookups too), the searches run
+    as one Qdrant batch query, and the completions run at most `concurrency`
+    (CHAT_BATCH_CONCURRENCY) at a time.
+
+    Yields (index, result, stats) as each request finishes; `result` is the
+    generate_chatbot_response tuple or the exception the request failed with.
+    Speculative retrieval does not apply: the batch has no latency to hide.
+    """
+    concurrency = concurrency or CHAT_BATCH_CONCURRENCY
+    batch_start = time.perf_counter()
+    indexer = get_document_indexer()
+    all_stats = [{"timings": {}, "batch": {"size": len(requests)}} for _ in requests]
+    results = [None] * len(requests)
+
+    def elapsed_ms():
+        return (time.perf_counter() - batch_start) * 1000
+
+    async def refine(request, stats):
+        # Each request of the batch queues for the LLM as its own user
+        admission_user.set(request["username"])
+        refined_query, stats["refinement"] = await refine_user_query_with_source(
+            request["query"], request["past_messages"], request["username"])
+        stats["timings"]["refine_ms"] = elapsed_ms()
+        return refined_query
+
+    refined = await asyncio.gather(*(refine(r, s) for r, s in zip(requests, all_stats)), return_exceptions=True)
+    for i, refined_query in enumerate(refined):
+        if isinstance(refined_query, BaseException):
+            results[i] = refined_query
+    pending = [i for i in range(len(requests)) if results[i] is None]
+
+    # One embedding call for every refined query of the batch
+    embed_start = time.perf_counter()
+    queries = sorted({refined[i] for i in pending})
+    try:
+        vectors = dict(zip(queries, await indexer.dense_embedding.aembed_documents(queries))) if queries else {}
+    except Exception as e:
+        vectors = {}
+        for i in pending:
+            results[i] = e
+        pending = []
+    embed_ms = (time.perf_counter() - embed_start) * 1000
+
+    lookups = {}
+    searches = []
+    for i in list(pending):
+        request, stats = requests[i], all_stats[i]
+        stats["timings"]["embed_ms"] = embed_ms
+        search_options = request.get("search_options") or {}
+        no_of_chunks, score_threshold = request["no_of_chunks"], request["score_threshold"]
+        if not isinstance(no_of_chunks, int) or no_of_chunks <= 0:
+            results[i] = ValueError(f"Invalid number of chunks: {no_of_chunks}")
+        elif request["mode"] not in RETRIEVAL_MODES:
+            results[i] = ValueError(f"Invalid retrieval mode: {request['mode']}")
+        elif score_threshold is not None and not isinstance(score_threshold, (int, float)):
+            results[i] = ValueError(f"Invalid score threshold: {score_threshold}")
+        if results[i] is not None:
+            pending.remove(i)
+            continue
+        # None (allowed by the request model) searches without a threshold
+        score_threshold = None if score_threshold is None else float(score_threshold)
+        if ANSWER_CACHE_ENABLED:
+            settings = (request["mode"], no_of_chunks, score_threshold, tuple(sorted(search_options.items())))
+            lookups[i] = _answer_cache.lookup(request["username"], vectors[refined[i]], settings)
+            metrics.increment("answer_cache_total", outcome="hit" if lookups[i].hit else "miss")
+            stats["answer_cache"] = {"outcome": "hit" if lookups[i].hit else "miss"}
+            if lookups[i].hit is not None:
+                hit = lookups[i].hit
+                stats["answer_cache"].update(similarity=round(lookups[i].similarity, 4), cached_query=hit.refined_query)
+                stats["timings"]["total_ms"] = elapsed_ms()
+                results[i] = (hit.answer, 0.0, 0, 0, 0, hit.context, refined[i], hit.documents)
+                pending.remove(i)
+                continue
+        searches.append(BatchSearch(
+            query=refined[i], top_k=no_of_chunks, username=request["username"], mode=request["mode"],
+            score_threshold=score_threshold, search_type=search_options.get("search_type", "similarity"),
+            fetch_k=search_options.get("fetch_k"), lambda_mult=search_options.get("mmr_lambda", MMR_LAMBDA),
+            dense_vector=vectors[refined[i]]))
+
+    # One Qdrant batch query per collection for every search of the batch
+    retrieve_start = time.perf_counter()
+    try:
+        found = await indexer.asearch_batch(searches) if searches else []
+    except Exception as e:
+        logger.error(f"Error retrieving documents for batch: {e}")
+        found = [e if isinstance(e, HTTPException) else RuntimeError(f"Failed to process documents: {e}")] * len(pending)
+    retrieve_ms = (time.perf_counter() - retrieve_start) * 1000
+    metrics.observe("retrieval_seconds", retrieve_ms / 1000, mode="batch", search_type="batch")
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(i, documents):
+        request, stats = requests[i], all_stats[i]
+        if isinstance(documents, BaseException):
+            return i, documents, stats
+        admission_user.set(request["username"])
+        try:
+            extracted_text_data, context_report = assemble_context(documents)
+            stats["context"] = context_report
+            stats["timings"]["retrieve_ms"] = retrieve_ms
+            metrics.increment("context_tokens_saved_total", context_report["tokens_saved"])
+            async with semaphore:
+                final_response, response_time, cb = await complete_answer(
+                    request["query"], request["past_messages"], request["username"], refined[i],
+                    extracted_text_data, documents, lookups.get(i), stats)
+            stats["timings"]["total_ms"] = elapsed_ms()
+            return i, (final_response, response_time, cb.prompt_tokens, cb.completion_tokens, cb.total_tokens,
+                       extracted_text_data, refined[i], documents), stats
+        except Exception as e:
+            return i, e, stats
+
+    tasks = [asyncio.create_task(answer(i, documents)) for i, documents in zip(pending, found)]
+    try:
+        # Failures and answer cache hits are ready before any completion
+        for i, result in enumerate(results):
+            if result is not None:
+                yield i, result, all_stats[i]
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The caller stopped early (e.g. the client went away)
+        for task in tasks:
+            task.cancel()
+
+
 @ls.traceable(run_type="chain", name="Chat Pipeline")
-async def generate_chatbot_response_stream(query, past_messages, no_of_chunks, username, mode, score_threshold):
-    logger.info("Refining user query")
-    refined_query = await refine_user_query(query, past_messages)
+async def generate_chatbot_response_stream(query, past_messages, no_of_chunks, username, mode, score_threshold, stats=None, search_options=None,
+                                           on_event=None):
+    stats = {} if stats is None else stats
+    pipeline_start = time.perf_counter()
+    refined_query, extracted_text_data, extracted_documents, answer_lookup = await refine_and_retrieve(
+        query, past_messages, no_of_chunks, username, mode, score_threshold, stats, search_options, on_event)
 
-    logger.info("Retrieving documents")
-    extracted_text_data, extracted_documents = await retrieve_similar_documents(refined_query, int(no_of_chunks), username, mode, float(score_threshold))
+    if answer_lookup is not None and answer_lookup.hit is not None:
+        async def cached_stream():
+            stats["timings"]["first_token_ms"] = (time.perf_counter() - pipeline_start) * 1000
+            yield answer_lookup.hit.answer
+            stats["timings"]["total_ms"] = (time.perf_counter() - pipeline_start) * 1000
+
+        return cached_stream(), refined_query, extracted_documents
 
     llm = initialize_llm()
     history = create_history(past_messages)
 
-    return invoke_chain_stream(query, extracted_text_data, history, llm), refined_query, extracted_documents
+    async def timed_stream():
+        first_token_at = None
+        chunks = []
+        usage = {}
+        llm_start = time.perf_counter()
+        # Identical concurrent requests follow one upstream LLM stream
+        upstream, shared = _completion_stream_flight.stream(
+            completion_key(llm, query, extracted_text_data, past_messages),
+            lambda: invoke_chain_stream(query, extracted_text_data, history, llm, usage))
+        if shared:
+            stats.setdefault("coalesced", []).append("completion")
+        async for chunk in upstream:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                # Time to first token, measured from the start of the pipeline
+                stats["timings"]["first_token_ms"] = (first_token_at - pipeline_start) * 1000
+                metrics.observe("llm_time_to_first_token_seconds", first_token_at - llm_start, model=llm.model_name)
+            chunks.append(chunk)
+            yield chunk
+        finished_at = time.perf_counter()
+        stats["timings"]["total_ms"] = (finished_at - pipeline_start) * 1000
+        metrics.observe("llm_request_seconds", finished_at - llm_start, model=llm.model_name, streaming="true")
+        if shared:
+            # Tokens were spent (and the answer cached) by the request that opened the stream
+            return
+        completion_tokens = usage.get("completion_tokens") or len(chunks)
+        if first_token_at is not None and finished_at > first_token_at:
+            # Generation rate once the first token has arrived
+            metrics.observe("llm_tokens_per_second", completion_tokens / (finished_at - first_token_at),
+                            metrics.RATE_BUCKETS, model=llm.model_name)
+        record_llm_usage(username, llm.model_name, usage.get("prompt_tokens", 0), completion_tokens)
+        # Only a completed stream is cached
+        if answer_lookup is not None:
+            answer_lookup.store(refined_query, "".join(chunks), extracted_text_data, extracted_documents)
+
+    return timed_stream(), refined_query, extracted_documents
 
 
 
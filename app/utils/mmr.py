@@ -0,0 +1,47 @@
+import os
+from typing import List
+
+import numpy as np
+
+SEARCH_TYPES = ("similarity", "mmr")
+# Candidates over-fetched from Qdrant for MMR, and the relevance/diversity trade-off
+MMR_FETCH_K = int(os.getenv("MMR_FETCH_K", 20))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", 0.5))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def mmr_select(query_vector, candidate_vectors, k: int, lambda_mult: float = MMR_LAMBDA) -> List[int]:
+    """
+    Maximal marginal relevance: greedily pick `k` candidates maximising
+    lambda * sim(query, c) - (1 - lambda) * max sim(c, already selected),
+    with cosine similarity. Returns candidate indices in selection order.
+
+    Relevance for all candidates is one matrix-vector product; each step then
+    updates the running max-similarity-to-selected with one more, so the cost
+    is O(k * n * d) rather than the O(n^2 * d) of a full similarity matrix.
+    """
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    if len(candidates) == 0 or k <= 0:
+        return []
+    candidates = _normalize(candidates)
+    query = _normalize(np.asarray(query_vector, dtype=np.float32))
+    relevance = candidates @ query
+
+    k = min(k, len(candidates))
+    selected = [int(np.argmax(relevance))]
+    redundancy = candidates @ candidates[selected[0]]
+    available = np.ones(len(candidates), dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, candidates @ candidates[best], out=redundancy)
+    return selected
@@ -1,30 +1,70 @@
 import os
+import json
 import asyncio
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
 from dotenv import load_dotenv
-from uuid import uuid4
+from uuid import NAMESPACE_URL, uuid5
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
 from langchain_openai import OpenAIEmbeddings
 from langchain_qdrant import (
     QdrantVectorStore,
     FastEmbedSparse,
     RetrievalMode,
 )
+from langchain_qdrant.sparse_embeddings import SparseEmbeddings
 from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.models import PayloadSchemaType
 
 from qdrant_client.http.models import (
-    Distance,
-    VectorParams,
     SparseVectorParams,
     SparseIndexParams,
     Filter,
     FieldCondition,
     MatchValue,
+    PointStruct,
+    SparseVector,
+    Prefetch,
+    FusionQuery,
+    Fusion,
+    IsNullCondition,
+    PayloadField,
+    PointIdsList,
+    FilterSelector,
+    SetPayload,
+    SetPayloadOperation,
+    QueryRequest,
 )
 
+from app.services import metrics
 from app.services.logger import logger
+from app.utils.admission import StageLimiter
+from app.utils.embedding_cache import CachedEmbeddings
+from app.utils.rate_limit import RateLimitedEmbeddings, retry_async
+from app.utils.db_utils import get_chunk_manifest
+from app.utils.mmr import MMR_FETCH_K, MMR_LAMBDA, SEARCH_TYPES, mmr_select
+from app.utils.vector_profiles import NATIVE_DENSE_DIMENSIONS, CollectionProfile, load_profile
+from app.utils.tenancy import (
+    TENANCY_MODE,
+    TENANCY_MODES,
+    TENANT_DEDICATED_POINTS,
+    TENANT_MIGRATION_BATCH,
+    TENANT_PAYLOAD_M,
+    TENANT_PLACEMENT_TTL,
+    TenantGate,
+    dedicated_collection_name,
+    shared_hnsw_config,
+    username_index_params,
+    wants_dedicated,
+)
+from app.utils.ingestion import CHUNK_SIZE, StreamingChunker, run_bulk_ingestion, run_ingestion, segment_separator
 
 load_dotenv(override=True)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -32,62 +72,816 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 QDRANT_DB_URL = os.getenv("qdrant_db_path", "http://localhost:6333")
 COLLECTION_NAME = os.getenv("COLLECTION_NAME", "rag_demo_collection")
 QDRANT_DB_KEY = os.getenv("QDRANT_DB_KEY", None)
+RETRIEVAL_MODES = ("dense", "sparse", "hybrid")
+# Connection pool size of the AsyncQdrantClient and cap on concurrent Qdrant calls per process
+QDRANT_POOL_SIZE = int(os.getenv("QDRANT_POOL_SIZE", 32))
+QDRANT_MAX_INFLIGHT = int(os.getenv("QDRANT_MAX_INFLIGHT", 32))
+DENSE_VECTOR_NAME = "dense"
+DENSE_EMBEDDING_MODEL = "text-embedding-3-large"
+# Dense vector layout (size, quantization, on-disk originals) selected by VECTOR_PROFILE
+DENSE_PROFILE = load_profile()
+DENSE_VECTOR_SIZE = DENSE_PROFILE.dimensions
+SPARSE_VECTOR_NAME = "sparse-vec"
+CHUNK_ID_NAMESPACE = uuid5(NAMESPACE_URL, "rag-chatbot/chunks")
+# Manifest metadata of a chunk whose write was never confirmed: indexed again as new
+UNCONFIRMED_CHUNK = ""
+
+
+def create_qdrant_client(qdrant_url: str = QDRANT_DB_URL, qdrant_api_key: str = QDRANT_DB_KEY) -> QdrantClient:
+    """
+    Create a Qdrant client. ":memory:" selects Qdrant's local in-memory mode.
+    """
+    if qdrant_url == ":memory:":
+        return QdrantClient(location=":memory:")
+    return QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+
+
+def create_async_qdrant_client(
+    qdrant_url: str = QDRANT_DB_URL,
+    qdrant_api_key: str = QDRANT_DB_KEY,
+    pool_size: int = QDRANT_POOL_SIZE,
+) -> AsyncQdrantClient:
+    """
+    Create a pooled AsyncQdrantClient. ":memory:" selects Qdrant's local in-memory mode.
+    """
+    if qdrant_url == ":memory:":
+        return AsyncQdrantClient(location=":memory:")
+    return AsyncQdrantClient(url=qdrant_url, api_key=qdrant_api_key, pool_size=pool_size)
+
+
+def dense_model_id(dimensions: int) -> str:
+    """Embedding cache identity: truncated (Matryoshka) vectors must not share entries with full ones."""
+    if dimensions == NATIVE_DENSE_DIMENSIONS:
+        return DENSE_EMBEDDING_MODEL
+    return f"{DENSE_EMBEDDING_MODEL}@{dimensions}"
+
+
+def chunk_id(username: Optional[str], file_name: str, text: str) -> str:
+    """Deterministic point id of a chunk: the same text in the same user's file always maps to the same id."""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return str(uuid5(CHUNK_ID_NAMESPACE, f"{username or ''}\x00{file_name}\x00{digest}"))
+
+
+def tenant_filter(username: str) -> Filter:
+    """Filter matching every point of one user."""
+    return Filter(must=[FieldCondition(key="metadata.username", match=MatchValue(value=username))])
+
+
+def document_filter(username: Optional[str], file_name: str) -> Filter:
+    """Filter matching every point of one user's file."""
+    user_condition = (
+        IsNullCondition(is_null=PayloadField(key="metadata.username")) if username is None
+        else FieldCondition(key="metadata.username", match=MatchValue(value=username))
+    )
+    return Filter(must=[user_condition, FieldCondition(key="metadata.file_name", match=MatchValue(value=file_name))])
+
+
+def document_from_point(point, collection_name: str = COLLECTION_NAME) -> Document:
+    """Convert a Qdrant point (LangChain payload layout) into a Document."""
+    payload = point.payload or {}
+    metadata = dict(payload.get("metadata") or {})
+    metadata["_id"] = point.id
+    metadata["_collection_name"] = collection_name
+    if getattr(point, "score", None) is not None:
+        metadata["_score"] = point.score
+    return Document(page_content=payload.get("page_content", ""), metadata=metadata)
+
+
+@dataclass
+class BatchSearch:
+    """One search of DocumentIndexer.asearch_batch; `dense_vector` may be passed in when already embedded."""
+    query: str
+    top_k: int
+    # Always applied as the tenant filter
+    username: str
+    mode: str = "dense"
+    score_threshold: Optional[float] = None
+    search_type: str = "similarity"
+    fetch_k: Optional[int] = None
+    lambda_mult: float = MMR_LAMBDA
+    dense_vector: Optional[List[float]] = None
+
+
+class ManifestDiff:
+    """
+    Chunks of one document being (re-)indexed, compared with its manifest
+    (point id -> metadata of the previous version). Counts go to `progress`.
+    """
+
+    def __init__(self, username: Optional[str], file_name: str, previous: dict, progress: dict = None):
+        self.username = username
+        self.file_name = file_name
+        self.previous = previous
+        self.current = {}
+        self.pending = set()  # ids handed to an upsert that has not succeeded yet
+        self.duplicates = 0
+        self.progress = progress if progress is not None else {}
+        self.progress.update(chunks_embedded=0, chunks_unchanged=0, chunks_moved=0)
+
+    def classify(self, doc: Document) -> Optional[str]:
+        """Point id of a chunk that must be written (new or moved), None when there is nothing to do."""
+        point_id = chunk_id(self.username, self.file_name, doc.page_content)
+        if point_id in self.current:
+            # Identical text repeated within the file collapses to one point
+            self.duplicates += 1
+            return None
+        self.current[point_id] = json.dumps(doc.metadata, sort_keys=True)
+        if self.previous.get(point_id) == self.current[point_id]:
+            self.progress["chunks_unchanged"] += 1
+            return None
+        self.pending.add(point_id)
+        return point_id
+
+    def partial_manifest(self) -> dict:
+        """Manifest of a document that failed partway: the previous version's chunks plus the confirmed new ones."""
+        return {
+            **self.previous,
+            **self.current,
+            **{point_id: UNCONFIRMED_CHUNK for point_id in self.pending},
+        }
+
+    def report(self, deleted: int) -> dict:
+        reused = self.progress["chunks_unchanged"] + self.progress["chunks_moved"]
+        return {
+            "chunks": len(self.current),
+            "embedded": self.progress["chunks_embedded"],
+            "unchanged": self.progress["chunks_unchanged"],
+            "metadata_updated": self.progress["chunks_moved"],
+            "deleted": deleted,
+            "duplicates": self.duplicates,
+            "embeddings_saved": reused,
+            "embeddings_saved_pct": round(100 * reused / len(self.current), 1) if self.current else 0.0,
+        }
+
+
+class QdrantAsyncRetriever(BaseRetriever):
+    """
+    Retriever backed by the DocumentIndexer's AsyncQdrantClient. Sync calls
+    (`invoke`) go through LangChain's QdrantVectorStore on the blocking client
+    instead.
+    """
+    indexer: Any
+    top_k: int
+    mode: str = "dense"
+    score_threshold: Optional[float] = None
+    metadata_filter: Optional[Filter] = None
+    # Routes the search to the tenant's collection
+    username: Optional[str] = None
+    search_type: str = "similarity"
+    fetch_k: Optional[int] = None
+    lambda_mult: float = MMR_LAMBDA
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        if self.search_type not in SEARCH_TYPES:
+            raise ValueError(f"Invalid search type: {self.search_type}")
+        # The async client belongs to the event loop; the cached placement is as fresh as sync code can get
+        collection_name = (self.indexer._placements.get(self.username, COLLECTION_NAME)
+                           if self.indexer.tenancy == "tiered" else COLLECTION_NAME)
+        store = self.indexer._get_vector_store(self.mode, collection_name)
+        search_params = self.indexer.profile.search_params() if self.mode != "sparse" else None
+        if self.search_type == "mmr":
+            return store.max_marginal_relevance_search(
+                query, k=self.top_k, fetch_k=max(self.fetch_k or MMR_FETCH_K, self.top_k), lambda_mult=self.lambda_mult,
+                filter=self.metadata_filter, search_params=search_params, score_threshold=self.score_threshold)
+        documents = []
+        for document, score in store.similarity_search_with_score(
+                query, k=self.top_k, filter=self.metadata_filter, search_params=search_params,
+                score_threshold=self.score_threshold):
+            document.metadata["_score"] = score
+            documents.append(document)
+        return documents
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return await self.indexer.asearch(
+            query,
+            top_k=self.top_k,
+            mode=self.mode,
+            score_threshold=self.score_threshold,
+            metadata_filter=self.metadata_filter,
+            search_type=self.search_type,
+            fetch_k=self.fetch_k,
+            lambda_mult=self.lambda_mult,
+            username=self.username,
+        )
+
+
 class DocumentIndexer:
-    def __init__(self, qdrant_url: str = QDRANT_DB_URL, qdrant_api_key:str = QDRANT_DB_KEY):
-        # Embedding functions
-        self.dense_embedding = OpenAIEmbeddings(model="text-embedding-3-large", api_key=OPENAI_API_KEY)
-        self.sparse_embedding = FastEmbedSparse(model_name="Qdrant/bm25")
-
-        # Connect in server mode (no file locks)
-        # self.client = AsyncQdrantClient(url=qdrant_url)
-        self.sync_client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+    def __init__(
+        self,
+        qdrant_url: str = QDRANT_DB_URL,
+        qdrant_api_key: str = QDRANT_DB_KEY,
+        max_inflight: int = QDRANT_MAX_INFLIGHT,
+        dense_embedding: Embeddings = None,
+        sparse_embedding: SparseEmbeddings = None,
+        profile: CollectionProfile = None,
+        tenancy: str = None,
+    ):
+        self.profile = profile or DENSE_PROFILE
+        self.tenancy = tenancy or TENANCY_MODE
+        if self.tenancy not in TENANCY_MODES:
+            raise ValueError(f"Invalid tenancy mode: {self.tenancy}")
+        dimensions = self.profile.dimensions
+        # Embedding functions (injectable, e.g. local stand-ins for benchmarks)
+        # Dense embeddings go through the content-addressed cache for both indexing and queries;
+        # cache misses are admitted by the provider rate limiter and retried with backoff
+        self.dense_embedding = CachedEmbeddings(
+            RateLimitedEmbeddings(
+                dense_embedding
+                or OpenAIEmbeddings(
+                    model=DENSE_EMBEDDING_MODEL,
+                    api_key=OPENAI_API_KEY,
+                    max_retries=0,
+                    # The API shortens text-embedding-3 vectors natively (Matryoshka truncation + renormalisation)
+                    dimensions=None if dimensions == NATIVE_DENSE_DIMENSIONS else dimensions,
+                )
+            ),
+            model_name=dense_model_id(dimensions),
+            dimensions=dimensions,
+        )
+        self.sparse_embedding = sparse_embedding or get_sparse_embedding()
+
+        # Connect in server mode (no file locks); the async client serves all request traffic
+        self.qdrant_url = qdrant_url
+        self.qdrant_api_key = qdrant_api_key
+        self.client = create_async_qdrant_client(qdrant_url, qdrant_api_key)
+        self._sync_client = None
         self.vectors = {}
+        self._vectors_lock = threading.Lock()
+
+        # Bounds the number of Qdrant requests in flight from this process, queued fairly per user
+        self._inflight = StageLimiter("qdrant", max_inflight)
+        self._started = False
+        self._start_lock = asyncio.Lock()
 
-        # Ensure the collection exists
-        self._ensure_collection()
+        # Tenants living in dedicated collections ("tiered" mode), refreshed every TENANT_PLACEMENT_TTL
+        self._placements = {}
+        self._placements_loaded_at = 0.0
+        self._tenant_gates = {}
+        self._migrations = set()
 
+    @property
+    def sync_client(self) -> QdrantClient:
+        """Blocking client, created on first use by the LangChain vector stores."""
+        if self._sync_client is None:
+            self._sync_client = create_qdrant_client(self.qdrant_url, self.qdrant_api_key)
+        return self._sync_client
 
-    def _ensure_collection(self):
-        existing = self.sync_client.get_collections().collections
-        if COLLECTION_NAME not in [c.name for c in existing]:
-            logger.info(f"Creating collection '{COLLECTION_NAME}' in Qdrant")
-            self.sync_client.create_collection(
+    async def _create_collection(self, collection_name: str, shared: bool = True):
+        """Create a collection with the dense profile, the sparse vector and payload indexes."""
+        logger.info(f"Creating collection '{collection_name}' in Qdrant with profile {self.profile}")
+        await self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config={DENSE_VECTOR_NAME: self.profile.vector_params()},
+            quantization_config=self.profile.quantization_config(),
+            sparse_vectors_config={
+                SPARSE_VECTOR_NAME: SparseVectorParams(index=SparseIndexParams(on_disk=False))
+            },
+            # A dedicated collection holds one tenant and keeps the regular global graph
+            hnsw_config=shared_hnsw_config(self.tenancy) if shared else None,
+        )
+
+        # 🔧 Create payload indexes for metadata fields
+        for field in ["metadata.username", "metadata.file_name", "metadata.doc_type"]:
+            logger.info(f"Creating payload index on '{field}'")
+            schema = PayloadSchemaType.KEYWORD
+            if field == "metadata.username" and shared:
+                schema = username_index_params(self.tenancy)
+            await self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field,
+                field_schema=schema
+            )
+
+    async def _apply_tenancy_layout(self, info):
+        """Move an existing shared collection to the tenant-optimized index and HNSW layout."""
+        if self.tenancy == "shared":
+            return
+        hnsw = info.config.hnsw_config
+        if hnsw.m != 0 or hnsw.payload_m != TENANT_PAYLOAD_M:
+            logger.info(f"Switching '{COLLECTION_NAME}' to per-tenant HNSW graphs (Qdrant rebuilds the index)")
+            await self.client.update_collection(COLLECTION_NAME, hnsw_config=shared_hnsw_config(self.tenancy))
+        index = (info.payload_schema or {}).get("metadata.username")
+        if index is None or not getattr(index.params, "is_tenant", False):
+            logger.info("Marking 'metadata.username' as the tenant index")
+            await self.client.create_payload_index(
                 collection_name=COLLECTION_NAME,
-                vectors_config={
-                    "dense": VectorParams(size=3072, distance=Distance.COSINE)
-                },
-                sparse_vectors_config={
-                    "sparse-vec": SparseVectorParams(index=SparseIndexParams(on_disk=False))
-                },
+                field_name="metadata.username",
+                field_schema=username_index_params(self.tenancy),
             )
 
-            # 🔧 Create payload indexes for metadata fields
-            for field in ["metadata.username", "metadata.file_name", "metadata.doc_type"]:
-                logger.info(f"Creating payload index on '{field}'")
-                self.sync_client.create_payload_index(
-                    collection_name=COLLECTION_NAME,
-                    field_name=field,
-                    field_schema=PayloadSchemaType.KEYWORD
-                )
+    async def _ensure_collection(self):
+        existing = [c.name for c in (await self.client.get_collections()).collections]
+        if COLLECTION_NAME not in existing:
+            await self._create_collection(COLLECTION_NAME)
+            # A new collection holds none of the chunks an existing manifest lists
+            await (await get_chunk_manifest()).clear()
         else:
             logger.info(f"Collection '{COLLECTION_NAME}' already exists")
+            info = await self.client.get_collection(COLLECTION_NAME)
+            size = info.config.params.vectors[DENSE_VECTOR_NAME].size
+            if size != self.profile.dimensions:
+                raise ValueError(
+                    f"Collection '{COLLECTION_NAME}' stores {size}-dim dense vectors but profile "
+                    f"'{self.profile.name}' produces {self.profile.dimensions}; use a new COLLECTION_NAME or re-index"
+                )
+            await self._apply_tenancy_layout(info)
+        if self.tenancy == "tiered":
+            await self._load_placements(existing)
 
-    def _get_vector_store(self, mode: str = "hybrid"):
-        # Cache one QdrantVectorStore per mode
-        if mode not in self.vectors:
+    async def start(self):
+        """
+        Ensure the collection exists and run the sparse model once so the first
+        request does not pay for model loading or collection checks.
+        """
+        if self._started:
+            return
+        async with self._start_lock:
+            if self._started:
+                return
+            await self._ensure_collection()
+            await asyncio.to_thread(self.sparse_embedding.embed_query, "warmup")
+            self._started = True
+            logger.info("DocumentIndexer warmed up")
+
+    async def close(self):
+        """Finish running tenant migrations, release the Qdrant connections and flush the embedding cache."""
+        if self._migrations:
+            await asyncio.gather(*self._migrations, return_exceptions=True)
+        self.vectors.clear()
+        self.dense_embedding.close()
+        await self.client.close()
+        if self._sync_client is not None:
+            self._sync_client.close()
+        logger.info("DocumentIndexer closed")
+
+    async def _load_placements(self, existing: List[str] = None):
+        manifest = await get_chunk_manifest()
+        placements = await manifest.placements()
+        if existing is not None:
+            # Forget tenants whose dedicated collection was dropped outside the app
+            for username in [u for u, c in placements.items() if c not in existing]:
+                logger.warning(f"Dedicated collection of tenant '{username}' is missing, routing it to the shared one")
+                await manifest.set_placement(username, None)
+                del placements[username]
+        self._placements = placements
+        self._placements_loaded_at = time.monotonic()
+
+    async def collection_for(self, username: Optional[str], fresh: bool = False) -> str:
+        """
+        Collection holding the user's points: their dedicated one in "tiered"
+        mode, else the shared one. Writers inside the tenant gate pass `fresh`
+        to bypass the placement cache, as the tenant may have moved moments ago.
+        """
+        if self.tenancy != "tiered" or username is None:
+            return COLLECTION_NAME
+        # Other workers may have migrated tenants since we last looked
+        if fresh or time.monotonic() - self._placements_loaded_at > TENANT_PLACEMENT_TTL:
+            await self._load_placements()
+        return self._placements.get(username, COLLECTION_NAME)
+
+    def _tenant_gate(self, username: Optional[str]) -> TenantGate:
+        gate = self._tenant_gates.get(username)
+        if gate is None:
+            # Only "tiered" tenants ever move, so only they need leases shared with other workers
+            gate = self._tenant_gates[username] = TenantGate(username, leases=self.tenancy == "tiered")
+        return gate
+
+    async def acount_tenant_points(self, username: str, collection_name: str = None) -> int:
+        collection_name = collection_name or await self.collection_for(username)
+        async with self._inflight:
+            result = await self.client.count(collection_name, count_filter=tenant_filter(username), exact=True)
+        return result.count
+
+    async def amove_tenant(self, username: str, dedicated: bool) -> int:
+        """
+        Move a tenant's points between the shared collection and their dedicated
+        one: copy with vectors, switch the recorded placement, then (after other
+        workers' placement caches expire) delete the source. Returns points moved.
+        """
+        await self.start()
+        target = dedicated_collection_name(COLLECTION_NAME, username) if dedicated else COLLECTION_NAME
+        async with self._tenant_gate(username).migrating():
+            source = await self.collection_for(username, fresh=True)
+            if source == target:
+                return 0
+            started = time.perf_counter()
+            existing = [c.name for c in (await self.client.get_collections()).collections]
+            if target not in existing:
+                await self._create_collection(target, shared=False)
+
+            moved, offset = 0, None
+            while True:
+                async with self._inflight:
+                    records, offset = await self.client.scroll(
+                        source,
+                        scroll_filter=tenant_filter(username),
+                        limit=TENANT_MIGRATION_BATCH,
+                        offset=offset,
+                        with_payload=True,
+                        with_vectors=True,
+                    )
+                if records:
+                    await self.aupsert_points(
+                        [PointStruct(id=r.id, vector=r.vector, payload=r.payload) for r in records], target)
+                    moved += len(records)
+                if offset is None:
+                    break
+
+            await (await get_chunk_manifest()).set_placement(username, target if dedicated else None)
+            if dedicated:
+                self._placements[username] = target
+            else:
+                self._placements.pop(username, None)
+            logger.info(f"Tenant '{username}' moved {source} -> {target}: {moved} points "
+                        f"in {time.perf_counter() - started:.2f}s")
+
+        # Searches in other workers may still read the source until their placements refresh
+        await asyncio.sleep(TENANT_PLACEMENT_TTL)
+        async with self._tenant_gate(username).migrating():
+            if dedicated:
+                async with self._inflight:
+                    await self.client.delete(
+                        collection_name=source, points_selector=FilterSelector(filter=tenant_filter(username)))
+            else:
+                await self.client.delete_collection(source)
+        return moved
+
+    async def arebalance_tenant(self, username: str) -> Optional[bool]:
+        """
+        Promote or demote one tenant according to TENANT_DEDICATED_POINTS ("tiered"
+        mode only). Returns the new placement (True = dedicated) if it changed.
+        """
+        if self.tenancy != "tiered" or username is None:
+            return None
+        collection = await self.collection_for(username)
+        dedicated = collection != COLLECTION_NAME
+        points = await self.acount_tenant_points(username, collection)
+        if wants_dedicated(points, dedicated, TENANT_DEDICATED_POINTS) == dedicated:
+            return None
+        logger.info(f"Tenant '{username}' has {points} points, moving to the "
+                    f"{'dedicated' if not dedicated else 'shared'} collection")
+        await self.amove_tenant(username, not dedicated)
+        return not dedicated
+
+    async def arebalance(self, limit: int = 10000) -> dict:
+        """
+        Check every tenant's placement: the largest tenants of the shared collection
+        (by a facet count on metadata.username) and every dedicated tenant.
+        Returns {username: dedicated} for the tenants that moved.
+        """
+        await self.start()
+        if self.tenancy != "tiered":
+            return {}
+        async with self._inflight:
+            facet = await self.client.facet(COLLECTION_NAME, key="metadata.username", limit=limit, exact=True)
+        candidates = [hit.value for hit in facet.hits if hit.count >= TENANT_DEDICATED_POINTS]
+        await self._load_placements()
+        moves = {}
+        for username in candidates + list(self._placements):
+            placement = await self.arebalance_tenant(username)
+            if placement is not None:
+                moves[username] = placement
+        return moves
+
+    def _schedule_rebalance(self, username: Optional[str]):
+        """Check the tenant's placement after an upload without holding up the response."""
+        if self.tenancy != "tiered" or username is None:
+            return
+
+        async def rebalance():
+            try:
+                await self.arebalance_tenant(username)
+            except Exception as e:
+                logger.error(f"Rebalancing tenant '{username}' failed: {e}")
+
+        task = asyncio.create_task(rebalance())
+        self._migrations.add(task)
+        task.add_done_callback(self._migrations.discard)
+
+    def _get_vector_store(self, mode: str = "hybrid", collection_name: str = COLLECTION_NAME):
+        # Cache one QdrantVectorStore per mode and collection (LangChain interop on the blocking client)
+        key = (mode, collection_name)
+        store = self.vectors.get(key)
+        if store is not None:
+            return store
+        with self._vectors_lock:
+            if key in self.vectors:
+                return self.vectors[key]
             kwargs = {
                 "client": self.sync_client,
-                "collection_name": COLLECTION_NAME,
+                "collection_name": collection_name,
                 "embedding": self.dense_embedding,
-                "vector_name": "dense",
+                "vector_name": DENSE_VECTOR_NAME,
                 "retrieval_mode": RetrievalMode[mode.upper()],
             }
             if mode in ("sparse", "hybrid"):
                 kwargs["sparse_embedding"] = self.sparse_embedding
-                kwargs["sparse_vector_name"] = "sparse-vec"
-                        
-            self.vectors[mode] = QdrantVectorStore(**kwargs)
-        return self.vectors[mode]
+                kwargs["sparse_vector_name"] = SPARSE_VECTOR_NAME
+
+            self.vectors[key] = QdrantVectorStore(**kwargs)
+            return self.vectors[key]
+
+    async def _embed_sparse(self, texts: List[str]) -> List[SparseVector]:
+        # FastEmbed runs ONNX on the CPU, keep it off the event loop
+        embeddings = await asyncio.to_thread(self.sparse_embedding.embed_documents, texts)
+        return [SparseVector(indices=e.indices, values=e.values) for e in embeddings]
+
+    async def aupsert_documents(self, docs: List[Document], ids: List[str]):
+        """Embed documents (dense + sparse) and upsert them through the async client."""
+        await self.aupsert_points(await self.aembed_points(docs, ids))
+
+    async def aembed_points(self, docs: List[Document], ids: List[str]) -> List[PointStruct]:
+        """Embed documents (dense + sparse) into Qdrant points in the LangChain payload layout."""
+        texts = [doc.page_content for doc in docs]
+        dense_vectors, sparse_vectors = await asyncio.gather(
+            self.dense_embedding.aembed_documents(texts),
+            self._embed_sparse(texts),
+        )
+        points = [
+            PointStruct(
+                id=point_id,
+                vector={DENSE_VECTOR_NAME: dense, SPARSE_VECTOR_NAME: sparse},
+                payload={"page_content": doc.page_content, "metadata": doc.metadata},
+            )
+            for point_id, doc, dense, sparse in zip(ids, docs, dense_vectors, sparse_vectors)
+        ]
+        return points
+
+    async def aupsert_points(self, points: List[PointStruct], collection_name: str = COLLECTION_NAME):
+        await self.start()
+
+        async def upsert():
+            async with self._inflight:
+                with metrics.timer("qdrant_upsert_seconds"):
+                    await self.client.upsert(collection_name=collection_name, points=points)
+
+        # Upserts are idempotent by point id, so transient failures are safe to retry
+        await retry_async(upsert, "qdrant_upsert")
+
+    async def adelete_points(self, ids: List[str], collection_name: str = COLLECTION_NAME):
+        await self.start()
+        async with self._inflight:
+            await self.client.delete(collection_name=collection_name, points_selector=PointIdsList(points=ids))
+
+    async def adelete_document(self, username: Optional[str], file_name: str):
+        """Delete every point of one user's file."""
+        await self.start()
+        collection_name = await self.collection_for(username)
+        async with self._inflight:
+            await self.client.delete(
+                collection_name=collection_name,
+                points_selector=FilterSelector(filter=document_filter(username, file_name)),
+            )
+
+    async def aset_metadata(self, updates: List[Tuple[str, dict]], collection_name: str = COLLECTION_NAME):
+        """Replace the metadata payload of existing points in one request, without re-embedding."""
+        await self.start()
+        operations = [
+            SetPayloadOperation(set_payload=SetPayload(payload={"metadata": metadata}, points=[point_id]))
+            for point_id, metadata in updates
+        ]
+        async with self._inflight:
+            await self.client.batch_update_points(collection_name=collection_name, update_operations=operations)
+
+    async def _aquery_points(
+        self,
+        top_k: int,
+        mode: str,
+        dense_vector: List[float] = None,
+        sparse_vector: SparseVector = None,
+        score_threshold: float = None,
+        metadata_filter: Filter = None,
+        with_vectors: bool = False,
+        collection_name: str = COLLECTION_NAME,
+    ):
+        await self.start()
+        query_options = {
+            "collection_name": collection_name,
+            "query_filter": metadata_filter,
+            "limit": top_k,
+            "with_payload": True,
+            "with_vectors": [DENSE_VECTOR_NAME] if with_vectors else False,
+            "score_threshold": score_threshold,
+        }
+        # Quantized profiles oversample the in-RAM quantized index and rescore with the originals
+        dense_params = self.profile.search_params()
+        if mode == "dense":
+            query_options.update(query=dense_vector, using=DENSE_VECTOR_NAME, search_params=dense_params)
+        elif mode == "sparse":
+            query_options.update(query=sparse_vector, using=SPARSE_VECTOR_NAME)
+        elif mode == "hybrid":
+            query_options.update(
+                prefetch=[
+                    Prefetch(query=dense_vector, using=DENSE_VECTOR_NAME, filter=metadata_filter, limit=top_k,
+                             params=dense_params),
+                    Prefetch(query=sparse_vector, using=SPARSE_VECTOR_NAME, filter=metadata_filter, limit=top_k),
+                ],
+                query=FusionQuery(fusion=Fusion.RRF),
+            )
+        else:
+            raise ValueError(f"Invalid retrieval mode: {mode}")
+
+        async with self._inflight:
+            with metrics.timer("qdrant_query_seconds", mode=mode):
+                result = await self.client.query_points(**query_options)
+        return result.points
+
+    async def asearch_by_vector(
+        self,
+        top_k: int,
+        mode: str = "dense",
+        dense_vector: List[float] = None,
+        sparse_vector: SparseVector = None,
+        score_threshold: float = None,
+        metadata_filter: Filter = None,
+        collection_name: str = COLLECTION_NAME,
+    ) -> List[Document]:
+        """
+        Run one 'dense', 'sparse', or 'hybrid' (RRF) query with pre-computed vectors.
+        """
+        points = await self._aquery_points(
+            top_k, mode, dense_vector, sparse_vector, score_threshold, metadata_filter, collection_name=collection_name)
+        return [document_from_point(point, collection_name) for point in points]
+
+    async def asearch_mmr_by_vector(
+        self,
+        top_k: int,
+        fetch_k: int = None,
+        lambda_mult: float = MMR_LAMBDA,
+        mode: str = "dense",
+        dense_vector: List[float] = None,
+        sparse_vector: SparseVector = None,
+        score_threshold: float = None,
+        metadata_filter: Filter = None,
+        collection_name: str = COLLECTION_NAME,
+    ) -> List[Document]:
+        """
+        Over-fetch `fetch_k` candidates with their dense vectors using the given
+        mode, then keep a diverse `top_k` by maximal marginal relevance against
+        the dense query vector.
+        """
+        fetch_k = max(fetch_k or MMR_FETCH_K, top_k)
+        points = await self._aquery_points(
+            fetch_k, mode, dense_vector, sparse_vector, score_threshold, metadata_filter,
+            with_vectors=True, collection_name=collection_name)
+        if len(points) <= 1:
+            return [document_from_point(point, collection_name) for point in points]
+
+        def select():
+            return mmr_select(dense_vector, [point.vector[DENSE_VECTOR_NAME] for point in points], top_k, lambda_mult)
+
+        # Building the candidate matrix from JSON lists is the costly part; keep it off the event loop
+        order = await asyncio.to_thread(select)
+        return [document_from_point(points[i], collection_name) for i in order]
+
+    async def asearch(
+        self,
+        query: str,
+        top_k: int,
+        mode: str = "dense",
+        score_threshold: float = None,
+        metadata_filter: Filter = None,
+        search_type: str = "similarity",
+        fetch_k: int = None,
+        lambda_mult: float = MMR_LAMBDA,
+        username: str = None,
+    ) -> List[Document]:
+        """
+        Embed the query for the requested mode and search Qdrant asynchronously,
+        in the collection holding `username`'s documents.
+        """
+        if search_type not in SEARCH_TYPES:
+            raise ValueError(f"Invalid search type: {search_type}")
+        await self.start()
+        collection_name = await self.collection_for(username)
+        dense_vector = sparse_vector = None
+        # MMR compares candidates with the dense query vector whatever the retrieval mode
+        if mode in ("dense", "hybrid") or search_type == "mmr":
+            dense_vector = await self.dense_embedding.aembed_query(query)
+        if mode in ("sparse", "hybrid"):
+            sparse_vector = (await self._embed_sparse([query]))[0]
+        if search_type == "mmr":
+            return await self.asearch_mmr_by_vector(
+                top_k=top_k,
+                fetch_k=fetch_k,
+                lambda_mult=lambda_mult,
+                mode=mode,
+                dense_vector=dense_vector,
+                sparse_vector=sparse_vector,
+                score_threshold=score_threshold,
+                metadata_filter=metadata_filter,
+                collection_name=collection_name,
+            )
+        return await self.asearch_by_vector(
+            top_k=top_k,
+            mode=mode,
+            dense_vector=dense_vector,
+            sparse_vector=sparse_vector,
+            score_threshold=score_threshold,
+            metadata_filter=metadata_filter,
+            collection_name=collection_name,
+        )
+
+    def _query_request(
+        self,
+        top_k: int,
+        mode: str,
+        dense_vector: List[float] = None,
+        sparse_vector: SparseVector = None,
+        score_threshold: float = None,
+        metadata_filter: Filter = None,
+    ) -> QueryRequest:
+        """The query of `_aquery_points` as one entry of a batch query."""
+        dense_params = self.profile.search_params()
+        request = QueryRequest(filter=metadata_filter, limit=top_k, with_payload=True, score_threshold=score_threshold)
+        if mode == "dense":
+            request.query, request.using, request.params = dense_vector, DENSE_VECTOR_NAME, dense_params
+        elif mode == "sparse":
+            request.query, request.using = sparse_vector, SPARSE_VECTOR_NAME
+        elif mode == "hybrid":
+            request.prefetch = [
+                Prefetch(query=dense_vector, using=DENSE_VECTOR_NAME, filter=metadata_filter, limit=top_k,
+                         params=dense_params),
+                Prefetch(query=sparse_vector, using=SPARSE_VECTOR_NAME, filter=metadata_filter, limit=top_k),
+            ]
+            request.query = FusionQuery(fusion=Fusion.RRF)
+        else:
+            raise ValueError(f"Invalid retrieval mode: {mode}")
+        return request
+
+    async def asearch_batch(self, searches: List[BatchSearch]) -> List[List[Document]]:
+        """
+        Run many tenant-filtered searches together: the missing dense vectors
+        are embedded in one call, the sparse ones in another, and the
+        similarity searches go to Qdrant as one batch query per collection.
+        MMR searches need the candidates' vectors and run one by one, with the
+        shared embeddings. Results are in the order of `searches`.
+        """
+        for search in searches:
+            if search.mode not in RETRIEVAL_MODES:
+                raise ValueError(f"Invalid retrieval mode: {search.mode}")
+            if search.search_type not in SEARCH_TYPES:
+                raise ValueError(f"Invalid search type: {search.search_type}")
+        await self.start()
+
+        dense_vectors = [search.dense_vector for search in searches]
+        to_embed = sorted({
+            search.query for search, vector in zip(searches, dense_vectors)
+            if vector is None and (search.mode in ("dense", "hybrid") or search.search_type == "mmr")
+        })
+        sparse_queries = sorted({search.query for search in searches if search.mode in ("sparse", "hybrid")})
+        embedded, sparse_embedded = await asyncio.gather(
+            self.dense_embedding.aembed_documents(to_embed) if to_embed else asyncio.sleep(0, []),
+            self._embed_sparse(sparse_queries) if sparse_queries else asyncio.sleep(0, []),
+        )
+        embedded = dict(zip(to_embed, embedded))
+        sparse_vectors = dict(zip(sparse_queries, sparse_embedded))
+        dense_vectors = [vector if vector is not None else embedded.get(search.query)
+                         for search, vector in zip(searches, dense_vectors)]
+
+        collections = await asyncio.gather(*(self.collection_for(search.username) for search in searches))
+        results: List[Optional[List[Document]]] = [None] * len(searches)
+        batches = {}
+        mmr_searches = []
+        for i, (search, collection_name) in enumerate(zip(searches, collections)):
+            if search.search_type == "mmr":
+                mmr_searches.append(i)
+            else:
+                batches.setdefault(collection_name, []).append(i)
+
+        async def query_batch(collection_name: str, indexes: List[int]):
+            requests = [
+                self._query_request(
+                    searches[i].top_k, searches[i].mode, dense_vectors[i], sparse_vectors.get(searches[i].query),
+                    searches[i].score_threshold, tenant_filter(searches[i].username))
+                for i in indexes
+            ]
+            async with self._inflight:
+                with metrics.timer("qdrant_query_seconds", mode="batch"):
+                    responses = await self.client.query_batch_points(collection_name=collection_name, requests=requests)
+            for i, response in zip(indexes, responses):
+                results[i] = [document_from_point(point, collection_name) for point in response.points]
+
+        async def query_mmr(i: int):
+            search = searches[i]
+            results[i] = await self.asearch_mmr_by_vector(
+                top_k=search.top_k,
+                fetch_k=search.fetch_k,
+                lambda_mult=search.lambda_mult,
+                mode=search.mode,
+                dense_vector=dense_vectors[i],
+                sparse_vector=sparse_vectors.get(search.query),
+                score_threshold=search.score_threshold,
+                metadata_filter=tenant_filter(search.username),
+                collection_name=collections[i],
+            )
+
+        await asyncio.gather(*(query_batch(name, indexes) for name, indexes in batches.items()),
+                             *(query_mmr(i) for i in mmr_searches))
+        metrics.increment("qdrant_batch_searches_total", len(searches))
+        return results
 
     async def index_in_qdrantdb(
         self,
@@ -101,11 +895,6 @@ class DocumentIndexer:
         Index extracted text using dense + sparse embeddings.
         """
         try:
-            doc = Document(
-                page_content=extracted_text,
-                metadata={"file_name": file_name, "doc_type": doc_type, "username": username},
-            )
-
             # Dynamic chunk sizing
             length = len(extracted_text)
             if not chunk_size:
@@ -117,44 +906,211 @@ class DocumentIndexer:
                     chunk_size = 2000
                 logger.info(f"Using chunk size: {chunk_size}")
 
-            splitter = RecursiveCharacterTextSplitter(
-                separators=["\n\n", "\n", ".", ","],
-                chunk_size=chunk_size,
-                chunk_overlap=200,
-            )
-            docs = splitter.split_documents([doc])
-            ids = [str(uuid4()) for _ in docs]
-
-            store = self._get_vector_store(mode="hybrid")
-            await store.aadd_documents(documents=docs, ids=ids, batch_size=5)
+            async def single_segment():
+                yield extracted_text, {}
 
-            logger.info("Successfully indexed documents in QdrantDB")
+            # Same chunks as a one-shot split, embedded in token-sized concurrent batches
+            await self.index_segments(single_segment(), file_name, doc_type, chunk_size, username)
             return True
         except Exception as e:
             logger.error(f"Error indexing documents: {e}")
             raise
 
+    async def _manifest_diff(self, username: Optional[str], file_name: str, progress: dict = None) -> ManifestDiff:
+        manifest = await get_chunk_manifest()
+        previous = await manifest.get(username or "", file_name)
+        if previous is None:
+            # No manifest yet: clear points left by uploads that used random ids
+            await self.adelete_document(username, file_name)
+            previous = {}
+        return ManifestDiff(username, file_name, previous, progress)
+
+    async def _upsert_changes(self, diffs: List[ManifestDiff], docs: List[Document], collection_name: str):
+        """Embed and upsert the new chunks among `docs` and update the metadata of moved ones, in one go for all documents."""
+        by_file = {diff.file_name: diff for diff in diffs}
+        fresh, fresh_ids, moved, owners, moved_owners = [], [], [], [], []
+        for doc in docs:
+            diff = by_file[doc.metadata["file_name"]]
+            point_id = diff.classify(doc)
+            if point_id is None:
+                continue
+            if diff.previous.get(point_id) in (None, UNCONFIRMED_CHUNK):
+                fresh.append(doc)
+                fresh_ids.append(point_id)
+                owners.append(diff)
+            else:
+                moved.append((point_id, doc.metadata))
+                moved_owners.append(diff)
+                diff.progress["chunks_moved"] += 1
+        if fresh:
+            points = await self.aembed_points(fresh, fresh_ids)
+            await self.aupsert_points(points, collection_name)
+            for diff, point_id in zip(owners, fresh_ids):
+                diff.progress["chunks_embedded"] += 1
+                diff.pending.discard(point_id)
+        if moved:
+            await retry_async(lambda: self.aset_metadata(moved, collection_name), "qdrant_set_payload")
+            for diff, (point_id, _) in zip(moved_owners, moved):
+                diff.pending.discard(point_id)
+
+    async def _finish_document(self, diff: ManifestDiff, collection_name: str) -> dict:
+        """Delete the chunks missing from the new version, save its manifest and return the incremental stats."""
+        removed = [point_id for point_id in diff.previous if point_id not in diff.current]
+        if removed:
+            await retry_async(lambda: self.adelete_points(removed, collection_name), "qdrant_delete")
+        manifest = await get_chunk_manifest()
+        await manifest.replace(diff.username or "", diff.file_name, diff.current)
+        return diff.report(len(removed))
+
+    async def _keep_partial_document(self, diff: ManifestDiff):
+        """
+        Manifest of a document that failed partway: the chunks written before
+        the failure are recorded next to the previous version's, which stay in
+        place, so a retry neither re-embeds them nor leaves them orphaned.
+        Chunks whose upsert failed are recorded as unconfirmed and indexed
+        again on the next upload.
+        """
+        if diff.current:
+            manifest = await get_chunk_manifest()
+            await manifest.replace(diff.username or "", diff.file_name, diff.partial_manifest())
+
+    async def index_segments(
+        self,
+        segments: AsyncIterator[Tuple[str, dict]],
+        file_name: str,
+        doc_type: str,
+        chunk_size: int = None,
+        username: str = None,
+        progress: dict = None,
+    ) -> dict:
+        """
+        Stream (text, metadata) segments through chunking, embedding and upserts
+        with bounded buffers; returns ingestion stats.
+
+        Chunk ids are derived from (username, file_name, chunk text) and checked
+        against the document's manifest: unchanged chunks are skipped, chunks
+        that only moved get their metadata updated, and chunks missing from the
+        new version are deleted once the upload succeeds. An upload that fails
+        partway keeps the previous version and records the chunks it wrote.
+        """
+        try:
+            # Writers hold the tenant's gate so a migration never copies a half-written document
+            async with self._tenant_gate(username).writing():
+                collection_name = await self.collection_for(username, fresh=True)
+                chunker = StreamingChunker(
+                    metadata={"file_name": file_name, "doc_type": doc_type, "username": username},
+                    chunk_size=chunk_size or CHUNK_SIZE,
+                    segment_separator=segment_separator(doc_type),
+                )
+
+                progress = progress if progress is not None else {}
+                diff = await self._manifest_diff(username, file_name, progress)
+
+                async def upsert(docs):
+                    await self._upsert_changes([diff], docs, collection_name)
+
+                try:
+                    stats = await run_ingestion(segments, chunker, upsert, progress=progress)
+                except BaseException:
+                    # Batches already upserted stay in Qdrant: record them so a retry reuses them
+                    await asyncio.shield(self._keep_partial_document(diff))
+                    raise
+                stats["incremental"] = await self._finish_document(diff, collection_name)
+            logger.info(f"Successfully indexed documents in QdrantDB: {stats['incremental']}")
+            self._schedule_rebalance(username)
+            return stats
+        except Exception as e:
+            logger.error(f"Error indexing documents: {e}")
+            raise
+
+    async def index_documents_bulk(
+        self,
+        sources: List[Tuple[str, str, Callable[[], AsyncIterator[Tuple[str, dict]]]]],
+        chunk_size: int = None,
+        username: str = None,
+    ) -> Tuple[List[dict], dict]:
+        """
+        Index many documents of one user together. `sources` are (file_name,
+        doc_type, open segments) triples; the documents are extracted in
+        parallel and their chunks share one stream of embedding/upsert
+        batches (see run_bulk_ingestion). Each document keeps the incremental
+        re-indexing of index_segments. One that fails to extract keeps its
+        previous version, and the chunks it produced before failing are added
+        to its manifest; so does every document when an upsert fails. Returns
+        per-document results and overall stats.
+        """
+        try:
+            async with self._tenant_gate(username).writing():
+                collection_name = await self.collection_for(username, fresh=True)
+                diffs = [await self._manifest_diff(username, file_name) for file_name, _, _ in sources]
+                chunkers = [
+                    StreamingChunker(
+                        metadata={"file_name": file_name, "doc_type": doc_type, "username": username},
+                        chunk_size=chunk_size or CHUNK_SIZE,
+                        segment_separator=segment_separator(doc_type),
+                    )
+                    for file_name, doc_type, _ in sources
+                ]
+
+                async def upsert(docs):
+                    await self._upsert_changes(diffs, docs, collection_name)
+
+                try:
+                    results, stats = await run_bulk_ingestion(
+                        [(file_name, open_segments, chunker)
+                         for (file_name, _, open_segments), chunker in zip(sources, chunkers)],
+                        upsert,
+                    )
+                except BaseException:
+                    # A failed upsert stops every document: keep what each one already wrote
+                    for diff in diffs:
+                        await asyncio.shield(self._keep_partial_document(diff))
+                    raise
+                for result, diff in zip(results, diffs):
+                    if result["status"] == "failed":
+                        await self._keep_partial_document(diff)
+                        continue
+                    result["incremental"] = await self._finish_document(diff, collection_name)
+                    result["status"] = "indexed"
+                stats["embedded"] = sum(diff.progress["chunks_embedded"] for diff in diffs)
+            logger.info(f"Successfully bulk indexed {len(sources) - stats['failed']} documents in QdrantDB")
+            self._schedule_rebalance(username)
+            return results, stats
+        except Exception as e:
+            logger.error(f"Error bulk indexing documents: {e}")
+            raise
+
     async def get_retriever(
         self,
         top_k: int,
         mode: str = "hybrid",
         score_threshold: float = None,
         metadata_filter: Filter = None,
+        search_type: str = "similarity",
+        fetch_k: int = None,
+        lambda_mult: float = MMR_LAMBDA,
+        username: str = None,
     ):
         """
-        Retrieve with 'dense', 'sparse', or 'hybrid' mode.
+        Retrieve with 'dense', 'sparse', or 'hybrid' mode, ranked by plain
+        'similarity' or diversified with 'mmr' over `fetch_k` candidates.
+        `username` routes the search to that tenant's collection.
         """
         try:
-            store = self._get_vector_store(mode=mode)
-            search_kwargs = {"k": top_k}
-            if score_threshold is not None:
-                search_kwargs["score_threshold"] = score_threshold
-            if metadata_filter is not None:
-                search_kwargs["filter"] = metadata_filter
-
-            return store.as_retriever(
-                search_type="similarity",
-                search_kwargs=search_kwargs,
+            if mode not in RETRIEVAL_MODES:
+                raise ValueError(f"Invalid retrieval mode: {mode}")
+            if search_type not in SEARCH_TYPES:
+                raise ValueError(f"Invalid search type: {search_type}")
+            return QdrantAsyncRetriever(
+                indexer=self,
+                top_k=top_k,
+                mode=mode,
+                score_threshold=score_threshold,
+                metadata_filter=metadata_filter,
+                search_type=search_type,
+                fetch_k=fetch_k,
+                lambda_mult=lambda_mult,
+                username=username,
             )
         except Exception as e:
             logger.error(f"Error creating retriever: {e}")
@@ -166,18 +1122,66 @@ class DocumentIndexer:
         top_k: int,
         mode: str = "dense",
         score_threshold: float = None,
+        search_type: str = "similarity",
+        fetch_k: int = None,
+        lambda_mult: float = MMR_LAMBDA,
     ):
         """
         Retrieve only documents matching the given username.
         """
-        filter_ = Filter(
-            must=[
-                FieldCondition(key="metadata.username", match=MatchValue(value=username))
-            ]
-        )
         return await self.get_retriever(
             top_k=top_k,
             mode=mode,
             score_threshold=score_threshold,
-            metadata_filter=filter_,
+            metadata_filter=tenant_filter(username),
+            search_type=search_type,
+            fetch_k=fetch_k,
+            lambda_mult=lambda_mult,
+            username=username,
         )
+
+
+# Process-wide indexer shared by all requests, created in the FastAPI lifespan
+_document_indexer: Optional[DocumentIndexer] = None
+_document_indexer_lock = threading.Lock()
+_sparse_embedding: Optional[SparseEmbeddings] = None
+_sparse_embedding_lock = threading.Lock()
+
+
+def get_sparse_embedding() -> SparseEmbeddings:
+    """
+    The process-wide BM25 model. It holds no connections or threads, so a
+    launcher may load it before forking workers (see preload_models in
+    app/main.py) and every worker shares the loaded pages.
+    """
+    global _sparse_embedding
+    if _sparse_embedding is None:
+        with _sparse_embedding_lock:
+            if _sparse_embedding is None:
+                _sparse_embedding = FastEmbedSparse(model_name="Qdrant/bm25")
+    return _sparse_embedding
+
+
+def get_document_indexer() -> DocumentIndexer:
+    """Return the shared DocumentIndexer, creating it lazily if startup did not."""
+    global _document_indexer
+    if _document_indexer is None:
+        with _document_indexer_lock:
+            if _document_indexer is None:
+                _document_indexer = DocumentIndexer(QDRANT_DB_URL, QDRANT_DB_KEY)
+    return _document_indexer
+
+
+async def init_document_indexer() -> DocumentIndexer:
+    """Create and warm up the shared DocumentIndexer (idempotent)."""
+    indexer = await asyncio.to_thread(get_document_indexer)
+    await indexer.start()
+    return indexer
+
+
+async def close_document_indexer():
+    """Close the shared DocumentIndexer on shutdown."""
+    global _document_indexer
+    indexer, _document_indexer = _document_indexer, None
+    if indexer is not None:
+        await indexer.close()
@@ -0,0 +1,202 @@
+import os
+import time
+import random
+import asyncio
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+import httpx
+from langchain_core.embeddings import Embeddings
+
+from app.services import metrics
+from app.services.logger import logger
+from app.utils.admission import get_limiter
+from app.utils.context_utils import count_tokens
+
+# Per-process limits for the embedding provider (0 disables a limit)
+EMBEDDING_TPM = int(os.getenv("EMBEDDING_TPM", 1_000_000))
+EMBEDDING_RPM = int(os.getenv("EMBEDDING_RPM", 3000))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 6))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 0.5))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 30))
+
+T = TypeVar("T")
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter on tokens per minute and requests per minute. Both
+    buckets start full and refill continuously; callers wait in FIFO order.
+    `pause()` stops all callers, e.g. after the provider answered 429.
+    """
+
+    def __init__(self, tokens_per_minute: int = EMBEDDING_TPM, requests_per_minute: int = EMBEDDING_RPM):
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self._tokens = float(tokens_per_minute)
+        self._requests = float(requests_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+
+    def _wait_time(self, now: float, tokens: int) -> float:
+        wait = self._paused_until - now
+        if self.tokens_per_minute and self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+        if self.requests_per_minute and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+        return wait
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """Wait until one request of `tokens` tokens fits in both budgets; returns the seconds waited."""
+        if self.tokens_per_minute:
+            # A request larger than the whole budget can only ever run on a full bucket
+            tokens = min(tokens, self.tokens_per_minute)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._wait_time(now, tokens)
+                if wait <= 0:
+                    break
+                waited += wait
+                await asyncio.sleep(wait)
+            self._tokens -= tokens
+            self._requests -= 1
+        if waited:
+            metrics.increment("rate_limiter_wait_seconds_total", waited)
+        return waited
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Throttling, server-side and transport errors are worth retrying; client errors are not."""
+    status = _status_code(exc)
+    if status is not None:
+        return status in (408, 429) or status >= 500
+    if isinstance(exc, (httpx.TransportError, ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    if type(exc).__name__ in ("APIConnectionError", "APITimeoutError"):
+        return True
+    # Qdrant and OpenAI wrap the underlying transport error
+    cause = getattr(exc, "source", None) or exc.__cause__
+    return cause is not None and cause is not exc and is_retryable(cause)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds requested by a Retry-After header, if the error carries one."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+async def retry_async(
+    call: Callable[[], Awaitable[T]],
+    name: str,
+    max_retries: int = EMBEDDING_MAX_RETRIES,
+    limiter: Optional[RateLimiter] = None,
+) -> T:
+    """
+    Await `call()` and retry retryable errors with jittered exponential backoff,
+    honouring Retry-After. A 429 also pauses `limiter` so concurrent callers
+    back off together instead of each hitting the limit.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = max(backoff_delay(attempt), retry_after(e) or 0)
+            if limiter is not None and _status_code(e) == 429:
+                limiter.pause(delay)
+            attempt += 1
+            metrics.increment("retries_total", operation=name)
+            logger.warning(f"{name} failed ({e}); retry {attempt}/{max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """
+    Wraps an embedder so every async provider call is admitted by a shared
+    RateLimiter and retried on throttling or transient errors. Blocking calls
+    are only retried.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        limiter: Optional[RateLimiter] = None,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+    ):
+        self.embeddings = embeddings
+        self.limiter = limiter or RateLimiter()
+        self.max_retries = max_retries
+
+    def _retry_sync(self, call: Callable[[], T]) -> T:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return call()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                metrics.increment("retries_total", operation="embedding")
+                time.sleep(max(backoff_delay(attempt), retry_after(e) or 0))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._retry_sync(lambda: self.embeddings.embed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._retry_sync(lambda: self.embeddings.embed_query(text))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        tokens = sum(count_tokens(text) for text in texts)
+
+        async def call():
+            await self.limiter.acquire(tokens)
+            with metrics.timer("embedding_request_seconds", operation="documents"):
+                vectors = await self.embeddings.aembed_documents(texts)
+            metrics.increment("embedding_tokens_total", tokens)
+            return vectors
+
+        # Admitted once per call, outside the retries: a local 429 is not the provider throttling
+        async with get_limiter("embedding"):
+            return await retry_async(call, "embedding", self.max_retries, self.limiter)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        tokens = count_tokens(text)
+
+        async def call():
+            await self.limiter.acquire(tokens)
+            with metrics.timer("embedding_request_seconds", operation="query"):
+                vector = await self.embeddings.aembed_query(text)
+            metrics.increment("embedding_tokens_total", tokens)
+            return vector
+
+        async with get_limiter("embedding"):
+            return await retry_async(call, "embedding", self.max_retries, self.limiter)
@@ -0,0 +1,144 @@
+import os
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Tuple
+
+from app.services import metrics
+
+# Concurrent calls of a pipeline stage with identical inputs share one in-flight call
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT", "true").lower() == "true"
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _Broadcast:
+    __slots__ = ("key", "task", "chunks", "done", "error", "changed", "subscribers")
+
+    def __init__(self, key):
+        self.key = key
+        self.task = None
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Event()
+        self.subscribers = 0
+
+    def notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # Nobody may be left waiting; keep asyncio from logging "exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent work of one pipeline stage. The first caller with
+    a key starts the work in its own task; callers arriving while it runs
+    await the same task instead of repeating it. The task is cancelled only
+    when every caller waiting on it has been cancelled, so one client going
+    away does not fail the others; a cancelled call is forgotten at once, and
+    followers it was cancelled under start it again. Results are shared, not
+    copied: callers must treat them as read-only.
+
+    Outcomes are counted in single_flight_total{stage, outcome=leader|coalesced}.
+    """
+
+    def __init__(self, stage: str, enabled: bool = None):
+        self.stage = stage
+        self.enabled = SINGLE_FLIGHT_ENABLED if enabled is None else enabled
+        self._calls: Dict[Hashable, _Call] = {}
+        self._streams: Dict[Hashable, _Broadcast] = {}
+
+    def _count(self, shared: bool):
+        metrics.increment("single_flight_total", stage=self.stage, outcome="coalesced" if shared else "leader")
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Result of `fn()`, run once for all concurrent callers with `key`; the flag is True for followers."""
+        if not self.enabled:
+            return await fn(), False
+        while True:
+            call = self._calls.get(key)
+            shared = call is not None
+            if not shared:
+                call = self._calls[key] = _Call(asyncio.ensure_future(fn()))
+                call.task.add_done_callback(lambda task, call=call: self._forget(self._calls, key, call))
+                call.task.add_done_callback(_retrieve_exception)
+            self._count(shared)
+            call.waiters += 1
+            try:
+                # Unlike awaiting the task, wait() tells this caller's cancellation apart from the call's
+                await asyncio.wait((call.task,))
+            finally:
+                call.waiters -= 1
+                if call.waiters == 0 and not call.task.done():
+                    # Forget the call before it winds down, so a caller arriving meanwhile starts a fresh one
+                    self._forget(self._calls, key, call)
+                    call.task.cancel()
+            if not (shared and call.task.cancelled()):
+                return call.task.result(), shared
+            # The call was cancelled under a follower that was not: run it again
+
+    def stream(self, key: Hashable, factory: Callable[[], AsyncIterator[Any]]) -> Tuple[AsyncIterator[Any], bool]:
+        """
+        Fan one upstream stream out to all concurrent callers with `key`. Each
+        caller gets its own iterator that replays the items produced so far
+        and then follows the live stream. The flag is True for followers.
+        """
+        if not self.enabled:
+            return factory(), False
+        broadcast = self._streams.get(key)
+        shared = broadcast is not None
+        if not shared:
+            broadcast = self._streams[key] = _Broadcast(key)
+            broadcast.task = asyncio.ensure_future(self._pump(key, broadcast, factory))
+        self._count(shared)
+        return self._subscribe(broadcast), shared
+
+    async def _pump(self, key, broadcast: _Broadcast, factory):
+        try:
+            async for item in factory():
+                broadcast.chunks.append(item)
+                broadcast.notify()
+        except asyncio.CancelledError as e:
+            broadcast.error = e
+            raise
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            broadcast.done = True
+            broadcast.notify()
+            self._forget(self._streams, key, broadcast)
+
+    async def _subscribe(self, broadcast: _Broadcast):
+        broadcast.subscribers += 1
+        position = 0
+        try:
+            while True:
+                while position < len(broadcast.chunks):
+                    yield broadcast.chunks[position]
+                    position += 1
+                if broadcast.done:
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+                await broadcast.changed.wait()
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.done:
+                self._forget(self._streams, broadcast.key, broadcast)
+                broadcast.task.cancel()
+
+    @staticmethod
+    def _forget(registry: dict, key, entry):
+        # A finished entry may already have been replaced by a newer call with the same key
+        if registry.get(key) is entry:
+            del registry[key]
@@ -0,0 +1,85 @@
+import os
+import json
+import asyncio
+from typing import AsyncIterator
+
+# Answer chunks are merged until this many characters are buffered...
+STREAM_COALESCE_CHARS = int(os.getenv("STREAM_COALESCE_CHARS", 64))
+# ...or this many milliseconds have passed since the first buffered one (0 sends every chunk as it arrives)
+STREAM_COALESCE_MS = float(os.getenv("STREAM_COALESCE_MS", 40))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+
+
+def wants_sse(accept: str) -> bool:
+    """Server-sent events are opt-in through the Accept header; NDJSON stays the default."""
+    return SSE_MEDIA_TYPE in (accept or "")
+
+
+def encode_event(event: str, payload: dict, sse: bool = False) -> str:
+    """One stream frame: a JSON line, or an SSE message named `event` carrying the same JSON."""
+    data = json.dumps(payload, ensure_ascii=False)
+    if sse:
+        return f"event: {event}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+async def _next(iterator):
+    try:
+        return True, await iterator.__anext__()
+    except StopAsyncIteration:
+        return False, None
+
+
+async def coalesce_chunks(stream, max_chars: int = None, max_delay: float = None) -> AsyncIterator[str]:
+    """
+    Merge the chunks of `stream` into fewer, larger ones. The first chunk is
+    passed through at once so time to first token is unchanged; after that a
+    merged chunk is emitted once it holds `max_chars` characters or its first
+    part has waited `max_delay` seconds, whichever comes first. Both default
+    to STREAM_COALESCE_CHARS and STREAM_COALESCE_MS.
+    """
+    max_chars = STREAM_COALESCE_CHARS if max_chars is None else max_chars
+    max_delay = STREAM_COALESCE_MS / 1000 if max_delay is None else max_delay
+    if max_chars <= 0 or max_delay <= 0:
+        async for chunk in stream:
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = stream.__aiter__()
+    buffer, size, deadline = [], 0, None
+    pending = None
+    first = True
+    try:
+        while True:
+            if pending is None:
+                # Awaited through a task so a window can expire without cancelling the read
+                pending = asyncio.ensure_future(_next(iterator))
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            done, _ = await asyncio.wait((pending,), timeout=timeout)
+            if not done:
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+                continue
+            more, chunk = pending.result()
+            pending = None
+            if not more:
+                break
+            if first:
+                first = False
+                yield chunk
+                continue
+            buffer.append(chunk)
+            size += len(chunk)
+            if deadline is None:
+                deadline = loop.time() + max_delay
+            if size >= max_chars:
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
@@ -0,0 +1,148 @@
+import os
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from typing import Optional
+from uuid import uuid4
+
+from qdrant_client.http.models import HnswConfigDiff, KeywordIndexParams, KeywordIndexType
+
+# "shared": one collection, plain username index (the original layout)
+# "payload": one collection with a tenant-optimized username index and per-tenant HNSW graphs
+# "tiered": "payload" plus dedicated collections for tenants above TENANT_DEDICATED_POINTS
+TENANCY_MODES = ("shared", "payload", "tiered")
+TENANCY_MODE = os.getenv("TENANCY_MODE", "shared").lower()
+# Points at which a tenant is promoted to its own collection, and demoted again below a quarter of it
+TENANT_DEDICATED_POINTS = int(os.getenv("TENANT_DEDICATED_POINTS", 50000))
+# Edges per node of the per-tenant HNSW graphs built in the shared collection
+TENANT_PAYLOAD_M = int(os.getenv("TENANT_PAYLOAD_M", 16))
+# Seconds workers may keep routing a tenant to its old collection after a migration
+TENANT_PLACEMENT_TTL = float(os.getenv("TENANT_PLACEMENT_TTL", 5))
+TENANT_MIGRATION_BATCH = int(os.getenv("TENANT_MIGRATION_BATCH", 256))
+# Seconds a worker's claim on a tenant (upload or migration) outlives its last renewal, e.g. after a crash
+TENANT_LEASE_TTL = float(os.getenv("TENANT_LEASE_TTL", 30))
+# Seconds between two attempts to claim a tenant held by another worker process
+TENANT_LEASE_POLL = 0.2
+
+if TENANCY_MODE not in TENANCY_MODES:
+    raise ValueError(f"Unknown TENANCY_MODE '{TENANCY_MODE}', expected one of {TENANCY_MODES}")
+
+
+def username_index_params(mode: str):
+    """Schema of the metadata.username payload index for the shared collection."""
+    if mode == "shared":
+        return KeywordIndexParams(type=KeywordIndexType.KEYWORD)
+    # Qdrant co-locates each tenant's points on disk and plans filtered searches per tenant
+    return KeywordIndexParams(type=KeywordIndexType.KEYWORD, is_tenant=True)
+
+
+def shared_hnsw_config(mode: str) -> Optional[HnswConfigDiff]:
+    """
+    HNSW layout of the shared collection. Tenant modes skip the global graph
+    (m=0) and build one graph per username instead, so a filtered search walks
+    only its tenant's graph; unfiltered searches fall back to a full scan.
+    """
+    if mode == "shared":
+        return None
+    return HnswConfigDiff(m=0, payload_m=TENANT_PAYLOAD_M)
+
+
+def dedicated_collection_name(base: str, username: str) -> str:
+    """Collection of a promoted tenant; hashed because usernames are not valid collection names."""
+    return f"{base}__tenant_{hashlib.sha256(username.encode('utf-8')).hexdigest()[:16]}"
+
+
+def wants_dedicated(points: int, dedicated: bool, threshold: int = TENANT_DEDICATED_POINTS) -> bool:
+    """Placement with hysteresis, so a tenant near the threshold does not bounce between collections."""
+    if dedicated:
+        return points >= threshold // 4
+    return points >= threshold
+
+
+class TenantGate:
+    """
+    Per-tenant gate: any number of writers, or one migration. Writers wait
+    while the tenant is being moved and a migration waits for running writers,
+    so no chunk lands in the collection being emptied. Within one worker
+    process the tasks wait on a condition; with `leases`, the gate also holds
+    a lease in the manifest database (renewed while held), so writers and
+    migrations of different worker processes exclude each other as well.
+    Writers must look up the tenant's collection after entering the gate.
+    """
+
+    def __init__(self, username: Optional[str] = None, leases: bool = False):
+        self.username = username or ""
+        self.leases = leases
+        self._writers = 0
+        self._migrating = False
+        self._changed = asyncio.Condition()
+
+    @asynccontextmanager
+    async def _lease(self, kind: str):
+        if not self.leases:
+            yield
+            return
+        from app.utils.db_utils import get_chunk_manifest
+
+        manifest = await get_chunk_manifest()
+        holder = uuid4().hex
+        renewal = None
+        try:
+            while not await manifest.acquire_tenant_lease(self.username, holder, kind, TENANT_LEASE_TTL):
+                await asyncio.sleep(TENANT_LEASE_POLL)
+            renewal = asyncio.create_task(self._renew(manifest, holder))
+            yield
+        finally:
+            if renewal is not None:
+                renewal.cancel()
+            # Also withdraws a migration still waiting for writers
+            await asyncio.shield(manifest.release_tenant_lease(self.username, holder))
+
+    async def _renew(self, manifest, holder: str):
+        while True:
+            await asyncio.sleep(TENANT_LEASE_TTL / 3)
+            await manifest.renew_tenant_lease(self.username, holder, TENANT_LEASE_TTL)
+
+    @asynccontextmanager
+    async def writing(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: not self._migrating)
+            self._writers += 1
+        try:
+            async with self._lease("write"):
+                yield
+        finally:
+            async with self._changed:
+                self._writers -= 1
+                self._changed.notify_all()
+
+    @asynccontextmanager
+    async def migrating(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: not self._migrating and self._writers == 0)
+            self._migrating = True
+        try:
+            async with self._lease("migrate"):
+                yield
+        finally:
+            async with self._changed:
+                self._migrating = False
+                self._changed.notify_all()
+
+
+async def _rebalance_all():
+    from app.utils.db_utils import close_chunk_manifest
+    from app.utils.qdrant_utils import DocumentIndexer
+
+    indexer = DocumentIndexer(tenancy="tiered")
+    try:
+        moves = await indexer.arebalance()
+        print(f"Moved {len(moves)} tenants: {moves}")
+    finally:
+        await indexer.close()
+        await close_chunk_manifest()
+
+
+if __name__ == "__main__":
+    # One-off placement pass, e.g. after switching an existing deployment to TENANCY_MODE=tiered
+    asyncio.run(_rebalance_all())
@@ -1,8 +1,242 @@
 import io
-import PyPDF2  
+import os
+import tarfile
+import zipfile
+import codecs
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import PyPDF2
 from docx import Document
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
 from fastapi import  HTTPException
 import asyncio
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple, Union
+from app.services.logger import logger
+
+# Size of the blocks read from plain-text uploads
+TXT_READ_SIZE = 64 * 1024
+# DOCX paragraphs are grouped into segments of roughly this many characters
+DOCX_SEGMENT_CHARS = 8 * 1024
+# PDFs with at least this many pages are extracted in page ranges on a process pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 64))
+# Pages per shard; 0 sizes shards so each worker gets about two (every shard re-parses the file)
+PDF_SHARD_PAGES = int(os.getenv("PDF_SHARD_PAGES", 0))
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+
+# Bulk uploads: archives are expanded into their members, up to BULK_MAX_FILES files of BULK_MAX_FILE_MB each
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", 5000))
+BULK_MAX_FILE_MB = float(os.getenv("BULK_MAX_FILE_MB", 100))
+
+FileSource = Union[bytes, BinaryIO]
+SUPPORTED_FILE_TYPES = ("txt", "pdf", "docx")
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def _as_stream(file_content: FileSource) -> BinaryIO:
+    if isinstance(file_content, (bytes, bytearray)):
+        return io.BytesIO(file_content)
+    file_content.seek(0)
+    return file_content
+
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info(f"PDF extraction pool started with {PDF_EXTRACT_WORKERS} processes")
+    return _pdf_pool
+
+
+def shutdown_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is not None:
+            _pdf_pool.shutdown(cancel_futures=True)
+            _pdf_pool = None
+
+
+def extract_pdf_page_range(source: Union[str, bytes], start: int, stop: int) -> List[str]:
+    """
+    Extract the text of pages [start, stop) of a PDF given as a file path or
+    bytes. Runs in the extraction pool's worker processes.
+    """
+    stream = open(source, "rb") if isinstance(source, str) else io.BytesIO(source)
+    with stream:
+        pdf_reader = PyPDF2.PdfReader(stream)
+        return [pdf_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _pdf_worker_source(file_content: FileSource) -> Union[str, bytes]:
+    """A picklable handle on the PDF: its path when it lives on disk, else its bytes."""
+    name = getattr(file_content, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name
+    if isinstance(file_content, (bytes, bytearray)):
+        return bytes(file_content)
+    return _as_stream(file_content).read()
+
+
+def _iter_pdf_pages_parallel(file_content: FileSource, page_count: int, shard_pages: int) -> Iterator[Tuple[str, dict]]:
+    pool = get_pdf_pool()
+    source = _pdf_worker_source(file_content)
+    shards = iter(range(0, page_count, shard_pages))
+    pending = deque()
+    try:
+        # Keep a bounded number of shards in flight and yield them back in page order
+        for start in shards:
+            pending.append((start, pool.submit(extract_pdf_page_range, source, start, min(start + shard_pages, page_count))))
+            if len(pending) >= 2 * PDF_EXTRACT_WORKERS:
+                break
+        while pending:
+            start, future = pending.popleft()
+            texts = future.result()
+            next_start = next(shards, None)
+            if next_start is not None:
+                pending.append((next_start, pool.submit(
+                    extract_pdf_page_range, source, next_start, min(next_start + shard_pages, page_count))))
+            for offset, text in enumerate(texts):
+                yield text, {"page": start + offset + 1}
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def iter_pdf_pages(file_content: FileSource, parallel: Optional[bool] = None, shard_pages: Optional[int] = None) -> Iterator[Tuple[str, dict]]:
+    """
+    Yield (text, {"page": n}) for each page of a PDF, in page order.
+
+    Large PDFs (PDF_PARALLEL_MIN_PAGES pages or more, when more than one
+    worker is configured) are split into ranges of `shard_pages` pages
+    (default PDF_SHARD_PAGES) that are extracted on a process pool; small
+    files stay on the calling thread.
+    """
+    pdf_reader = PyPDF2.PdfReader(_as_stream(file_content))
+    page_count = len(pdf_reader.pages)
+    if parallel is None:
+        parallel = PDF_EXTRACT_WORKERS > 1 and page_count >= PDF_PARALLEL_MIN_PAGES
+    if parallel:
+        shard_pages = shard_pages or PDF_SHARD_PAGES or -(-page_count // (2 * PDF_EXTRACT_WORKERS))
+        yield from _iter_pdf_pages_parallel(file_content, page_count, max(1, shard_pages))
+        return
+    for i, page in enumerate(pdf_reader.pages):
+        yield page.extract_text() or "", {"page": i + 1}
+
+
+def iter_docx_paragraphs(file_content: FileSource) -> Iterator[Tuple[str, dict]]:
+    """
+    Yield the paragraphs of a DOCX file grouped into segments of about
+    DOCX_SEGMENT_CHARS characters, tagged with the first paragraph number.
+    """
+    doc = Document(_as_stream(file_content))
+    parts, size, first = [], 0, 1
+    # Walk the body lazily; doc.paragraphs would build a proxy for every paragraph up front
+    paragraphs = (Paragraph(element, doc) for element in doc.element.body.iterchildren(qn("w:p")))
+    for i, para in enumerate(paragraphs, start=1):
+        if not parts:
+            first = i
+        text = para.text
+        parts.append(text + "\n")
+        size += len(text) + 1
+        if size >= DOCX_SEGMENT_CHARS:
+            yield "".join(parts), {"paragraph": first}
+            parts, size = [], 0
+    if parts:
+        yield "".join(parts), {"paragraph": first}
+
+
+def iter_txt_blocks(file_content: FileSource) -> Iterator[Tuple[str, dict]]:
+    """
+    Yield a UTF-8 text file in blocks of TXT_READ_SIZE bytes.
+    """
+    stream = _as_stream(file_content)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while True:
+        block = stream.read(TXT_READ_SIZE)
+        text = decoder.decode(block, final=not block)
+        if text:
+            yield text, {}
+        if not block:
+            break
+
+
+def iter_text_segments(file_content: FileSource, file_type: str) -> Iterator[Tuple[str, dict]]:
+    """
+    Stream text segments (with location metadata) from different file types.
+    """
+    if file_type == "txt":
+        return iter_txt_blocks(file_content)
+    elif file_type == "pdf":
+        return iter_pdf_pages(file_content)
+    elif file_type == "docx":
+        return iter_docx_paragraphs(file_content)
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+
+def file_type_of(file_name: str) -> str:
+    return file_name.rsplit(".", 1)[-1].lower() if "." in file_name else ""
+
+
+def is_archive(file_name: str) -> bool:
+    return file_name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _member_skip_reason(name: str, size: int) -> Optional[str]:
+    base = name.rsplit("/", 1)[-1]
+    if name.startswith("__MACOSX/") or base.startswith("."):
+        return "hidden file"
+    if file_type_of(name) not in SUPPORTED_FILE_TYPES:
+        return "unsupported file type"
+    if size > BULK_MAX_FILE_MB * 1024 * 1024:
+        return f"larger than {BULK_MAX_FILE_MB:g} MB"
+    return None
+
+
+def iter_upload_files(file_content: FileSource, file_name: str) -> Iterator[Tuple[str, Optional[Callable[[], FileSource]], Optional[str]]]:
+    """
+    Yield (file_name, open, skip_reason) for each document of an upload: the
+    upload itself, or every member of a zip or tar archive (named by its
+    path inside the archive). `open()` returns the document's content and is
+    meant to be called from the extraction thread, so members are only
+    decompressed when their turn comes; it is None for skipped entries.
+    """
+    if not is_archive(file_name):
+        reason = _member_skip_reason(file_name, 0)
+        yield file_name, None if reason else (lambda: file_content), reason
+        return
+    stream = _as_stream(file_content)
+    # Members are read from the shared archive stream, one at a time
+    lock = threading.Lock()
+    if file_name.lower().endswith(".zip"):
+        archive = zipfile.ZipFile(stream)
+        members = [(info.filename, info.file_size, info) for info in archive.infolist() if not info.is_dir()]
+
+        def read(info):
+            with lock:
+                return archive.read(info)
+    else:
+        archive = tarfile.open(fileobj=stream, mode="r:*")
+        members = [(info.name, info.size, info) for info in archive.getmembers() if info.isfile()]
+
+        def read(info):
+            with lock:
+                return archive.extractfile(info).read()
+
+    for name, size, info in members:
+        reason = _member_skip_reason(name, size)
+        yield name, None if reason else (lambda info=info: read(info)), reason
+
 
 # Async version of the extract_text_from_docx
 async def extract_text_from_docx(file_content: bytes) -> str:
@@ -15,11 +249,7 @@ def extract_text_from_docx_sync(file_content: bytes) -> str:
     """
     Extract text from a DOCX file (blocking version).
     """
-    doc = Document(io.BytesIO(file_content))
-    extracted_text = ""
-    for para in doc.paragraphs:
-        extracted_text += para.text + "\n"
-    return extracted_text
+    return "".join(text for text, _ in iter_docx_paragraphs(file_content))
 
 # Async version of the extract_text_from_pdf
 async def extract_text_from_pdf(file_content: bytes) -> str:
@@ -32,15 +262,7 @@ def extract_text_from_pdf_sync(file_content: bytes) -> str:
     """
     Extract text from a PDF file (blocking version).
     """
-    content = ""
-    # Wrap file_content in BytesIO to allow seeking
-    file_like_object = io.BytesIO(file_content)
-    pdf_reader = PyPDF2.PdfReader(file_like_object)
-    num_pages = len(pdf_reader.pages)
-    for i in range(num_pages):
-        page = pdf_reader.pages[i]
-        content += page.extract_text()
-    return content
+    return "".join(text for text, _ in iter_pdf_pages(file_content))
 
 # Async version of extract_text_from_txt
 async def extract_text_from_txt(file_content: bytes) -> str:
@@ -68,4 +290,3 @@ async def extract_text_from_file(file_content: bytes, file_type: str) -> str:
         return await extract_text_from_docx(file_content)
     else:
         raise HTTPException(status_code=400, detail="Unsupported file type")
-
@@ -0,0 +1,103 @@
+import os
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from qdrant_client.http.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Distance,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    VectorParams,
+)
+
+# Native output size of text-embedding-3-large; smaller sizes are Matryoshka truncations
+NATIVE_DENSE_DIMENSIONS = 3072
+QUANTIZATIONS = (None, "scalar", "binary")
+
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    """
+    Storage layout of the dense vector: size (Matryoshka `dimensions`),
+    quantization kept in RAM, originals on disk, and how searches
+    oversample the quantized index and rescore with the originals.
+    """
+    name: str
+    dimensions: int = NATIVE_DENSE_DIMENSIONS
+    quantization: Optional[str] = None
+    on_disk: bool = False
+    oversampling: float = 1.0
+    rescore: bool = True
+
+    def vector_params(self) -> VectorParams:
+        return VectorParams(size=self.dimensions, distance=Distance.COSINE, on_disk=self.on_disk)
+
+    def quantization_config(self):
+        if self.quantization == "scalar":
+            return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+        if self.quantization == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def search_params(self) -> Optional[SearchParams]:
+        if self.quantization is None:
+            return None
+        return SearchParams(quantization=QuantizationSearchParams(
+            ignore=False, rescore=self.rescore, oversampling=self.oversampling))
+
+    def ram_bytes_per_vector(self) -> int:
+        """Dense-vector bytes resident in RAM per point (excluding the HNSW graph)."""
+        if self.quantization == "scalar":
+            quantized = self.dimensions
+        elif self.quantization == "binary":
+            quantized = (self.dimensions + 7) // 8
+        else:
+            quantized = 0
+        originals = 0 if self.on_disk else 4 * self.dimensions
+        return quantized + originals
+
+
+PROFILES = {
+    # float32 vectors in RAM: exact scores, about 12 KiB per point at 3072 dims
+    "full": CollectionProfile("full"),
+    # int8 copy in RAM (4x smaller), originals on disk for rescoring
+    "scalar": CollectionProfile("scalar", quantization="scalar", on_disk=True, oversampling=2.0),
+    # 1 bit per dimension in RAM (32x smaller); needs more oversampling to hold recall
+    "binary": CollectionProfile("binary", quantization="binary", on_disk=True, oversampling=3.0),
+    # Matryoshka-truncated 1024-dim vectors with int8 quantization
+    "compact": CollectionProfile("compact", dimensions=1024, quantization="scalar", on_disk=True, oversampling=2.0),
+}
+
+
+def load_profile(name: Optional[str] = None) -> CollectionProfile:
+    """
+    The profile named by VECTOR_PROFILE (default "full"), with optional
+    overrides from DENSE_DIMENSIONS, VECTOR_QUANTIZATION, VECTORS_ON_DISK,
+    QUANTIZATION_OVERSAMPLING and QUANTIZATION_RESCORE.
+    """
+    name = name or os.getenv("VECTOR_PROFILE", "full")
+    if name not in PROFILES:
+        raise ValueError(f"Unknown VECTOR_PROFILE '{name}', expected one of {sorted(PROFILES)}")
+    profile = PROFILES[name]
+    overrides = {}
+    if os.getenv("DENSE_DIMENSIONS"):
+        overrides["dimensions"] = int(os.getenv("DENSE_DIMENSIONS"))
+    if os.getenv("VECTOR_QUANTIZATION"):
+        quantization = os.getenv("VECTOR_QUANTIZATION").lower()
+        overrides["quantization"] = None if quantization == "none" else quantization
+    if os.getenv("VECTORS_ON_DISK"):
+        overrides["on_disk"] = os.getenv("VECTORS_ON_DISK").lower() == "true"
+    if os.getenv("QUANTIZATION_OVERSAMPLING"):
+        overrides["oversampling"] = float(os.getenv("QUANTIZATION_OVERSAMPLING"))
+    if os.getenv("QUANTIZATION_RESCORE"):
+        overrides["rescore"] = os.getenv("QUANTIZATION_RESCORE").lower() == "true"
+    profile = replace(profile, **overrides)
+    if profile.quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown VECTOR_QUANTIZATION '{profile.quantization}'")
+    if not 0 < profile.dimensions <= NATIVE_DENSE_DIMENSIONS:
+        raise ValueError(f"DENSE_DIMENSIONS must be between 1 and {NATIVE_DENSE_DIMENSIONS}")
+    return profile
@@ -0,0 +1,126 @@
+"""
+One heavy user's burst next to a few light users, with the LLM stage
+admission limit off and on (app/utils/admission.py).
+
+--light-users users and one heavy user upload a document each. Per round,
+the heavy user sends --heavy-requests /chat requests at once and, a moment
+later, every light user sends one. Without a limit all of them reach the
+LLM together; with --llm-limit only that many do, and freed slots go to the
+users in turn, so the light users are served in the first turns instead of
+after the heavy user's whole burst. The fake OpenAI server
+(benchmarks/fake_openai.py) records the peak number of concurrent LLM
+calls. Reports p50/p95 latency of light and heavy requests, 429 rejections
+and the peak upstream concurrency. Run from the repository root:
+    python -m benchmarks.bench_admission --heavy-requests 64 --light-users 8 --llm-limit 8
+Add --env ADMISSION_QUEUE_TIMEOUT=0.5 to see requests rejected past their deadline.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.bench_load import configure_environment, install_indexer
+
+
+def track_concurrency(fake):
+    """Count the LLM calls the fake server is answering at once."""
+    fake.state.inflight = fake.state.peak = 0
+
+    @fake.middleware("http")
+    async def count(request, call_next):
+        if not request.url.path.endswith("/chat/completions"):
+            return await call_next(request)
+        fake.state.inflight += 1
+        fake.state.peak = max(fake.state.peak, fake.state.inflight)
+        try:
+            return await call_next(request)
+        finally:
+            fake.state.inflight -= 1
+
+
+async def drive(args, base_url, fake):
+    from app.utils.admission import get_limiter
+    from benchmarks.stubs import make_txt
+
+    heavy, light = "heavy-user", [f"light-user-{i}" for i in range(args.light_users)]
+    async with httpx.AsyncClient(base_url=base_url, timeout=600,
+                                 limits=httpx.Limits(max_connections=(args.heavy_requests + args.light_users) * 2)) as client:
+        for i, username in enumerate([heavy, *light]):
+            response = await client.post("/upload-knowledge", data={"username": username},
+                                         files={"file": ("notes.txt", make_txt(3, seed=i), "text/plain")})
+            response.raise_for_status()
+
+        async def ask(username, question, delay=0.0):
+            await asyncio.sleep(delay)
+            started = time.perf_counter()
+            response = await client.post("/chat", json={"username": username, "query": question})
+            if response.status_code == 429:
+                return None
+            response.raise_for_status()
+            return (time.perf_counter() - started) * 1000
+
+        print(f"{'admission':<10} {'light p50':>9} {'light p95':>9} {'heavy p50':>9} {'heavy p95':>9} "
+              f"{'429s':>5} {'peak llm':>8}")
+        question_id = 0
+        for limit in (0, args.llm_limit):
+            get_limiter("llm").limit = limit
+            fake.state.peak = 0
+            light_ms, heavy_ms, rejected = [], [], 0
+            for _ in range(args.rounds):
+                # New questions every round, so neither the answer cache nor coalescing answers them
+                question_id += 1
+                heavy_calls = [ask(heavy, f"what does heavy topic {question_id}.{j} cover?")
+                               for j in range(args.heavy_requests)]
+                light_calls = [ask(username, f"what does light topic {question_id} cover?", delay=0.05)
+                               for username in light]
+                results = await asyncio.gather(*heavy_calls, *light_calls)
+                rejected += sum(result is None for result in results)
+                heavy_ms += [ms for ms in results[:args.heavy_requests] if ms is not None]
+                light_ms += [ms for ms in results[args.heavy_requests:] if ms is not None]
+            light_p = np.percentile(light_ms, [50, 95]) if light_ms else [float("nan")] * 2
+            heavy_p = np.percentile(heavy_ms, [50, 95]) if heavy_ms else [float("nan")] * 2
+            print(f"{f'limit {limit}' if limit else 'off':<10} {light_p[0]:>9.0f} {light_p[1]:>9.0f} "
+                  f"{heavy_p[0]:>9.0f} {heavy_p[1]:>9.0f} {rejected:>5} {fake.state.peak:>8}")
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="bench_admission_")
+    args.fastembed = False
+    args.env = [*args.env, "LOG_LEVEL=WARNING"]
+    configure_environment(args, workdir)
+    from benchmarks.fake_openai import create_app, serve_in_thread
+
+    fake = create_app(args.embed_latency, 2e-6, chat_latency=args.chat_latency,
+                      chat_tokens_per_second=args.chat_tps, answer_tokens=args.answer_tokens)
+    track_concurrency(fake)
+    openai_url, stop_openai = serve_in_thread(fake)
+    os.environ.update({"OPENAI_API_BASE": openai_url, "OPENAI_BASE_URL": openai_url})
+
+    from app.main import app
+    install_indexer(args, openai_url)
+    base_url, stop_app = serve_in_thread(app)
+    print(f"heavy_requests={args.heavy_requests} light_users={args.light_users} llm_limit={args.llm_limit} "
+          f"chat_latency={args.chat_latency}s")
+    try:
+        asyncio.run(drive(args, base_url[:-len("/v1")], fake))
+    finally:
+        stop_app()
+        stop_openai()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--heavy-requests", type=int, default=64, help="concurrent requests of the heavy user per round")
+    parser.add_argument("--light-users", type=int, default=8)
+    parser.add_argument("--llm-limit", type=int, default=8, help="LLM_MAX_CONCURRENCY of the admission-on run")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="fake embedding seconds per request")
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="fake LLM seconds to the first token")
+    parser.add_argument("--chat-tps", type=float, default=2000.0, help="fake LLM tokens per second")
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app setting")
+    main(parser.parse_args())
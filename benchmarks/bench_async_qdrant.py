@@ -0,0 +1,106 @@
+"""
+Concurrent retrieval throughput: the old blocking QdrantClient path (run in
+executor threads, as LangChain's aget_relevant_documents does) vs. the
+async-native DocumentIndexer path on the pooled AsyncQdrantClient.
+
+Query vectors are random, so no embedding API is needed. Run from the
+repository root against Qdrant's local in-memory mode:
+    python -m benchmarks.bench_async_qdrant --qdrant-url :memory: --points 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from uuid import UUID
+
+import numpy as np
+from qdrant_client.http.models import Filter, FieldCondition, MatchValue, PointStruct
+
+from app.utils import qdrant_utils
+from app.utils.qdrant_utils import COLLECTION_NAME, DENSE_VECTOR_NAME, DocumentIndexer
+
+DIM = 3072
+
+
+def _random_vectors(rng, n):
+    vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _points(rng, n, users):
+    return [
+        PointStruct(
+            id=str(UUID(int=i)),
+            vector={DENSE_VECTOR_NAME: vector.tolist()},
+            payload={"page_content": f"chunk {i}", "metadata": {"username": f"user{i % users}", "file_name": "bench.txt"}},
+        )
+        for i, vector in enumerate(_random_vectors(rng, n))
+    ]
+
+
+async def _seed(indexer, points):
+    await indexer.start()
+    for i in range(0, len(points), 256):
+        await indexer.client.upsert(collection_name=COLLECTION_NAME, points=points[i:i + 256])
+    if indexer.sync_client.collection_exists(COLLECTION_NAME) is False:
+        # Local mode keeps a separate store per client instance
+        info = await indexer.client.get_collection(COLLECTION_NAME)
+        indexer.sync_client.create_collection(COLLECTION_NAME, vectors_config=info.config.params.vectors)
+    for i in range(0, len(points), 256):
+        indexer.sync_client.upsert(collection_name=COLLECTION_NAME, points=points[i:i + 256])
+
+
+async def _run(query_fn, queries, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(vector):
+        async with semaphore:
+            start = time.perf_counter()
+            await query_fn(vector)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(vector) for vector in queries))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return len(queries) / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+async def main(args):
+    rng = np.random.default_rng(0)
+    indexer = DocumentIndexer(args.qdrant_url, max_inflight=args.max_inflight)
+    await _seed(indexer, _points(rng, args.points, args.users))
+    queries = [vector.tolist() for vector in _random_vectors(rng, args.queries)]
+    filter_ = Filter(must=[FieldCondition(key="metadata.username", match=MatchValue(value="user0"))])
+    loop = asyncio.get_running_loop()
+
+    async def blocking(vector):
+        await loop.run_in_executor(None, lambda: indexer.sync_client.query_points(
+            collection_name=COLLECTION_NAME, query=vector, using=DENSE_VECTOR_NAME,
+            query_filter=filter_, limit=args.top_k, with_payload=True,
+        ))
+
+    async def native(vector):
+        await indexer.asearch_by_vector(top_k=args.top_k, mode="dense", dense_vector=vector, metadata_filter=filter_)
+
+    print(f"{'path':<10} {'concurrency':>11} {'qps':>10} {'p50 ms':>10} {'p95 ms':>10}")
+    try:
+        for concurrency in args.concurrency:
+            for name, fn in (("executor", blocking), ("async", native)):
+                qps, p50, p95 = await _run(fn, queries, concurrency)
+                print(f"{name:<10} {concurrency:>11} {qps:>10.1f} {p50:>10.2f} {p95:>10.2f}")
+    finally:
+        await indexer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--qdrant-url", default=qdrant_utils.QDRANT_DB_URL)
+    parser.add_argument("--points", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-inflight", type=int, default=qdrant_utils.QDRANT_MAX_INFLIGHT)
+    parser.add_argument("--concurrency", type=lambda s: [int(x) for x in s.split(",")], default=[1, 8, 32, 128])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,154 @@
+"""
+Loading a knowledge base of many small files: one /upload-knowledge request
+per file against /upload-knowledge/bulk.
+
+--files synthetic documents (a mix of txt, docx and pdf, --pages pages
+each) are indexed for a fresh user per configuration:
+  - sequential: one /upload-knowledge request after the other
+  - concurrent: /upload-knowledge from --concurrency clients at once
+  - bulk:       one /upload-knowledge/bulk request with all the files
+  - zip / tar:  one /upload-knowledge/bulk request with one archive
+Embeddings go to the fake OpenAI server (benchmarks/fake_openai.py), which
+counts the embedding calls; sparse embeddings are stubbed and Qdrant runs
+in local in-memory mode. Reports seconds, files and chunks per second and
+embedding calls. Run from the repository root:
+    python -m benchmarks.bench_bulk_upload --files 500 --pages 2
+"""
+import argparse
+import asyncio
+import io
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
+
+import httpx
+
+from benchmarks.bench_load import configure_environment, install_indexer
+
+MEDIA_TYPES = {
+    "txt": "text/plain",
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+
+def make_files(count: int, pages: int, seed: int = 0):
+    from benchmarks.stubs import make_docx, make_pdf, make_txt
+
+    makers = {"txt": make_txt, "docx": make_docx, "pdf": make_pdf}
+    kinds = ["txt", "txt", "docx", "pdf"]
+    return [(f"doc-{i:05d}.{kinds[i % len(kinds)]}", makers[kinds[i % len(kinds)]](pages, seed=seed + i))
+            for i in range(count)]
+
+
+def make_zip(files) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files:
+            archive.writestr(f"kb/{name}", content)
+    return buffer.getvalue()
+
+
+def make_tar(files) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, content in files:
+            info = tarfile.TarInfo(f"kb/{name}")
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+async def drive(args, base_url, fake):
+    stats = fake.state.stats
+    async with httpx.AsyncClient(base_url=base_url, timeout=3600,
+                                 limits=httpx.Limits(max_connections=args.concurrency * 2)) as client:
+        async def upload_one(username, name, content):
+            response = await client.post("/upload-knowledge", data={"username": username},
+                                         files={"file": (name, content, MEDIA_TYPES[name.rsplit(".", 1)[-1]])})
+            response.raise_for_status()
+            return response.json()["stats"]["chunks"]
+
+        async def sequential(username, files):
+            return sum([await upload_one(username, name, content) for name, content in files])
+
+        async def concurrent(username, files):
+            pending, chunks = iter(files), 0
+
+            async def worker():
+                nonlocal chunks
+                for name, content in pending:
+                    uploaded = await upload_one(username, name, content)
+                    chunks += uploaded
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            return chunks
+
+        async def bulk_upload(username, uploads):
+            response = await client.post("/upload-knowledge/bulk", data={"username": username}, files=uploads)
+            response.raise_for_status()
+            body = response.json()
+            failed = [f for f in body["files"] if f["status"] != "indexed"]
+            if failed:
+                raise RuntimeError(failed[0])
+            return body["stats"]["chunks"]
+
+        async def bulk(username, files):
+            return await bulk_upload(username, [("files", (name, content, MEDIA_TYPES[name.rsplit(".", 1)[-1]]))
+                                                for name, content in files])
+
+        async def zipped(username, files):
+            return await bulk_upload(username, [("files", ("kb.zip", make_zip(files), "application/zip"))])
+
+        async def tarred(username, files):
+            return await bulk_upload(username, [("files", ("kb.tar.gz", make_tar(files), "application/gzip"))])
+
+        print(f"{'config':<11} {'seconds':>8} {'files/s':>8} {'chunks':>7} {'chunks/s':>9} {'embed calls':>11}")
+        for round_, (config, run) in enumerate((("sequential", sequential), ("concurrent", concurrent),
+                                                 ("bulk", bulk), ("zip", zipped), ("tar", tarred))):
+            if config not in args.configs:
+                continue
+            # New texts per configuration, so the embedding cache never answers them
+            files = make_files(args.files, args.pages, seed=round_ * args.files)
+            embeddings = stats["requests"]
+            started = time.perf_counter()
+            chunks = await run(f"bulk-{config}", files)
+            seconds = time.perf_counter() - started
+            print(f"{config:<11} {seconds:>8.2f} {args.files / seconds:>8.1f} {chunks:>7} {chunks / seconds:>9.1f} "
+                  f"{stats['requests'] - embeddings:>11}")
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="bench_bulk_upload_")
+    args.fastembed = False
+    args.env = [*args.env, "LOG_LEVEL=WARNING"]
+    configure_environment(args, workdir)
+    from benchmarks.fake_openai import create_app, serve_in_thread
+
+    fake = create_app(args.embed_latency, 2e-6)
+    openai_url, stop_openai = serve_in_thread(fake)
+    os.environ.update({"OPENAI_API_BASE": openai_url, "OPENAI_BASE_URL": openai_url})
+
+    from app.main import app
+    install_indexer(args, openai_url)
+    base_url, stop_app = serve_in_thread(app)
+    print(f"files={args.files} pages={args.pages} concurrency={args.concurrency} embed_latency={args.embed_latency}s")
+    try:
+        asyncio.run(drive(args, base_url[:-len("/v1")], fake))
+    finally:
+        stop_app()
+        stop_openai()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--pages", type=int, default=2, help="pages per synthetic document")
+    parser.add_argument("--concurrency", type=int, default=8, help="clients of the concurrent configuration")
+    parser.add_argument("--configs", type=lambda s: s.split(","),
+                        default=["sequential", "concurrent", "bulk", "zip", "tar"])
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="fake embedding seconds per request")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app setting")
+    main(parser.parse_args())
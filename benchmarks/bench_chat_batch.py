@@ -0,0 +1,140 @@
+"""
+/chat/batch against the same questions sent as /chat requests.
+
+--users users upload a document each, then --questions new questions
+(spread over the users) are answered:
+  - sequential: one /chat request after the other, as the offline jobs do
+  - concurrent: /chat from --concurrency clients at once
+  - batch:      one /chat/batch request
+  - batch-stream: one /chat/batch request streaming results as they finish
+A /chat request makes one embedding call and one Qdrant query per
+question; a batch makes one embedding call and one Qdrant batch query per
+collection for all of them, and runs CHAT_BATCH_CONCURRENCY completions at
+a time. The fake OpenAI server (benchmarks/fake_openai.py) counts the
+embedding and LLM calls; Qdrant queries are read from the app's
+qdrant_query_seconds histogram. Run from the repository root:
+    python -m benchmarks.bench_chat_batch --users 8 --questions 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.bench_load import configure_environment, install_indexer
+
+
+def qdrant_queries() -> int:
+    from app.services import metrics
+
+    return sum((metrics.get_histogram("qdrant_query_seconds", mode=mode) or {"count": 0})["count"]
+               for mode in ("dense", "sparse", "hybrid", "batch"))
+
+
+async def drive(args, base_url, fake):
+    from benchmarks.stubs import make_txt
+
+    users = [f"batch-user-{i}" for i in range(args.users)]
+    stats = fake.state.stats
+    async with httpx.AsyncClient(base_url=base_url, timeout=600,
+                                 limits=httpx.Limits(max_connections=args.concurrency * 2)) as client:
+        for i, username in enumerate(users):
+            response = await client.post("/upload-knowledge", data={"username": username},
+                                         files={"file": ("notes.txt", make_txt(3, seed=i), "text/plain")})
+            response.raise_for_status()
+
+        def requests(config):
+            # New questions per configuration, so the answer cache never answers them
+            return [{"username": users[i % len(users)], "query": f"what does {config} topic {i} cover?",
+                     "mode": args.mode} for i in range(args.questions)]
+
+        async def sequential(batch):
+            for request in batch:
+                (await client.post("/chat", json=request)).raise_for_status()
+
+        async def concurrent(batch):
+            pending = iter(batch)
+
+            async def worker():
+                for request in pending:
+                    (await client.post("/chat", json=request)).raise_for_status()
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+        async def batched(batch):
+            response = await client.post("/chat/batch", json={"requests": batch})
+            response.raise_for_status()
+            errors = [result["error"] for result in response.json()["results"] if result["error"]]
+            if errors:
+                raise RuntimeError(errors[0])
+
+        first_result_ms = None
+
+        async def batched_stream(batch):
+            nonlocal first_result_ms
+            started = time.perf_counter()
+            async with client.stream("POST", "/chat/batch", json={"requests": batch, "stream": True}) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line and json.loads(line).get("event") == "result" and first_result_ms is None:
+                        first_result_ms = (time.perf_counter() - started) * 1000
+
+        print(f"{'config':<14} {'seconds':>8} {'q/s':>7} {'embed calls':>11} {'qdrant queries':>14} "
+              f"{'llm calls':>9} {'first ms':>9}")
+        for config, run in (("sequential", sequential), ("concurrent", concurrent), ("batch", batched),
+                            ("batch-stream", batched_stream)):
+            if config not in args.configs:
+                continue
+            embeddings, chats, queries = stats["requests"], stats["chat_requests"], qdrant_queries()
+            first_result_ms = None
+            started = time.perf_counter()
+            await run(requests(config))
+            seconds = time.perf_counter() - started
+            first = f"{first_result_ms:.0f}" if first_result_ms is not None else "-"
+            print(f"{config:<14} {seconds:>8.2f} {args.questions / seconds:>7.1f} "
+                  f"{stats['requests'] - embeddings:>11} {qdrant_queries() - queries:>14} "
+                  f"{stats['chat_requests'] - chats:>9} {first:>9}")
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="bench_chat_batch_")
+    args.fastembed = False
+    args.env = [*args.env, "LOG_LEVEL=WARNING", f"CHAT_BATCH_CONCURRENCY={args.concurrency}"]
+    configure_environment(args, workdir)
+    from benchmarks.fake_openai import create_app, serve_in_thread
+
+    fake = create_app(args.embed_latency, 2e-6, chat_latency=args.chat_latency,
+                      chat_tokens_per_second=args.chat_tps, answer_tokens=args.answer_tokens)
+    openai_url, stop_openai = serve_in_thread(fake)
+    os.environ.update({"OPENAI_API_BASE": openai_url, "OPENAI_BASE_URL": openai_url})
+
+    from app.main import app
+    install_indexer(args, openai_url)
+    base_url, stop_app = serve_in_thread(app)
+    print(f"users={args.users} questions={args.questions} concurrency={args.concurrency} mode={args.mode} "
+          f"embed_latency={args.embed_latency}s chat_latency={args.chat_latency}s")
+    try:
+        asyncio.run(drive(args, base_url[:-len("/v1")], fake))
+    finally:
+        stop_app()
+        stop_openai()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="concurrent /chat clients, and CHAT_BATCH_CONCURRENCY for the batch")
+    parser.add_argument("--mode", default="dense", choices=("dense", "sparse", "hybrid"))
+    parser.add_argument("--configs", type=lambda s: s.split(","),
+                        default=["sequential", "concurrent", "batch", "batch-stream"])
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="fake embedding seconds per request")
+    parser.add_argument("--chat-latency", type=float, default=0.05, help="fake LLM seconds to the first token")
+    parser.add_argument("--chat-tps", type=float, default=2000.0, help="fake LLM tokens per second")
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app setting")
+    main(parser.parse_args())
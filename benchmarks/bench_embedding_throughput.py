@@ -0,0 +1,91 @@
+"""
+Embedding throughput of ingestion against a local stand-in embedding server
+(benchmarks/fake_openai.py) with per-request latency and TPM/RPM limits:
+the previous schedule (5 chunks per request, one request at a time) vs.
+token-sized batches with several requests in flight behind the client-side
+rate limiter and jittered retries.
+
+Both runs chunk the same synthetic text with the streaming chunker and call
+the real OpenAIEmbeddings client. Only embedding is measured (no Qdrant).
+Run from the repository root:
+    python -m benchmarks.bench_embedding_throughput --pages 200 --concurrency 4 --server-tpm 2000000
+"""
+import argparse
+import asyncio
+import time
+
+from langchain_openai import OpenAIEmbeddings
+
+from app.services import metrics
+from app.utils.ingestion import StreamingChunker, run_ingestion
+from app.utils.rate_limit import RateLimitedEmbeddings, RateLimiter
+from benchmarks.fake_openai import create_app, serve_in_thread
+from benchmarks.stubs import make_txt
+
+
+async def ingest(text, embeddings, batch_size, batch_tokens, concurrency):
+    async def segments():
+        yield text, {}
+
+    async def upsert(docs):
+        await embeddings.aembed_documents([doc.page_content for doc in docs])
+
+    chunker = StreamingChunker(metadata={"file_name": "bench.txt"}, chunk_size=1500)
+    return await run_ingestion(
+        segments(), chunker, upsert, batch_size=batch_size, batch_tokens=batch_tokens, concurrency=concurrency
+    )
+
+
+async def main(args):
+    app = create_app(args.latency, args.per_token, args.server_tpm, args.server_rpm)
+    base_url, stop = serve_in_thread(app)
+    text = make_txt(args.pages).decode("utf-8")
+
+    def client(max_retries):
+        return OpenAIEmbeddings(
+            model="text-embedding-3-large",
+            base_url=base_url,
+            api_key="sk-local",
+            check_embedding_ctx_length=False,
+            max_retries=max_retries,
+        )
+
+    runs = (
+        # Previous behaviour: aadd_documents(batch_size=5) one batch after another, SDK retries only
+        ("legacy", client(2), 5, 10 ** 9, 1),
+        ("scheduled", RateLimitedEmbeddings(client(0), RateLimiter(args.client_tpm, args.client_rpm)),
+         args.batch_size, args.batch_tokens, args.concurrency),
+    )
+    print(f"server: latency={args.latency}s per_token={args.per_token}s tpm={args.server_tpm} rpm={args.server_rpm}")
+    print(f"{'schedule':<10} {'chunks':>7} {'batches':>8} {'requests':>9} {'429s':>6} {'retries':>8} {'seconds':>8} {'chunks/s':>9}")
+    try:
+        for name, embeddings, batch_size, batch_tokens, concurrency in runs:
+            app.state.stats.update(requests=0, rejected=0, inputs=0, tokens=0)
+            retries_before = metrics.get_counter("retries_total", operation="embedding")
+            start = time.perf_counter()
+            stats = await ingest(text, embeddings, batch_size, batch_tokens, concurrency)
+            elapsed = time.perf_counter() - start
+            server = app.state.stats
+            retries = metrics.get_counter("retries_total", operation="embedding") - retries_before
+            print(f"{name:<10} {stats['chunks']:>7} {stats['batches']:>8} {server['requests']:>9} "
+                  f"{server['rejected']:>6} {retries:>8.0f} {elapsed:>8.2f} {stats['chunks'] / elapsed:>9.1f}")
+    finally:
+        stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="server seconds per request")
+    parser.add_argument("--per-token", type=float, default=2e-6, help="server seconds per input token")
+    parser.add_argument("--server-tpm", type=int, default=2_000_000)
+    parser.add_argument("--server-rpm", type=int, default=3000)
+    parser.add_argument("--client-tpm", type=int, default=None, help="default: the server's TPM")
+    parser.add_argument("--client-rpm", type=int, default=None, help="default: the server's RPM")
+    parser.add_argument("--batch-tokens", type=int, default=8000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    args.client_tpm = args.server_tpm if args.client_tpm is None else args.client_tpm
+    args.client_rpm = args.server_rpm if args.client_rpm is None else args.client_rpm
+    asyncio.run(main(args))
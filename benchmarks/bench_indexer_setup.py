@@ -0,0 +1,57 @@
+"""
+Per-request DocumentIndexer setup cost: building a fresh indexer for every
+request (the old behaviour) vs. reusing the shared, warmed-up indexer.
+
+Run from the repository root:
+    python -m benchmarks.bench_indexer_setup --requests 20 --qdrant-url :memory:
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.utils import qdrant_utils
+from app.utils.qdrant_utils import DocumentIndexer, init_document_indexer, get_document_indexer, close_document_indexer
+
+
+async def _timed(fn, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(name, samples):
+    print(f"{name:<28} mean={statistics.mean(samples):9.3f} ms  "
+          f"p50={statistics.median(samples):9.3f} ms  max={max(samples):9.3f} ms")
+
+
+async def main(args):
+    async def per_request():
+        indexer = DocumentIndexer(args.qdrant_url)
+        await indexer.start()
+        await indexer.close()
+
+    qdrant_utils.QDRANT_DB_URL = args.qdrant_url
+    start = time.perf_counter()
+    await init_document_indexer()
+    startup_ms = (time.perf_counter() - start) * 1000
+
+    async def shared():
+        await get_document_indexer().start()
+
+    try:
+        _report("fresh indexer per request", await _timed(per_request, args.requests))
+        _report("shared warmed indexer", await _timed(shared, args.requests))
+        print(f"one-off startup warmup       {startup_ms:9.3f} ms")
+    finally:
+        await close_document_indexer()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--qdrant-url", default=qdrant_utils.QDRANT_DB_URL)
+    asyncio.run(main(parser.parse_args()))
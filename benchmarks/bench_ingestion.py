@@ -0,0 +1,117 @@
+"""
+Peak memory and throughput of document ingestion on synthetic documents:
+the previous path (read whole upload, build the full text, split it all at
+once, embed in batches) vs. the streaming pipeline (segments -> chunks ->
+batches -> upserts with bounded buffers).
+
+Embeddings use the local stand-ins in benchmarks/stubs.py; `--qdrant-url`
+adds real upserts (":memory:" for local mode, which itself keeps every
+point in RAM). Run from the repository root:
+    python -m benchmarks.bench_ingestion --pages 100,500 --formats pdf,docx,txt
+"""
+import argparse
+import asyncio
+import gc
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+from uuid import uuid4
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from app.utils.ingestion import StreamingChunker, aiter_segments, run_ingestion
+from app.utils.qdrant_utils import DocumentIndexer
+from app.utils.utils import iter_text_segments
+from benchmarks.stubs import StubDenseEmbeddings, StubSparseEmbeddings, make_docx, make_pdf, make_txt
+
+MAKERS = {"pdf": make_pdf, "docx": make_docx, "txt": make_txt}
+
+
+def legacy_extract(content: bytes, file_type: str) -> str:
+    """The previous extractors: whole-file bytes and repeated string concatenation."""
+    text = ""
+    if file_type == "txt":
+        return content.decode("utf-8")
+    if file_type == "pdf":
+        import PyPDF2
+        reader = PyPDF2.PdfReader(io.BytesIO(content))
+        for i in range(len(reader.pages)):
+            text += reader.pages[i].extract_text()
+        return text
+    from docx import Document as DocxDocument
+    for para in DocxDocument(io.BytesIO(content)).paragraphs:
+        text += para.text + "\n"
+    return text
+
+
+def make_upsert(indexer, embeddings):
+    async def upsert(docs):
+        if indexer is not None:
+            await indexer.aupsert_documents(docs, [str(uuid4()) for _ in docs])
+        else:
+            await embeddings.aembed_documents([doc.page_content for doc in docs])
+    return upsert
+
+
+async def legacy(path, file_type, upsert):
+    with open(path, "rb") as f:
+        content = f.read()
+    text = legacy_extract(content, file_type)
+    splitter = RecursiveCharacterTextSplitter(separators=["\n\n", "\n", ".", ","], chunk_size=1500, chunk_overlap=200)
+    docs = splitter.split_documents([Document(page_content=text, metadata={"file_name": path})])
+    for i in range(0, len(docs), 5):
+        await upsert(docs[i:i + 5])
+    return len(docs)
+
+
+async def streaming(path, file_type, upsert):
+    with open(path, "rb") as f:
+        chunker = StreamingChunker(metadata={"file_name": path}, chunk_size=1500)
+        stats = await run_ingestion(aiter_segments(iter_text_segments(f, file_type)), chunker, upsert)
+    return stats["chunks"]
+
+
+async def measure(fn, *args):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    chunks = await fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return chunks, elapsed, peak / 2 ** 20
+
+
+async def main(args):
+    indexer = None
+    embeddings = StubDenseEmbeddings()
+    if args.qdrant_url:
+        indexer = DocumentIndexer(args.qdrant_url, dense_embedding=embeddings, sparse_embedding=StubSparseEmbeddings())
+        await indexer.start()
+    upsert = make_upsert(indexer, embeddings)
+    directory = tempfile.mkdtemp(prefix="bench_ingestion_")
+
+    print(f"{'format':<6} {'pages':>6} {'path':<10} {'chunks':>7} {'seconds':>8} {'chunks/s':>9} {'peak MiB':>9}")
+    try:
+        for file_type in args.formats:
+            for pages in args.pages:
+                path = os.path.join(directory, f"doc-{pages}.{file_type}")
+                with open(path, "wb") as f:
+                    f.write(MAKERS[file_type](pages))
+                for name, fn in (("legacy", legacy), ("streaming", streaming)):
+                    chunks, elapsed, peak = await measure(fn, path, file_type, upsert)
+                    print(f"{file_type:<6} {pages:>6} {name:<10} {chunks:>7} {elapsed:>8.2f} {chunks / elapsed:>9.1f} {peak:>9.1f}")
+    finally:
+        if indexer is not None:
+            await indexer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=lambda s: [int(x) for x in s.split(",")], default=[100, 500])
+    parser.add_argument("--formats", type=lambda s: s.split(","), default=["pdf", "docx", "txt"])
+    parser.add_argument("--qdrant-url", default=None, help="also upsert into Qdrant (e.g. :memory:)")
+    asyncio.run(main(parser.parse_args()))
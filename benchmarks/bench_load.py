@@ -0,0 +1,322 @@
+"""
+Offline end-to-end load test of /upload-knowledge, /chat and /chat_stream.
+
+Starts the FastAPI `app` from app/main.py on a local port with stand-ins
+for everything external:
+  - benchmarks/fake_openai.py serves chat completions and embeddings with
+    configurable latency and token rate (the refiner uses its "echo" model);
+  - Qdrant runs in local in-memory mode;
+  - sparse vectors come from the stub BM25 embedder (--fastembed uses the
+    real model, which must already be downloaded);
+  - chat history and the chunk manifest live in a temporary SQLite file.
+
+Each phase drives `--concurrency` concurrent clients until `--requests`
+requests have completed (uploads use `--upload-concurrency` and
+`--uploads`). It reports throughput and p50/p95/p99 latency per endpoint,
+plus the same percentiles for each pipeline stage the app reports in
+`debug_info.pipeline.timings` (chat) or `stats` (uploads). For
+/chat_stream, `ttfb_ms` is the time to the first answer chunk as seen by
+the client.
+
+Results are written as JSON, next to a .prom snapshot of the app's /metrics
+endpoint taken at the end of the run; pass a previous file to --compare to print the
+change in throughput and latency. Run from the repository root:
+    python -m benchmarks.bench_load --users 8 --uploads 16 --requests 200 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+# Nothing importing `app` (benchmarks.stubs and benchmarks.fake_openai included) may be
+# imported at module level: app settings are read at import time, after configure_environment
+PHASES = ("upload", "chat", "chat_stream")
+
+
+def summarize(values) -> dict:
+    if not values:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(values), "mean": round(float(np.mean(values)), 2), "p50": round(float(p50), 2),
+            "p95": round(float(p95), 2), "p99": round(float(p99), 2), "max": round(float(max(values)), 2)}
+
+
+class PhaseRecorder:
+    def __init__(self):
+        self.latencies = []
+        self.stages = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def stage_values(self, values: dict):
+        for name, value in values.items():
+            if isinstance(value, (int, float)):
+                self.stages[name].append(float(value))
+
+    def report(self, seconds: float) -> dict:
+        return {
+            "requests": len(self.latencies),
+            "errors": dict(self.errors),
+            "seconds": round(seconds, 3),
+            "throughput_rps": round(len(self.latencies) / seconds, 2) if seconds else 0.0,
+            "latency_ms": summarize(self.latencies),
+            "stages_ms": {name: summarize(values) for name, values in sorted(self.stages.items())},
+        }
+
+
+def configure_environment(args, workdir: str):
+    """App settings read at import time; must run before anything from `app` is imported."""
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-local",
+        "llm_provider": "openai",
+        "model": "fake-chat",
+        "temperature": "0",
+        "REFINER_MODEL": "echo-refiner",
+        "qdrant_db_path": ":memory:",
+        "CHAT_DB_FILE": os.path.join(workdir, "chat_log.db"),
+        "EMBEDDING_CACHE_DIR": "",
+        "INGESTION_SPOOL_DIR": workdir,
+    })
+    for item in args.env:
+        key, _, value = item.partition("=")
+        os.environ[key] = value
+
+
+def install_indexer(args, openai_url: str):
+    """Share one DocumentIndexer on local Qdrant, embedding through the fake server."""
+    from langchain_openai import OpenAIEmbeddings
+    from app.utils import qdrant_utils
+    from benchmarks.stubs import StubSparseEmbeddings
+
+    dense = OpenAIEmbeddings(
+        model=qdrant_utils.DENSE_EMBEDDING_MODEL,
+        base_url=openai_url,
+        api_key="sk-local",
+        max_retries=0,
+        # Token-based splitting needs the tiktoken download
+        check_embedding_ctx_length=False,
+        dimensions=qdrant_utils.DENSE_VECTOR_SIZE,
+    )
+    sparse = None if args.fastembed else StubSparseEmbeddings()
+    qdrant_utils._document_indexer = qdrant_utils.DocumentIndexer(
+        ":memory:", dense_embedding=dense, sparse_embedding=sparse)
+
+
+async def run_phase(count: int, concurrency: int, request) -> float:
+    """Run `request(i)` for i in range(count) on `concurrency` workers; returns elapsed seconds."""
+    indexes = iter(range(count))
+
+    async def worker():
+        for i in indexes:
+            await request(i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started
+
+
+async def timed_call(recorder: PhaseRecorder, call):
+    started = time.perf_counter()
+    try:
+        result = await call()
+    except Exception as e:
+        recorder.errors[type(e).__name__] += 1
+        return None
+    recorder.latencies.append((time.perf_counter() - started) * 1000)
+    return result
+
+
+async def drive(args, base_url: str) -> dict:
+    from benchmarks.stubs import WORDS, make_txt
+
+    def random_question(rng: random.Random) -> str:
+        return "what does the document say about " + " ".join(rng.choices(WORDS, k=4)) + "?"
+
+    users = [f"load-user-{i}" for i in range(args.users)]
+    documents = [make_txt(args.pages, seed=i) for i in range(args.uploads)]
+    results = {}
+    limits = httpx.Limits(max_connections=max(args.concurrency, args.upload_concurrency) * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+
+        async def upload(i):
+            async def call():
+                response = await client.post(
+                    "/upload-knowledge",
+                    data={"username": users[i % len(users)]},
+                    files={"file": (f"doc-{i}.txt", documents[i], "text/plain")},
+                )
+                response.raise_for_status()
+                return response.json()
+
+            body = await timed_call(recorder, call)
+            if body and body.get("stats"):
+                stats = body["stats"]
+                recorder.stage_values({"ingest_ms": stats.get("seconds", 0) * 1000, "chunks": stats.get("chunks", 0)})
+
+        def chat_request(i, rng):
+            return {
+                "username": users[i % len(users)],
+                "query": random_question(rng),
+                "session_id": sessions[i % len(sessions)] if sessions and rng.random() < args.follow_up else None,
+                "no_of_chunks": args.chunks,
+                "mode": args.mode,
+            }
+
+        async def chat(i):
+            rng = random.Random(i)
+
+            async def call():
+                response = await client.post("/chat", json=chat_request(i, rng))
+                response.raise_for_status()
+                return response.json()
+
+            body = await timed_call(recorder, call)
+            if body:
+                recorder.stage_values(body["debug_info"]["pipeline"].get("timings", {}))
+                if len(sessions) < args.users:
+                    sessions.append(body["session_id"])
+
+        async def chat_stream(i):
+            rng = random.Random(10 ** 6 + i)
+            first_chunk = []
+
+            async def call():
+                started = time.perf_counter()
+                final = {}
+                async with client.stream("POST", "/chat_stream", json=chat_request(i, rng)) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        event = json.loads(line)
+                        if "chunk" in event and not first_chunk:
+                            first_chunk.append((time.perf_counter() - started) * 1000)
+                        if "debug_info" in event:
+                            final = event
+                return final
+
+            body = await timed_call(recorder, call)
+            if body:
+                recorder.stage_values(body["debug_info"]["pipeline"].get("timings", {}))
+                if first_chunk:
+                    recorder.stages["ttfb_ms"].append(first_chunk[0])
+
+        sessions = []
+        plan = {
+            "upload": (upload, args.uploads, args.upload_concurrency),
+            "chat": (chat, args.requests, args.concurrency),
+            "chat_stream": (chat_stream, args.requests, args.concurrency),
+        }
+        for phase in args.phases:
+            request, count, concurrency = plan[phase]
+            recorder = PhaseRecorder()
+            seconds = await run_phase(count, concurrency, request)
+            results[phase] = recorder.report(seconds)
+            latency = results[phase]["latency_ms"]
+            print(f"{phase:<12} {len(recorder.latencies):>6} {sum(recorder.errors.values()):>6} "
+                  f"{results[phase]['throughput_rps']:>8.2f} {latency.get('p50', 0):>9.1f} "
+                  f"{latency.get('p95', 0):>9.1f} {latency.get('p99', 0):>9.1f}")
+        # The server's own view of the run, in Prometheus text format
+        results["_metrics"] = (await client.get("/metrics")).text
+    return results
+
+
+def print_stages(results: dict):
+    for phase, result in results.items():
+        for stage, summary in result["stages_ms"].items():
+            if summary["count"]:
+                print(f"  {phase:<12} {stage:<22} p50={summary['p50']:>9.1f} p95={summary['p95']:>9.1f} "
+                      f"p99={summary['p99']:>9.1f}")
+
+
+def compare(previous_path: str, results: dict):
+    previous = json.loads(Path(previous_path).read_text())["endpoints"]
+    print(f"\nchange vs {previous_path}")
+    for phase, result in results.items():
+        if phase not in previous:
+            continue
+        old, new = previous[phase], result
+
+        def delta(a, b):
+            return f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+
+        print(f"  {phase:<12} throughput {delta(old['throughput_rps'], new['throughput_rps']):>8}  "
+              f"p50 {delta(old['latency_ms'].get('p50', 0), new['latency_ms'].get('p50', 0)):>8}  "
+              f"p95 {delta(old['latency_ms'].get('p95', 0), new['latency_ms'].get('p95', 0)):>8}  "
+              f"p99 {delta(old['latency_ms'].get('p99', 0), new['latency_ms'].get('p99', 0)):>8}")
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+    configure_environment(args, workdir)
+    from benchmarks.fake_openai import create_app, serve_in_thread
+
+    fake = create_app(args.embed_latency, args.per_token, chat_latency=args.chat_latency,
+                      chat_tokens_per_second=args.chat_tps, answer_tokens=args.answer_tokens)
+    openai_url, stop_openai = serve_in_thread(fake)
+    # Read when the chat models are created, so setting it after the imports is enough
+    os.environ.update({"OPENAI_API_BASE": openai_url, "OPENAI_BASE_URL": openai_url})
+
+    from app.main import app
+    install_indexer(args, openai_url)
+    base_url, stop_app = serve_in_thread(app)
+    base_url = base_url[:-len("/v1")]
+
+    print(f"users={args.users} uploads={args.uploads}x{args.pages}p requests={args.requests} "
+          f"concurrency={args.concurrency} mode={args.mode}")
+    print(f"{'phase':<12} {'ok':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    try:
+        results = asyncio.run(drive(args, base_url))
+    finally:
+        stop_app()
+        stop_openai()
+    server_metrics = results.pop("_metrics")
+    print_stages(results)
+
+    output = Path(args.output or f"benchmarks/results/load-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "host": {"python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": vars(args),
+        "fake_openai": fake.state.stats,
+        "endpoints": results,
+    }, indent=2))
+    output.with_suffix(".prom").write_text(server_metrics)
+    print(f"\nresults written to {output} (server metrics in {output.with_suffix('.prom').name})")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--phases", type=lambda s: s.split(","), default=list(PHASES))
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--uploads", type=int, default=16, help="documents uploaded, round-robin over users")
+    parser.add_argument("--pages", type=int, default=10, help="pages per uploaded document")
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200, help="requests per chat phase")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--follow-up", type=float, default=0.5, help="share of chat requests continuing a session")
+    parser.add_argument("--chunks", type=int, default=5)
+    parser.add_argument("--mode", default="hybrid", choices=("dense", "sparse", "hybrid"))
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="fake embedding seconds per request")
+    parser.add_argument("--per-token", type=float, default=2e-6, help="fake embedding seconds per input token")
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="fake LLM seconds to the first token")
+    parser.add_argument("--chat-tps", type=float, default=100.0, help="fake LLM tokens per second")
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--fastembed", action="store_true", help="use the real FastEmbed BM25 model")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app setting")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/load-<time>.json)")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    main(parser.parse_args())
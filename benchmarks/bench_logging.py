@@ -0,0 +1,131 @@
+"""
+Request latency with logging off, with the old synchronous handlers and
+with the queued handler of app/services/logger.py.
+
+A small FastAPI app (behind RequestIdMiddleware) serves an endpoint that
+logs like /chat does: --records short INFO lines plus one line carrying
+a --payload-kb chat history. Requests run in-process through httpx's ASGI
+transport with --concurrency clients, so the numbers are the time the
+event loop spends per request. Both handler setups write to a file and a
+console stream (a second file here, so the terminal stays readable):
+  - off:    the logger is set to WARNING
+  - sync:   FileHandler + StreamHandler, full payload written on the loop
+  - queued: CappedQueueHandler + background QueueListener, payload cut to
+            LOG_MAX_FIELD_CHARS, JSON records with request ids
+  - counts: queued, logging the number of messages instead of the history
+            (what the app's INFO records do now)
+Run from the repository root:
+    python -m benchmarks.bench_logging --requests 2000 --concurrency 32 --payload-kb 256
+"""
+import argparse
+import asyncio
+import logging
+import os
+import queue
+import tempfile
+import time
+from logging.handlers import QueueListener
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+
+from app.services.logger import CappedQueueHandler, ContextFilter, JsonFormatter, RequestIdMiddleware
+
+SETUPS = ("off", "sync", "queued", "counts")
+
+
+def configure(setup: str, workdir: str):
+    """A fresh 'bench' logger for `setup`; returns it and a function that flushes and detaches it."""
+    bench_logger = logging.getLogger(f"bench.{setup}")
+    bench_logger.propagate = False
+    sinks = [logging.FileHandler(os.path.join(workdir, f"{setup}.log")),
+             logging.StreamHandler(open(os.path.join(workdir, f"{setup}.console"), "w"))]
+    listener = None
+    if setup in ("queued", "counts"):
+        for sink in sinks:
+            sink.setFormatter(JsonFormatter())
+        handler = CappedQueueHandler(queue.Queue(10000))
+        handler.addFilter(ContextFilter())
+        listener = QueueListener(handler.queue, *sinks)
+        listener.start()
+        bench_logger.addHandler(handler)
+    else:
+        for sink in sinks:
+            sink.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+            bench_logger.addHandler(sink)
+    bench_logger.setLevel(logging.WARNING if setup == "off" else logging.INFO)
+
+    def close():
+        if listener is not None:
+            listener.stop()
+        for sink in sinks:
+            sink.close()
+
+    return bench_logger, close
+
+
+def create_app(bench_logger, records: int, history: list, counts: bool) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(RequestIdMiddleware)
+
+    @app.post("/chat")
+    async def chat():
+        for i in range(records):
+            bench_logger.info(f"Pipeline step {i} for user bench-user")
+        if counts:
+            bench_logger.info(f"Fetched {len(history)} past messages")
+        else:
+            bench_logger.info(f"Fetched past messages: {history}")
+        return {"response": "ok"}
+
+    return app
+
+
+async def drive(app, requests: int, concurrency: int):
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        indexes = iter(range(requests))
+
+        async def worker():
+            for _ in indexes:
+                started = time.perf_counter()
+                (await client.post("/chat")).raise_for_status()
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, time.perf_counter() - started
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="bench_logging_")
+    # The client's own per-request log lines would go through the app's root handler
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    message = "x" * 1024
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": message} for i in range(args.payload_kb)]
+    print(f"requests={args.requests} concurrency={args.concurrency} records={args.records}+1 "
+          f"payload={args.payload_kb} KiB (logs in {workdir})")
+    print(f"{'setup':<8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'log MiB':>8}")
+    for setup in args.setups:
+        bench_logger, close = configure(setup, workdir)
+        app = create_app(bench_logger, args.records, history, counts=setup == "counts")
+        asyncio.run(drive(app, min(200, args.requests), args.concurrency))  # warm-up
+        latencies, seconds = asyncio.run(drive(app, args.requests, args.concurrency))
+        close()
+        written = sum(os.path.getsize(os.path.join(workdir, name)) for name in os.listdir(workdir)
+                      if name.startswith(setup + "."))
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"{setup:<8} {len(latencies) / seconds:>8.0f} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f} "
+              f"{written / 2 ** 20:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--records", type=int, default=10, help="short INFO records per request")
+    parser.add_argument("--payload-kb", type=int, default=256, help="size of the logged chat history")
+    parser.add_argument("--setups", type=lambda s: s.split(","), default=list(SETUPS))
+    main(parser.parse_args())
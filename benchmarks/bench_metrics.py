@@ -0,0 +1,64 @@
+"""
+Hot-path cost of the in-process metrics (app/services/metrics.py): one
+counter increment, histogram observation or timer block, single-threaded
+and from several threads at once, plus the cost of rendering /metrics with
+many series.
+
+Run from the repository root:
+    python -m benchmarks.bench_metrics --calls 200000 --threads 4 --series 1000
+"""
+import argparse
+import threading
+import time
+
+from app.services import metrics
+
+
+def per_call_ns(fn, calls: int, threads: int = 1) -> float:
+    def run():
+        for _ in range(calls):
+            fn()
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (calls * threads) * 1e9
+
+
+def main(args):
+    def increment():
+        metrics.increment("bench_total", model="gpt-4o", kind="prompt")
+
+    def observe():
+        metrics.observe("bench_seconds", 0.042, stage="retrieval")
+
+    def timed():
+        with metrics.timer("bench_timer_seconds", stage="retrieval"):
+            pass
+
+    def baseline():
+        time.perf_counter()
+
+    print(f"calls={args.calls} threads={args.threads} (ns per call)")
+    print(f"{'operation':<12} {'1 thread':>10} {f'{args.threads} threads':>11}")
+    for name, fn in (("perf_counter", baseline), ("increment", increment), ("observe", observe), ("timer", timed)):
+        print(f"{name:<12} {per_call_ns(fn, args.calls):>10.0f} {per_call_ns(fn, args.calls, args.threads):>11.0f}")
+
+    for i in range(args.series):
+        metrics.observe("bench_series_seconds", 0.1, username=f"user{i}")
+        metrics.increment("bench_series_total", username=f"user{i}")
+    start = time.perf_counter()
+    text = metrics.render_prometheus()
+    print(f"render /metrics with {args.series} histogram + {args.series} counter series: "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms, {len(text) / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--series", type=int, default=1000)
+    main(parser.parse_args())
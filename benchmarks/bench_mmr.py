@@ -0,0 +1,72 @@
+"""
+Latency of MMR diversity selection over over-fetched candidates:
+`mmr_select` (one matrix-vector product per pick) vs. a full n x n
+similarity matrix and LangChain's `maximal_marginal_relevance` (which
+recomputes similarities to the whole selected set on every step).
+
+Candidates are random 3072-d vectors; "from lists" includes converting the
+JSON float lists Qdrant returns into the candidate matrix. All variants
+must pick the same indices. Run from the repository root:
+    python -m benchmarks.bench_mmr --candidates 100,250,500,1000 --k 5,10
+"""
+import argparse
+import time
+
+import numpy as np
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+from app.utils.mmr import MMR_LAMBDA, mmr_select
+from app.utils.qdrant_utils import DENSE_VECTOR_SIZE
+
+
+def mmr_full_matrix(query, candidates, k, lambda_mult):
+    """Reference variant: precompute every pairwise similarity up front."""
+    candidates = candidates / np.linalg.norm(candidates, axis=1, keepdims=True)
+    query = query / np.linalg.norm(query)
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+    selected = [int(np.argmax(relevance))]
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * similarity[:, selected].max(axis=1)
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+    return selected
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best * 1000
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    query = rng.standard_normal(args.dim).astype(np.float32)
+    print(f"dim={args.dim} lambda={args.mmr_lambda} (best of {args.repeat}, ms)")
+    print(f"{'n':>6} {'k':>4} {'mmr_select':>11} {'from lists':>11} {'full matrix':>12} {'langchain':>10}")
+    for n in args.candidates:
+        # Near-duplicate clusters around the query, as overlapping chunks produce
+        centers = query + rng.standard_normal((max(1, n // 10), args.dim)).astype(np.float32)
+        candidates = centers[rng.integers(0, len(centers), n)] + 0.1 * rng.standard_normal((n, args.dim)).astype(np.float32)
+        as_lists = candidates.tolist()
+        for k in args.k:
+            ours, ours_ms = timed(lambda: mmr_select(query, candidates, k, args.mmr_lambda), args.repeat)
+            _, lists_ms = timed(lambda: mmr_select(query, as_lists, k, args.mmr_lambda), args.repeat)
+            full, full_ms = timed(lambda: mmr_full_matrix(query, candidates, k, args.mmr_lambda), args.repeat)
+            reference, langchain_ms = timed(
+                lambda: maximal_marginal_relevance(query, candidates, args.mmr_lambda, k), args.repeat)
+            assert ours == full == reference, (ours, full, reference)
+            print(f"{n:>6} {k:>4} {ours_ms:>11.2f} {lists_ms:>11.2f} {full_ms:>12.2f} {langchain_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=lambda s: [int(x) for x in s.split(",")], default=[100, 250, 500, 1000])
+    parser.add_argument("--k", type=lambda s: [int(x) for x in s.split(",")], default=[5, 10])
+    parser.add_argument("--dim", type=int, default=DENSE_VECTOR_SIZE)
+    parser.add_argument("--mmr-lambda", type=float, default=MMR_LAMBDA)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
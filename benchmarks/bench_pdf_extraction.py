@@ -0,0 +1,56 @@
+"""
+PDF text extraction throughput: the single-threaded page loop vs. the
+page-sharded process-pool extractor, on synthetic PDFs. Both paths must
+return the same pages in the same order; the benchmark checks this.
+
+The pool is warmed up before timing so process start-up is not counted.
+Speed-up is bounded by the number of cores. Run from the repository root:
+    python -m benchmarks.bench_pdf_extraction --pages 100,1000 --workers 4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from app.utils import utils
+from app.utils.utils import extract_pdf_page_range, get_pdf_pool, iter_pdf_pages, shutdown_pdf_pool
+from benchmarks.stubs import make_pdf
+
+
+def extract(path, parallel, shard_pages):
+    with open(path, "rb") as f:
+        return list(iter_pdf_pages(f, parallel=parallel, shard_pages=shard_pages))
+
+
+def main(args):
+    utils.PDF_EXTRACT_WORKERS = args.workers
+    pool = get_pdf_pool()
+    # Spawned workers import the app on first use; do that before timing
+    list(pool.map(extract_pdf_page_range, [make_pdf(1)] * args.workers, [0] * args.workers, [1] * args.workers))
+
+    directory = tempfile.mkdtemp(prefix="bench_pdf_")
+    print(f"cores={os.cpu_count()} workers={args.workers} shard_pages={args.shard_pages or 'auto'}")
+    print(f"{'pages':>6} {'path':<10} {'seconds':>8} {'pages/s':>9} {'speed-up':>9}")
+    try:
+        for pages in args.pages:
+            path = os.path.join(directory, f"doc-{pages}.pdf")
+            with open(path, "wb") as f:
+                f.write(make_pdf(pages))
+            results, baseline = {}, None
+            for name, parallel in (("serial", False), ("parallel", True)):
+                start = time.perf_counter()
+                results[name] = extract(path, parallel, args.shard_pages)
+                elapsed = time.perf_counter() - start
+                baseline = baseline or elapsed
+                print(f"{pages:>6} {name:<10} {elapsed:>8.2f} {pages / elapsed:>9.1f} {baseline / elapsed:>8.2f}x")
+            assert results["serial"] == results["parallel"], "parallel extraction changed the output"
+    finally:
+        shutdown_pdf_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=lambda s: [int(x) for x in s.split(",")], default=[100, 1000])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shard-pages", type=int, default=None, help="default: PDF_SHARD_PAGES or automatic")
+    main(parser.parse_args())
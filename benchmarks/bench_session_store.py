@@ -0,0 +1,124 @@
+"""
+Chat history reads and writes on a large chat_logs table: the previous
+per-call approach (schema DDL + fresh connection + commit per write, full
+table scan per read) vs. the pooled, indexed, WAL-mode SessionStore with
+group commit.
+
+Run from the repository root:
+    python -m benchmarks.bench_session_store --rows 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import aiosqlite
+
+from app.utils.db_utils import SessionStore
+
+LEGACY_SCHEMA = "CREATE TABLE IF NOT EXISTS chat_logs (session_id TEXT, user_query TEXT, gpt_response TEXT)"
+
+
+def _populate(path, rows, sessions):
+    connection = sqlite3.connect(path)
+    connection.execute(LEGACY_SCHEMA)
+    batch = []
+    for i in range(rows):
+        batch.append((f"session-{i % sessions}", f"question {i}", f"answer {i} " * 8))
+        if len(batch) == 50000:
+            connection.executemany("INSERT INTO chat_logs VALUES (?, ?, ?)", batch)
+            batch = []
+    if batch:
+        connection.executemany("INSERT INTO chat_logs VALUES (?, ?, ?)", batch)
+    connection.commit()
+    connection.close()
+
+
+async def _legacy_ensure_schema(path):
+    async with aiosqlite.connect(path) as connection:
+        await connection.execute(LEGACY_SCHEMA)
+        await connection.commit()
+
+
+async def legacy_add(path, session_id, query, response):
+    await _legacy_ensure_schema(path)
+    async with aiosqlite.connect(path) as connection:
+        await connection.execute(
+            "INSERT INTO chat_logs (session_id, user_query, gpt_response) VALUES (?, ?, ?)",
+            (session_id, query, response),
+        )
+        await connection.commit()
+
+
+async def legacy_get(path, session_id):
+    await _legacy_ensure_schema(path)
+    messages = []
+    async with aiosqlite.connect(path) as connection:
+        async with connection.execute(
+            "SELECT user_query, gpt_response FROM chat_logs WHERE session_id=?", (session_id,)
+        ) as cursor:
+            async for row in cursor:
+                messages.append({"role": "user", "content": row[0]})
+                messages.append({"role": "assistant", "content": row[1]})
+    return messages
+
+
+async def _measure(fn, args_list, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(args):
+        async with semaphore:
+            start = time.perf_counter()
+            await fn(*args)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(args) for args in args_list))
+    elapsed = time.perf_counter() - start
+    return len(args_list) / elapsed, statistics.median(latencies)
+
+
+def _print(name, result):
+    ops, p50 = result
+    print(f"{name:<34} {ops:>10.1f} ops/s   p50={p50:8.2f} ms")
+
+
+async def main(args):
+    directory = tempfile.mkdtemp(prefix="bench_session_store_")
+    legacy_path = os.path.join(directory, "legacy.db")
+    store_path = os.path.join(directory, "store.db")
+    print(f"Populating {args.rows} rows over {args.sessions} sessions...")
+    _populate(legacy_path, args.rows, args.sessions)
+    _populate(store_path, args.rows, args.sessions)
+
+    rng = random.Random(0)
+    reads = [(f"session-{rng.randrange(args.sessions)}",) for _ in range(args.reads)]
+    writes = [(f"session-{rng.randrange(args.sessions)}", "q", "a") for _ in range(args.writes)]
+
+    _print("legacy read (full scan)", await _measure(lambda s: legacy_get(legacy_path, s), reads, args.concurrency))
+    _print("legacy write (commit per call)", await _measure(lambda *w: legacy_add(legacy_path, *w), writes, args.concurrency))
+
+    start = time.perf_counter()
+    store = SessionStore(store_path)
+    await store.open()
+    print(f"SessionStore open + migration/index build: {time.perf_counter() - start:.2f} s (one-off)")
+    try:
+        _print("store read (indexed, pooled)", await _measure(store.get_history, reads, args.concurrency))
+        _print("store write (group commit)", await _measure(store.add_conversation, writes, args.concurrency))
+    finally:
+        await store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--writes", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
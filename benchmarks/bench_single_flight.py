@@ -0,0 +1,121 @@
+"""
+Bursts of identical concurrent questions with single-flight coalescing on
+and off (app/utils/single_flight.py).
+
+--users users upload the same document, then every burst sends one new
+question from all of them at the same moment, to /chat or /chat_stream.
+Since the documents match, so do the retrieved contexts and the prompts:
+with coalescing the query embedding and the LLM call run once per burst
+(retrieval stays per user, as it is filtered by username). The fake
+OpenAI server (benchmarks/fake_openai.py) counts the upstream calls.
+Reports upstream embedding and chat calls per burst, burst wall time and
+p50/p95 request latency. Run from the repository root:
+    python -m benchmarks.bench_single_flight --users 32 --bursts 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.bench_load import configure_environment, install_indexer
+
+
+def flights():
+    from app.utils import langchain_utils, qdrant_utils
+
+    return [langchain_utils._refine_flight, langchain_utils._retrieval_flight, langchain_utils._completion_flight,
+            langchain_utils._completion_stream_flight, qdrant_utils.get_document_indexer().dense_embedding._query_flight]
+
+
+async def burst(client, users, question, endpoint):
+    async def one(username):
+        started = time.perf_counter()
+        if endpoint == "chat":
+            (await client.post("/chat", json={"username": username, "query": question})).raise_for_status()
+        else:
+            async with client.stream("POST", "/chat_stream", json={"username": username, "query": question}) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line and json.loads(line).get("event") == "error":
+                        raise RuntimeError(line)
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(one(username) for username in users))
+    return latencies, (time.perf_counter() - started) * 1000
+
+
+async def drive(args, base_url, fake):
+    from benchmarks.stubs import make_txt
+
+    users = [f"flight-user-{i}" for i in range(args.users)]
+    document = make_txt(3, seed=0)
+    stats = fake.state.stats
+    async with httpx.AsyncClient(base_url=base_url, timeout=120,
+                                 limits=httpx.Limits(max_connections=args.users * 2)) as client:
+        for username in users:
+            response = await client.post("/upload-knowledge", data={"username": username},
+                                         files={"file": ("shared.txt", document, "text/plain")})
+            response.raise_for_status()
+
+        print(f"{'endpoint':<12} {'coalescing':<10} {'embed/burst':>11} {'llm/burst':>9} {'burst ms':>9} "
+              f"{'p50 ms':>8} {'p95 ms':>8}")
+        question_id = 0
+        for endpoint in args.endpoints:
+            for enabled in (False, True):
+                for flight in flights():
+                    flight.enabled = enabled
+                embeddings, chats = stats["requests"], stats["chat_requests"]
+                latencies, walls = [], []
+                for _ in range(args.bursts):
+                    question_id += 1
+                    # A new question per burst, so the answer cache never answers it
+                    request_latencies, wall = await burst(client, users, f"what does topic {question_id} cover?", endpoint)
+                    latencies += request_latencies
+                    walls.append(wall)
+                p50, p95 = np.percentile(latencies, [50, 95])
+                print(f"{endpoint:<12} {'on' if enabled else 'off':<10} "
+                      f"{(stats['requests'] - embeddings) / args.bursts:>11.1f} "
+                      f"{(stats['chat_requests'] - chats) / args.bursts:>9.1f} {np.mean(walls):>9.1f} "
+                      f"{p50:>8.1f} {p95:>8.1f}")
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="bench_single_flight_")
+    args.fastembed = False
+    args.env = [*args.env, "LOG_LEVEL=WARNING"]
+    configure_environment(args, workdir)
+    from benchmarks.fake_openai import create_app, serve_in_thread
+
+    fake = create_app(args.embed_latency, 2e-6, chat_latency=args.chat_latency,
+                      chat_tokens_per_second=args.chat_tps, answer_tokens=args.answer_tokens)
+    openai_url, stop_openai = serve_in_thread(fake)
+    os.environ.update({"OPENAI_API_BASE": openai_url, "OPENAI_BASE_URL": openai_url})
+
+    from app.main import app
+    install_indexer(args, openai_url)
+    base_url, stop_app = serve_in_thread(app)
+    print(f"users={args.users} bursts={args.bursts} chat_latency={args.chat_latency}s")
+    try:
+        asyncio.run(drive(args, base_url[:-len("/v1")], fake))
+    finally:
+        stop_app()
+        stop_openai()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=32, help="concurrent identical requests per burst")
+    parser.add_argument("--bursts", type=int, default=10)
+    parser.add_argument("--endpoints", type=lambda s: s.split(","), default=["chat", "chat_stream"])
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="fake embedding seconds per request")
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="fake LLM seconds to the first token")
+    parser.add_argument("--chat-tps", type=float, default=200.0, help="fake LLM tokens per second")
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app setting")
+    main(parser.parse_args())
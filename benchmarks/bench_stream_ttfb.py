@@ -0,0 +1,150 @@
+"""
+Time to first byte and event timings of /chat_stream, using the same
+offline stand-ins as bench_load (fake OpenAI server, in-memory Qdrant,
+stub sparse embeddings).
+
+For each stream format (NDJSON, SSE) and each coalescing setting
+(`--coalesce CHARS:MS`, 0:0 sends every token as its own frame) it runs
+`--requests` streams and reports p50/p95 of:
+  - ttfb:    first byte (the session event, sent before any pipeline work)
+  - refined: the refined query event
+  - sources: the retrieved sources event
+  - chunk:   the first answer chunk (what the client first saw before
+             the stream was started ahead of refinement and retrieval)
+  - total:   the end of the stream
+plus the mean number of answer frames and bytes per response. Run from the
+repository root:
+    python -m benchmarks.bench_stream_ttfb --requests 50 --concurrency 4 --coalesce 0:0,64:40
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+import numpy as np
+
+from benchmarks.bench_load import configure_environment, install_indexer
+
+EVENTS = ("ttfb", "refined", "sources", "chunk", "total")
+
+
+def parse_frames(text: str, sse: bool):
+    """(event name, payload) of each complete frame in `text`, and the unparsed remainder."""
+    separator = "\n\n" if sse else "\n"
+    *frames, rest = text.split(separator)
+    parsed = []
+    for frame in frames:
+        if not frame:
+            continue
+        if sse:
+            fields = dict(line.split(": ", 1) for line in frame.split("\n"))
+            parsed.append((fields["event"], json.loads(fields["data"])))
+        else:
+            payload = json.loads(frame)
+            name = payload.get("event") or ("session" if "session_id" in payload else "chunk")
+            parsed.append((name, payload))
+    return parsed, rest
+
+
+async def one_stream(client, body, sse: bool) -> dict:
+    headers = {"Accept": "text/event-stream"} if sse else {}
+    started = time.perf_counter()
+    marks, frames, size, text = {}, 0, 0, ""
+    async with client.stream("POST", "/chat_stream", json=body, headers=headers) as response:
+        response.raise_for_status()
+        async for data in response.aiter_text():
+            elapsed = (time.perf_counter() - started) * 1000
+            marks.setdefault("ttfb", elapsed)
+            size += len(data)
+            parsed, text = parse_frames(text + data, sse)
+            for name, payload in parsed:
+                if name == "error":
+                    raise RuntimeError(payload["detail"])
+                if name == "chunk":
+                    frames += 1
+                if name in EVENTS:
+                    marks.setdefault(name, elapsed)
+    marks["total"] = (time.perf_counter() - started) * 1000
+    return {"marks": marks, "frames": frames, "bytes": size}
+
+
+async def drive(args, base_url: str):
+    from app.utils import streaming
+    from benchmarks.stubs import WORDS, make_txt
+
+    rng = random.Random(0)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as client:
+        for i in range(args.documents):
+            response = await client.post("/upload-knowledge", data={"username": "ttfb-user"},
+                                         files={"file": (f"doc-{i}.txt", make_txt(5, seed=i), "text/plain")})
+            response.raise_for_status()
+
+        print(f"{'format':<7} {'coalesce':>9} " + " ".join(f"{name + ' p50/p95':>17}" for name in EVENTS)
+              + f" {'frames':>7} {'bytes':>7}")
+        for sse in (False, True):
+            for chars, ms in args.coalesce:
+                streaming.STREAM_COALESCE_CHARS, streaming.STREAM_COALESCE_MS = chars, ms
+                results = []
+                bodies = iter(range(args.requests))
+
+                async def worker():
+                    for _ in bodies:
+                        query = "what does the document say about " + " ".join(rng.choices(WORDS, k=4)) + "?"
+                        results.append(await one_stream(client, {"username": "ttfb-user", "query": query}, sse))
+
+                await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+                marks = defaultdict(list)
+                for result in results:
+                    for name, value in result["marks"].items():
+                        marks[name].append(value)
+                cells = []
+                for name in EVENTS:
+                    p50, p95 = np.percentile(marks[name], [50, 95]) if marks[name] else (0, 0)
+                    cells.append(f"{p50:>8.1f}/{p95:<8.1f}")
+                print(f"{'sse' if sse else 'ndjson':<7} {f'{chars}:{ms:g}':>9} " + " ".join(cells)
+                      + f" {np.mean([r['frames'] for r in results]):>7.1f} {np.mean([r['bytes'] for r in results]):>7.0f}")
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="bench_stream_ttfb_")
+    args.fastembed = False
+    configure_environment(args, workdir)
+    from benchmarks.fake_openai import create_app, serve_in_thread
+
+    fake = create_app(args.embed_latency, 2e-6, chat_latency=args.chat_latency,
+                      chat_tokens_per_second=args.chat_tps, answer_tokens=args.answer_tokens)
+    openai_url, stop_openai = serve_in_thread(fake)
+    os.environ.update({"OPENAI_API_BASE": openai_url, "OPENAI_BASE_URL": openai_url})
+
+    from app.main import app
+    install_indexer(args, openai_url)
+    base_url, stop_app = serve_in_thread(app)
+    print(f"requests={args.requests} concurrency={args.concurrency} chat_latency={args.chat_latency}s "
+          f"chat_tps={args.chat_tps} answer_tokens={args.answer_tokens} (ms from request start)")
+    try:
+        asyncio.run(drive(args, base_url[:-len("/v1")]))
+    finally:
+        stop_app()
+        stop_openai()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50, help="streams per format and coalescing setting")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--documents", type=int, default=4, help="documents indexed before the run")
+    parser.add_argument("--coalesce", default=[(0, 0.0), (64, 40.0)],
+                        type=lambda s: [(int(c), float(m)) for c, m in (item.split(":") for item in s.split(","))],
+                        help="comma-separated CHARS:MS coalescing settings")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="fake embedding seconds per request")
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="fake LLM seconds to the first token")
+    parser.add_argument("--chat-tps", type=float, default=200.0, help="fake LLM tokens per second")
+    parser.add_argument("--answer-tokens", type=int, default=128)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app setting")
+    main(parser.parse_args())
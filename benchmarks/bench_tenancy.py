@@ -0,0 +1,133 @@
+"""
+Per-user filtered search latency as the number of tenants grows, for the
+TENANCY_MODE layouts (see app/utils/tenancy.py):
+  - shared:  one collection, plain keyword index on metadata.username
+  - payload: one collection, tenant index (is_tenant) and per-tenant HNSW
+             graphs (m=0, payload_m)
+  - tiered:  payload, plus dedicated collections for tenants holding at
+             least --threshold points
+
+Tenant corpus sizes follow a Zipf distribution (a few heavy users, a long
+tail), and each query searches a random tenant with the same username
+filter `get_retriever_for_user` applies. Vectors are random; only latency
+is measured.
+
+Local mode (the default, ":memory:") ignores payload indexes and HNSW
+settings and scans every point, so only the tiered layout's smaller
+collections show up there. Use --qdrant-url http://localhost:6333 for
+meaningful shared/payload numbers. Run from the repository root:
+    python -m benchmarks.bench_tenancy --tenants 10,100,1000 --points 20000
+"""
+import argparse
+import time
+import uuid
+import warnings
+
+import numpy as np
+from qdrant_client.http.models import Distance, PointStruct, VectorParams
+
+from app.utils.qdrant_utils import DENSE_VECTOR_NAME, create_qdrant_client, tenant_filter
+from app.utils.tenancy import dedicated_collection_name, shared_hnsw_config, username_index_params
+
+LAYOUTS = ("shared", "payload", "tiered")
+
+
+def tenant_sizes(points: int, tenants: int, rng) -> np.ndarray:
+    """Zipf-shaped corpus sizes summing to `points`, every tenant with at least one point."""
+    weights = 1.0 / np.arange(1, tenants + 1) ** 1.1
+    sizes = np.maximum(1, np.floor(points * weights / weights.sum())).astype(int)
+    sizes[0] += points - sizes.sum()
+    return rng.permutation(sizes)
+
+
+def create_collection(client, name, dim, layout, shared):
+    client.create_collection(
+        collection_name=name,
+        vectors_config={DENSE_VECTOR_NAME: VectorParams(size=dim, distance=Distance.COSINE)},
+        hnsw_config=shared_hnsw_config(layout) if shared else None,
+    )
+    client.create_payload_index(
+        collection_name=name,
+        field_name="metadata.username",
+        field_schema=username_index_params(layout if shared else "shared"),
+    )
+
+
+def wait_indexed(client, names, timeout=300):
+    """Let the optimizer finish building the HNSW graphs before timing queries."""
+    deadline = time.monotonic() + timeout
+    for name in names:
+        while client.get_collection(name).status != "green" and time.monotonic() < deadline:
+            time.sleep(0.5)
+
+
+def build(client, layout, sizes, dim, threshold, rng, batch_size=512):
+    """Load the corpus in `layout`; returns {username: collection} and the collections created."""
+    base = f"bench_tenancy_{layout}_{uuid.uuid4().hex[:8]}"
+    create_collection(client, base, dim, layout, shared=True)
+    placement, collections = {}, [base]
+    for tenant, size in enumerate(sizes):
+        username = f"user{tenant}"
+        collection = base
+        if layout == "tiered" and size >= threshold:
+            collection = dedicated_collection_name(base, username)
+            create_collection(client, collection, dim, layout, shared=False)
+            collections.append(collection)
+        placement[username] = collection
+        vectors = rng.standard_normal((size, dim), dtype=np.float32)
+        for start in range(0, size, batch_size):
+            client.upsert(collection, [
+                PointStruct(id=str(uuid.uuid4()), vector={DENSE_VECTOR_NAME: vector.tolist()},
+                            payload={"page_content": "", "metadata": {"username": username}})
+                for vector in vectors[start:start + batch_size]
+            ])
+    return placement, collections
+
+
+def measure(client, placement, dim, queries, k, rng):
+    usernames = list(placement)
+    latencies = []
+    for _ in range(queries):
+        username = usernames[rng.integers(len(usernames))]
+        query = rng.standard_normal(dim, dtype=np.float32).tolist()
+        started = time.perf_counter()
+        client.query_points(placement[username], query=query, using=DENSE_VECTOR_NAME,
+                            query_filter=tenant_filter(username), limit=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return np.percentile(latencies, [50, 95, 99])
+
+
+def main(args):
+    warnings.filterwarnings("ignore", message="Payload indexes have no effect")
+    client = create_qdrant_client(args.qdrant_url)
+    local = args.qdrant_url == ":memory:"
+    print(f"points={args.points} dim={args.dim} queries={args.queries} k={args.k} threshold={args.threshold} "
+          f"qdrant={args.qdrant_url}" + (" (local mode: full scans, indexes not applied)" if local else ""))
+    print(f"{'tenants':>8} {'largest':>8} {'layout':>8} {'dedicated':>9} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}")
+    for tenants in args.tenants:
+        rng = np.random.default_rng(tenants)
+        sizes = tenant_sizes(args.points, tenants, rng)
+        for layout in args.layouts:
+            placement, collections = build(client, layout, sizes, args.dim, args.threshold, rng)
+            try:
+                if not local:
+                    wait_indexed(client, collections)
+                p50, p95, p99 = measure(client, placement, args.dim, args.queries, args.k, rng)
+                print(f"{tenants:>8} {sizes.max():>8} {layout:>8} {len(collections) - 1:>9} "
+                      f"{p50:>7.2f} {p95:>7.2f} {p99:>7.2f}")
+            finally:
+                for name in collections:
+                    client.delete_collection(name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=lambda s: [int(x) for x in s.split(",")], default=[10, 100, 1000])
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--threshold", type=int, default=2000, help="points at which tiered gives a tenant its own collection")
+    parser.add_argument("--layouts", type=lambda s: s.split(","), default=list(LAYOUTS))
+    parser.add_argument("--qdrant-url", default=":memory:")
+    main(parser.parse_args())
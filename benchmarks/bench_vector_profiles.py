@@ -0,0 +1,144 @@
+"""
+Recall and latency of the dense-vector collection profiles (see
+app/utils/vector_profiles.py) on synthetic embeddings.
+
+Ground truth is exact cosine top-k on the full 3072-dim float vectors.
+Synthetic vectors have most of their energy in the leading dimensions, as
+Matryoshka embeddings do, so truncation behaves qualitatively like
+text-embedding-3 `dimensions`. Real embeddings will score differently.
+
+Each profile is measured two ways:
+  - simulated: NumPy reproduction of the quantized search (int8 scalar with
+    0.99 quantile clipping, or 1-bit sign codes), oversampling and rescoring
+    with the originals. This gives recall and RAM per vector.
+  - qdrant: the profile's collection config and search params against a
+    real Qdrant, giving recall and query latency. Local mode (the default,
+    ":memory:") always searches exactly and ignores quantization, so use
+    --qdrant-url http://localhost:6333 for meaningful quantized numbers.
+
+Run from the repository root:
+    python -m benchmarks.bench_vector_profiles --points 5000 --queries 100 --profiles full,scalar,binary,compact
+"""
+import argparse
+import time
+import uuid
+import warnings
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct
+
+from app.utils.vector_profiles import NATIVE_DENSE_DIMENSIONS, PROFILES, CollectionProfile
+from app.utils.qdrant_utils import DENSE_VECTOR_NAME, create_qdrant_client
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def synthetic_corpus(points: int, queries: int, dim: int, spread: float = 1.5, seed: int = 0, cluster_size: int = 20):
+    """
+    Topic clusters of points (like chunks of related documents) and queries
+    near a topic; a larger `spread` makes neighbours harder to separate.
+    """
+    rng = np.random.default_rng(seed)
+    # Decaying per-dimension scale: leading dimensions carry most of the signal
+    scale = (1 + np.arange(dim) / 256.0) ** -0.5
+
+    def noise(rows):
+        return normalize(rng.standard_normal((rows, dim), dtype=np.float32) * scale)
+
+    centers = noise(max(1, points // cluster_size))
+    corpus = normalize(centers[rng.integers(0, len(centers), points)] + spread * noise(points))
+    query_vectors = normalize(centers[rng.integers(0, len(centers), queries)] + spread * noise(queries))
+    return corpus, query_vectors
+
+
+def exact_top_k(corpus, query_vectors, k):
+    return np.argsort(-(query_vectors @ corpus.T), axis=1)[:, :k]
+
+
+def recall(found, truth) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def simulate(profile: CollectionProfile, corpus, query_vectors, k):
+    """Top-k ids per query as the profile's quantized search would return them."""
+    stored = normalize(corpus[:, :profile.dimensions])
+    queries = normalize(query_vectors[:, :profile.dimensions])
+    if profile.quantization == "scalar":
+        low, high = np.quantile(stored, [0.005, 0.995])
+        step = (high - low) / 255
+        codes = np.clip(np.round((stored - low) / step), 0, 255)
+        approximate = (codes * step + low) @ queries.T
+    elif profile.quantization == "binary":
+        approximate = np.sign(stored) @ np.sign(queries).T
+    else:
+        approximate = stored @ queries.T
+    limit = int(np.ceil(k * profile.oversampling)) if profile.quantization else k
+    candidates = np.argsort(-approximate.T, axis=1)[:, :limit]
+    if profile.quantization and profile.rescore:
+        rescored = np.einsum("qd,qcd->qc", queries, stored[candidates])
+        order = np.argsort(-rescored, axis=1)
+        candidates = np.take_along_axis(candidates, order, axis=1)
+    return candidates[:, :k]
+
+
+def run_qdrant(client: QdrantClient, profile: CollectionProfile, corpus, query_vectors, k, batch_size=256):
+    name = f"bench_profile_{profile.name}_{uuid.uuid4().hex[:8]}"
+    client.create_collection(
+        collection_name=name,
+        vectors_config={DENSE_VECTOR_NAME: profile.vector_params()},
+        quantization_config=profile.quantization_config(),
+    )
+    try:
+        stored = normalize(corpus[:, :profile.dimensions])
+        for start in range(0, len(stored), batch_size):
+            client.upsert(name, [
+                PointStruct(id=start + i, vector={DENSE_VECTOR_NAME: vector.tolist()})
+                for i, vector in enumerate(stored[start:start + batch_size])
+            ])
+        found, latencies = [], []
+        for query in normalize(query_vectors[:, :profile.dimensions]):
+            started = time.perf_counter()
+            result = client.query_points(
+                name, query=query.tolist(), using=DENSE_VECTOR_NAME, limit=k, search_params=profile.search_params())
+            latencies.append((time.perf_counter() - started) * 1000)
+            found.append([point.id for point in result.points])
+        return found, np.percentile(latencies, [50, 95])
+    finally:
+        client.delete_collection(name)
+
+
+def main(args):
+    warnings.filterwarnings("ignore", message="Local mode performs exact")
+    corpus, query_vectors = synthetic_corpus(args.points, args.queries, NATIVE_DENSE_DIMENSIONS, args.spread)
+    truth = exact_top_k(corpus, query_vectors, args.k)
+    client = create_qdrant_client(args.qdrant_url) if args.qdrant_url else None
+    local = args.qdrant_url == ":memory:"
+
+    print(f"points={args.points} queries={args.queries} k={args.k} spread={args.spread} qdrant={args.qdrant_url or 'off'}"
+          + (" (local mode: exact search, quantization not applied)" if local else ""))
+    print(f"{'profile':<9} {'dims':>5} {'quant':>7} {'disk':>5} {'overs.':>6} {'RAM B/vec':>10} "
+          f"{'sim recall':>11} {'qd recall':>10} {'p50 ms':>7} {'p95 ms':>7}")
+    for name in args.profiles:
+        profile = PROFILES[name]
+        simulated = recall(simulate(profile, corpus, query_vectors, args.k), truth)
+        measured, p50, p95 = "-", "-", "-"
+        if client is not None:
+            found, (p50_ms, p95_ms) = run_qdrant(client, profile, corpus, query_vectors, args.k)
+            measured, p50, p95 = f"{recall(found, truth):.3f}", f"{p50_ms:.2f}", f"{p95_ms:.2f}"
+        print(f"{profile.name:<9} {profile.dimensions:>5} {profile.quantization or '-':>7} {str(profile.on_disk):>5} "
+              f"{profile.oversampling:>6.1f} {profile.ram_bytes_per_vector():>10} {simulated:>11.3f} "
+              f"{measured:>10} {p50:>7} {p95:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--spread", type=float, default=1.5, help="within-topic noise of the synthetic vectors")
+    parser.add_argument("--profiles", type=lambda s: s.split(","), default=list(PROFILES))
+    parser.add_argument("--qdrant-url", default=":memory:", help="Qdrant to measure against ('' to skip)")
+    main(parser.parse_args())
@@ -0,0 +1,161 @@
+"""
+/chat throughput of the production launcher (run.py) against the previous
+single-worker setup.
+
+Each configuration starts `run.py` in a subprocess and drives /chat with
+--concurrency clients for --requests requests:
+  - single:     one worker on the asyncio loop and h11, as `app/main.py`
+                used to run
+  - single-fast: one worker with uvloop/httptools (when installed)
+  - workers=N:  the --workers values, forked from a preloading gunicorn
+                master when gunicorn is installed
+
+The workers talk to benchmarks/fake_openai.py (a separate process) for
+embeddings and the LLM, and use stub sparse embeddings. Qdrant runs in
+local in-memory mode, which is per process, so every worker searches its
+own empty collection: the comparison covers the serving stack (request
+parsing, refinement, query embedding, search, LLM call, history write),
+not retrieval quality. Multi-worker gains need as many free cores as
+workers. Run from the repository root:
+    python -m benchmarks.bench_workers --workers 2,4 --requests 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.bench_load import configure_environment
+
+
+def __getattr__(name):
+    # `benchmarks.bench_workers:app` is what the launched workers serve
+    if name != "app":
+        raise AttributeError(name)
+    from langchain_openai import OpenAIEmbeddings
+    from app.main import app
+    from app.utils import qdrant_utils
+    from benchmarks.stubs import StubSparseEmbeddings
+
+    # Loaded before the fork like the real BM25 model, so preload_models does not download it
+    qdrant_utils._sparse_embedding = StubSparseEmbeddings()
+
+    def get_document_indexer():
+        # Called by init_document_indexer in each worker's lifespan
+        if qdrant_utils._document_indexer is None:
+            dense = OpenAIEmbeddings(model=qdrant_utils.DENSE_EMBEDDING_MODEL, base_url=os.environ["OPENAI_BASE_URL"],
+                                     api_key="sk-local", max_retries=0, check_embedding_ctx_length=False,
+                                     dimensions=qdrant_utils.DENSE_VECTOR_SIZE)
+            qdrant_utils._document_indexer = qdrant_utils.DocumentIndexer(":memory:", dense_embedding=dense)
+        return qdrant_utils._document_indexer
+
+    qdrant_utils.get_document_indexer = get_document_indexer
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url: str, process, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(url)
+
+
+async def drive(base_url: str, requests: int, concurrency: int):
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        indexes = iter(range(requests))
+
+        async def worker():
+            nonlocal errors
+            for i in indexes:
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/chat", json={
+                        "username": f"workers-user-{i % 16}", "query": f"what is said about topic {i}?"})
+                    response.raise_for_status()
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, errors, time.perf_counter() - started
+
+
+def run_config(label: str, launcher_args, args):
+    port = free_port()
+    process = subprocess.Popen([sys.executable, "run.py", "--app", "benchmarks.bench_workers:app",
+                                "--host", "127.0.0.1", "--port", str(port), *launcher_args],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(base_url + "/metrics", process)
+        asyncio.run(drive(base_url, min(200, args.requests), args.concurrency))  # warm-up
+        latencies, errors, seconds = asyncio.run(drive(base_url, args.requests, args.concurrency))
+    finally:
+        stopping = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=120)
+        stop_ms = (time.perf_counter() - stopping) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0, 0, 0)
+    print(f"{label:<12} {len(latencies) / seconds:>8.1f} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f} {errors:>7} {stop_ms:>8.0f}")
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="bench_workers_")
+    args.env = [*args.env, "LOG_LEVEL=WARNING"]
+    configure_environment(args, workdir)
+    fake_port = free_port()
+    fake = subprocess.Popen([sys.executable, "-m", "benchmarks.fake_openai", "--port", str(fake_port),
+                             "--latency", str(args.embed_latency), "--chat-latency", str(args.chat_latency),
+                             "--chat-tps", str(args.chat_tps), "--answer-tokens", str(args.answer_tokens)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    openai_url = f"http://127.0.0.1:{fake_port}/v1"
+    os.environ.update({"OPENAI_API_BASE": openai_url, "OPENAI_BASE_URL": openai_url})
+    try:
+        wait_ready(f"http://127.0.0.1:{fake_port}/docs", fake)
+        print(f"requests={args.requests} concurrency={args.concurrency} cores={os.cpu_count()} "
+              f"chat_latency={args.chat_latency}s")
+        print(f"{'config':<12} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'stop ms':>8}")
+        run_config("single", ["--workers", "1", "--loop", "asyncio", "--http", "h11"], args)
+        run_config("single-fast", ["--workers", "1"], args)
+        for workers in args.workers:
+            run_config(f"workers={workers}", ["--workers", str(workers)], args)
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=lambda s: [int(x) for x in s.split(",")], default=[2, 4])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="fake embedding seconds per request")
+    parser.add_argument("--chat-latency", type=float, default=0.05, help="fake LLM seconds to the first token")
+    parser.add_argument("--chat-tps", type=float, default=2000.0, help="fake LLM tokens per second")
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app setting")
+    main(parser.parse_args())
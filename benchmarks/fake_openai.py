@@ -0,0 +1,196 @@
+"""
+Local stand-in for the OpenAI API used by the benchmarks. It serves
+/v1/embeddings with deterministic vectors, a simulated latency of
+`latency + tokens * per_token` seconds, and its own TPM/RPM limits that
+answer 429 with Retry-After, like the real service.
+
+/v1/chat/completions (plain and streamed) answers after `chat_latency`
+seconds with `answer_tokens` words produced at `chat_tokens_per_second`.
+Models whose name starts with "echo" reply with the last user message
+instantly, which makes a query refiner return the query unchanged.
+
+Run it standalone with
+    python -m benchmarks.fake_openai --port 8100
+or start it in-process with `serve_in_thread(create_app(...))`.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import socket
+import threading
+import time
+import uuid
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.stubs import _seed
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+class _Window:
+    """Requests and tokens accepted during the current one-minute window."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.tokens = 0
+
+    def roll(self):
+        if time.monotonic() - self.started >= 60:
+            self.__init__()
+
+
+def create_app(
+    latency: float = 0.05,
+    per_token: float = 2e-6,
+    tokens_per_minute: int = 0,
+    requests_per_minute: int = 0,
+    dim: int = 256,
+    chat_latency: float = 0.3,
+    chat_tokens_per_second: float = 100.0,
+    answer_tokens: int = 64,
+) -> FastAPI:
+    app = FastAPI()
+    window = _Window()
+    app.state.stats = {"requests": 0, "rejected": 0, "inputs": 0, "tokens": 0, "chat_requests": 0}
+
+    def vector(text: str, size: int) -> np.ndarray:
+        values = np.random.default_rng(_seed(text)).standard_normal(size, dtype=np.float32)
+        return values / np.linalg.norm(values)
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        inputs = [text if isinstance(text, str) else " ".join(map(str, text)) for text in inputs]
+        tokens = sum(estimate_tokens(text) for text in inputs)
+        stats = app.state.stats
+
+        window.roll()
+        over_rpm = requests_per_minute and window.requests + 1 > requests_per_minute
+        over_tpm = tokens_per_minute and window.tokens + tokens > tokens_per_minute
+        if over_rpm or over_tpm:
+            stats["rejected"] += 1
+            retry_after = max(0.0, 60 - (time.monotonic() - window.started))
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": f"{retry_after:.2f}"},
+                content={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+            )
+        window.requests += 1
+        window.tokens += tokens
+        stats["requests"] += 1
+        stats["inputs"] += len(inputs)
+        stats["tokens"] += tokens
+
+        await asyncio.sleep(latency + tokens * per_token)
+        data = []
+        for i, text in enumerate(inputs):
+            values = vector(text, body.get("dimensions") or dim)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(values.tobytes()).decode("ascii")
+            else:
+                embedding = values.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def answer_words(messages):
+        question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        seed = _seed(question)
+        return [f"w{(seed >> (i % 48)) % 997}" for i in range(answer_tokens)]
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.stats["chat_requests"] += 1
+        model = body.get("model", "fake")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        prompt_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in body["messages"])
+        if model.startswith("echo"):
+            question = next((m["content"] for m in reversed(body["messages"]) if m["role"] == "user"), "")
+            words, delay, per_word = question.split(" "), 0.0, 0.0
+        else:
+            words, delay, per_word = answer_words(body["messages"]), chat_latency, 1.0 / chat_tokens_per_second
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                 "total_tokens": prompt_tokens + len(words)}
+
+        def chunk(delta, finish_reason=None):
+            return {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay + per_word * len(words))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        async def events():
+            await asyncio.sleep(delay)
+            yield f"data: {json.dumps(chunk({'role': 'assistant', 'content': ''}))}\n\n"
+            for i, word in enumerate(words):
+                await asyncio.sleep(per_word)
+                yield f"data: {json.dumps(chunk({'content': word if i == 0 else ' ' + word}))}\n\n"
+            yield f"data: {json.dumps(chunk({}, 'stop'))}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                final = chunk({})
+                final.update(choices=[], usage=usage)
+                yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def serve_in_thread(app: FastAPI, host: str = "127.0.0.1", port: int = 0):
+    """Start `app` on a background uvicorn server; returns (base_url, stop)."""
+    if not port:
+        with socket.socket() as sock:
+            sock.bind((host, 0))
+            port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+
+    return f"http://{host}:{port}/v1", stop
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--per-token", type=float, default=2e-6)
+    parser.add_argument("--tpm", type=int, default=0)
+    parser.add_argument("--rpm", type=int, default=0)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="seconds to the first answer token")
+    parser.add_argument("--chat-tps", type=float, default=100.0, help="answer tokens per second")
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    args = parser.parse_args()
+    app = create_app(args.latency, args.per_token, args.tpm, args.rpm, args.dim,
+                     args.chat_latency, args.chat_tps, args.answer_tokens)
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
@@ -0,0 +1,121 @@
+"""
+Local stand-ins shared by the benchmarks: deterministic dense/sparse
+embedders and synthetic PDF/DOCX/TXT documents, so runs need no API keys
+or model downloads.
+"""
+import hashlib
+import io
+import random
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_qdrant.sparse_embeddings import SparseEmbeddings, SparseVector
+
+from app.utils.qdrant_utils import DENSE_VECTOR_SIZE
+
+WORDS = (
+    "retrieval augmented generation vector index query document chunk embedding "
+    "latency throughput session history answer context token budget model server "
+    "qdrant sparse dense hybrid score threshold upload knowledge stream worker"
+).split()
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class StubDenseEmbeddings(Embeddings):
+    """Unit vectors derived from a hash of the text."""
+
+    def __init__(self, dim: int = DENSE_VECTOR_SIZE):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.random.default_rng(_seed(text)).standard_normal(self.dim, dtype=np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self.embed_query(text)
+
+
+class StubSparseEmbeddings(SparseEmbeddings):
+    """Bag-of-words term counts over hashed token ids."""
+
+    def _embed(self, text: str) -> SparseVector:
+        counts = {}
+        for word in text.lower().split():
+            index = _seed(word) % (1 << 20)
+            counts[index] = counts.get(index, 0.0) + 1.0
+        return SparseVector(indices=list(counts), values=list(counts.values()))
+
+    def embed_documents(self, texts: List[str]) -> List[SparseVector]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> SparseVector:
+        return self._embed(text)
+
+
+def synthetic_paragraphs(count: int, seed: int = 0, words: int = 60) -> List[str]:
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+        for _ in range(count)
+    ]
+
+
+def make_pdf(pages: int, lines_per_page: int = 40, seed: int = 0) -> bytes:
+    """A minimal multi-page PDF with Helvetica text lines."""
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for _ in range(pages):
+        lines = [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(lines_per_page)]
+        body = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+        stream = body.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def make_docx(pages: int, paragraphs_per_page: int = 8, seed: int = 0) -> bytes:
+    from docx import Document
+
+    document = Document()
+    for paragraph in synthetic_paragraphs(pages * paragraphs_per_page, seed=seed):
+        document.add_paragraph(paragraph)
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def make_txt(pages: int, paragraphs_per_page: int = 8, seed: int = 0) -> bytes:
+    return "\n\n".join(synthetic_paragraphs(pages * paragraphs_per_page, seed=seed)).encode("utf-8")
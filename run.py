@@ -1,5 +1,127 @@
 # run.py
+"""
+Backend launcher.
+
+    python run.py                # production: WEB_WORKERS processes (one per core by default)
+    python run.py --reload       # development: one worker, restarted on code changes
+    python run.py --monitor      # debugging: one worker with an aiomonitor console
+
+With gunicorn installed, workers are forked from a master that has already
+imported the app and loaded the shareable models (app.main.preload_models);
+otherwise uvicorn starts each worker from scratch. uvloop and httptools are
+used when installed. On SIGTERM/SIGINT a worker stops accepting connections,
+lets in-flight requests finish for up to SHUTDOWN_TIMEOUT seconds and then
+runs the app's shutdown (which drains running ingestion jobs).
+"""
+import argparse
+import asyncio
+import os
+import importlib.util
+
 import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 8000))
+# 0 sizes the pool to the cores this process may run on
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", 0))
+# Seconds in-flight requests get to finish once shutdown starts
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", 30))
+KEEPALIVE_TIMEOUT = int(os.getenv("KEEPALIVE_TIMEOUT", 5))
+AIOMONITOR_PORT = int(os.getenv("AIOMONITOR_PORT", 20101))
+APP = "app.main:app"
+
+
+def available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+def load_app(path: str):
+    module_name, _, attribute = path.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, attribute)
+
+
+def serve_gunicorn(args, workers: int):
+    """Forked workers sharing the modules and models the master preloaded."""
+    from gunicorn.app.base import BaseApplication
+    from uvicorn.workers import UvicornWorker
+    from app.services.ingestion_jobs import INGESTION_DRAIN_TIMEOUT
+
+    class Worker(UvicornWorker):
+        CONFIG_KWARGS = {"loop": args.loop, "http": args.http, "timeout_graceful_shutdown": SHUTDOWN_TIMEOUT}
+
+    class Launcher(BaseApplication):
+        def load_config(self):
+            for key, value in {
+                "bind": f"{args.host}:{args.port}",
+                "workers": workers,
+                "worker_class": Worker,
+                "preload_app": True,
+                "keepalive": KEEPALIVE_TIMEOUT,
+                # Request drain plus the lifespan shutdown, before the master kills a worker
+                "graceful_timeout": int(SHUTDOWN_TIMEOUT + INGESTION_DRAIN_TIMEOUT + 10),
+                "timeout": 120,
+            }.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            app = load_app(args.app)
+            from app.main import preload_models
+            preload_models()
+            return app
+
+    Launcher().run()
+
+
+def serve_with_monitor(args):
+    """One worker with an aiomonitor telnet console on AIOMONITOR_PORT, for debugging only."""
+    import aiomonitor
+
+    config = uvicorn.Config(args.app, host=args.host, port=args.port, loop="asyncio", http=args.http,
+                            timeout_graceful_shutdown=SHUTDOWN_TIMEOUT)
+    server = uvicorn.Server(config)
+
+    async def main():
+        with aiomonitor.start_monitor(loop=asyncio.get_running_loop(), port=AIOMONITOR_PORT):
+            await server.serve()
+
+    asyncio.run(main())
+
+
+def main(args):
+    if args.monitor:
+        return serve_with_monitor(args)
+    if args.reload:
+        return uvicorn.run(args.app, host=args.host, port=args.port, reload=True)
+
+    workers = args.workers or available_cores()
+    print(f"Starting {workers} workers on {args.host}:{args.port} "
+          f"(loop={'uvloop' if args.loop == 'auto' and has_module('uvloop') else args.loop}, "
+          f"http={'httptools' if args.http == 'auto' and has_module('httptools') else args.http})")
+    if workers > 1 and has_module("gunicorn") and os.name != "nt":
+        return serve_gunicorn(args, workers)
+    # Without gunicorn each worker imports the app and loads its models itself
+    uvicorn.run(args.app, host=args.host, port=args.port, workers=workers, loop=args.loop, http=args.http,
+                timeout_keep_alive=KEEPALIVE_TIMEOUT, timeout_graceful_shutdown=SHUTDOWN_TIMEOUT)
+
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS, help="worker processes (0: one per core)")
+    parser.add_argument("--loop", default="auto", choices=("auto", "asyncio", "uvloop"))
+    parser.add_argument("--http", default="auto", choices=("auto", "h11", "httptools"))
+    parser.add_argument("--app", default=APP, help="ASGI app as module:attribute")
+    parser.add_argument("--reload", action="store_true", help="single worker that reloads on code changes")
+    parser.add_argument("--monitor", action="store_true", help="single worker with an aiomonitor console")
+    main(parser.parse_args())